@@ -0,0 +1,2 @@
+# BENCHMARKS
+# Run from 'src/scripts' as modules, eg: python -m benchmarks.label_writer
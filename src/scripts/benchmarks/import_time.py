@@ -0,0 +1,75 @@
+# IMPORT TIME BENCHMARK
+# Usage (from src/scripts): python -m benchmarks.import_time [--repeat 5] [--max-ms 250]
+#
+# Every statement runs in a fresh interpreter (nothing cached in sys.modules). Fails (exit 1)
+# when a statement pulls in a heavy dependency it should not load or exceeds the time budget.
+
+# Standard library imports
+import argparse
+import json
+import subprocess
+import sys
+
+
+# statement -> modules it must NOT load
+CHECKS = {
+    'import utils': ('numpy', 'pandas', 'cv2', 'matplotlib', 'asyncio'),
+    'from utils import security': ('numpy', 'pandas', 'cv2', 'matplotlib', 'asyncio'),
+    'from utils import performance': ('numpy', 'pandas', 'cv2', 'matplotlib', 'asyncio'),
+    'from utils import format': ('cv2', 'matplotlib', 'asyncio'),
+    'from utils import file_management': ('cv2', 'matplotlib', 'asyncio'),
+    'from utils import visualization': ('cv2', 'matplotlib', 'asyncio'),
+    'from utils import tiling': ('matplotlib', 'asyncio'),
+}
+
+_CHILD = """
+import sys, time
+start = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - start
+import json
+print(json.dumps({{'seconds': seconds, 'loaded': [m for m in {forbidden!r} if m in sys.modules]}}))
+"""
+
+
+def measure(statement: str, forbidden: tuple[str, ...], repeat: int = 5) -> dict:
+    """
+    Best import time (seconds) of a statement over several fresh interpreters and the forbidden modules it loaded.
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', _CHILD.format(statement=statement, forbidden=forbidden)],
+                                capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    return {'seconds': min(run['seconds'] for run in runs), 'loaded': runs[0]['loaded']}
+
+
+def run(repeat: int = 5) -> dict:
+    return {statement: measure(statement, forbidden, repeat) for statement, forbidden in CHECKS.items()}
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Guards the import cost of the utils package.")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-ms', type=float, default=None, help="Budget for 'import utils' and the light modules")
+    args = parser.parse_args(argv)
+
+    failures = []
+    print(f"{'statement':<36} {'time (ms)':>10}  heavy modules loaded")
+    for statement, result in run(args.repeat).items():
+        milliseconds = result['seconds'] * 1e3
+        print(f"{statement:<36} {milliseconds:>10.1f}  {', '.join(result['loaded']) or '-'}")
+        if result['loaded']:
+            failures.append(f"{statement}: loads {', '.join(result['loaded'])}")
+        # The budget only applies to the statements that must not load numpy
+        if args.max_ms is not None and 'numpy' in CHECKS[statement] and milliseconds > args.max_ms:
+            failures.append(f"{statement}: {milliseconds:.1f} ms > {args.max_ms} ms")
+
+    if failures:
+        print(f"🚨 {len(failures)} fallos:", *failures, sep='\n  ')
+        sys.exit(1)
+    print("✅ Importaciones ligeras")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# LABEL WRITER BENCHMARK
+# Usage (from src/scripts): python -m benchmarks.label_writer [--sizes 1000 10000 100000]
+
+# Standard library imports
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+# Local modules
+from utils import file_management
+
+
+def legacy_save_labels(dest_labels_file: str, export: pd.DataFrame):
+    """Previous export path: iterrows + one line per write, kept as the reference."""
+    lines = []
+    for _, row in export.iterrows():
+        row_list = list(row)
+        row_list[0] = int(row_list[0])
+        lines.append(' '.join(map(str, row_list)))
+    with open(dest_labels_file, 'w') as file:
+        file.writelines(line + "\n" for line in lines)
+
+
+def synthetic_labels(n_boxes: int, seed: int = 0) -> pd.DataFrame:
+    """Random YOLO labels (relative coordinates) with a single rice class."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'class_id': np.zeros(n_boxes, dtype=int),
+        'x_center': rng.random(n_boxes),
+        'y_center': rng.random(n_boxes),
+        'width': rng.uniform(0.002, 0.02, n_boxes),
+        'height': rng.uniform(0.002, 0.02, n_boxes),
+    })
+
+
+def best_of(func, repeat: int) -> float:
+    """Best wall time (seconds) over several runs."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run(sizes: list[int], repeat: int = 3) -> list[dict]:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_file = os.path.join(tmp, 'legacy.txt')
+        new_file = os.path.join(tmp, 'new.txt')
+
+        for n_boxes in sizes:
+            labels = synthetic_labels(n_boxes)
+            legacy = best_of(lambda: legacy_save_labels(legacy_file, labels), repeat)
+            new = best_of(lambda: file_management.save_labels(new_file, labels, verbose=False), repeat)
+            fixed = best_of(lambda: file_management.save_labels(new_file, labels, verbose=False, precision=6), repeat)
+
+            # Same bytes as the former writer when no precision is set
+            file_management.save_labels(new_file, labels, verbose=False)
+            with open(legacy_file, 'rb') as a, open(new_file, 'rb') as b:
+                identical = a.read() == b.read()
+
+            results.append({'boxes': n_boxes, 'legacy_s': legacy, 'columnar_s': new,
+                            'columnar_fixed_s': fixed, 'speedup': legacy / new, 'identical': identical})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the iterrows label writer with the columnar one.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'boxes':>8} {'legacy (s)':>12} {'columnar (s)':>13} {'precision=6 (s)':>16} {'speedup':>8} {'identical':>10}")
+    for r in run(args.sizes, args.repeat):
+        print(f"{r['boxes']:>8} {r['legacy_s']:>12.4f} {r['columnar_s']:>13.4f} "
+              f"{r['columnar_fixed_s']:>16.4f} {r['speedup']:>7.1f}x {str(r['identical']):>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# MOSAIC BENCHMARK
+# Usage (from src/scripts): python -m benchmarks.mosaic [--size 20000] [--budgets 256 1024]
+#
+# Writes a synthetic size x size RGB orthomosaic ('.npy', band by band) and tiles it in a fresh
+# process for every memory budget, reporting the time and the peak RSS of that process.
+
+# Standard library imports
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+# Local modules
+from benchmarks.label_writer import synthetic_labels
+from utils import file_management
+
+
+def synthetic_mosaic(path: str, size: int, band: int = 1024, seed: int = 0):
+    """
+    Field-like mosaic written without ever holding it in memory.
+    """
+    rng = np.random.default_rng(seed)
+    mosaic = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=(size, size, 3))
+    for y0 in range(0, size, band):
+        y1 = min(y0 + band, size)
+        mosaic[y0:y1] = (40, 80, 100)
+        mosaic[y0:y1] += rng.integers(0, 24, (y1 - y0, 1, 3), dtype=np.uint8)
+        mosaic.flush()
+    del mosaic
+
+
+def run(size: int, budgets: list[float], tile_size: int = 640, overlap: int = 64, n_grains: int = 200_000) -> list[dict]:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        mosaic_path = os.path.join(tmp, 'mosaic.npy')
+        labels_path = os.path.join(tmp, 'mosaic.txt')
+        synthetic_mosaic(mosaic_path, size)
+        file_management.save_labels(labels_path, synthetic_labels(n_grains), verbose=False)
+
+        for budget in budgets:
+            report_path = os.path.join(tmp, 'report.json')
+            subprocess.run([sys.executable, '-m', 'utils.mosaic', mosaic_path, '--labels', labels_path, '--dry-run',
+                            '--tile-size', str(tile_size), '--overlap', str(overlap), '--budget-mb', str(budget),
+                            '--report', report_path], check=True, stdout=subprocess.DEVNULL)
+            with open(report_path) as file:
+                results.append(json.load(file))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory of the windowed mosaic tiler.")
+    parser.add_argument('--size', type=int, default=20_000, help="Mosaic side in pixels")
+    parser.add_argument('--budgets', type=float, nargs='+', default=[64, 256, 1024], help="Budgets in MB")
+    parser.add_argument('--tile-size', type=int, default=640)
+    parser.add_argument('--overlap', type=int, default=64)
+    args = parser.parse_args()
+
+    print(f"Mosaico {args.size}x{args.size} RGB ({args.size ** 2 * 3 / 2 ** 20:.0f} MB)")
+    print(f"{'budget (MB)':>12} {'tiles':>8} {'time (s)':>9} {'peak RSS (MB)':>14}")
+    for r in run(args.size, args.budgets, args.tile_size, args.overlap):
+        print(f"{r['budget_mb']:>12.0f} {r['tiles']:>8} {r['seconds']:>9.2f} {r['peak_rss_mb']:>14.0f}")
+
+
+if __name__ == '__main__':
+    main()
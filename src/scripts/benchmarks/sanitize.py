@@ -0,0 +1,77 @@
+# SANITIZATION BENCHMARK
+# Usage (from src/scripts): python -m benchmarks.sanitize [--calls 100000]
+#
+# Per-call overhead of sanitize_filename and of the validate_filenames decorator, against the
+# previous implementation (kept below as the reference) on the strings build_filename gets.
+
+# Standard library imports
+import argparse
+import re
+import unicodedata
+import warnings
+
+# Local modules
+from benchmarks.label_writer import best_of
+from utils import file_management, security
+
+
+def legacy_sanitize_filename(input_str):
+    """Previous sanitize_filename: normalize + re.fullmatch on every call, kept as the reference."""
+    nfkd_form = unicodedata.normalize('NFKD', input_str)
+    input_str = "".join(c for c in nfkd_form if not unicodedata.combining(c))
+    allowed_chars = r"^[a-zA-Z0-9_\-\./]+$"
+    if input_str and not re.fullmatch(allowed_chars, input_str):
+        input_str = re.sub(allowed_chars, "", input_str)
+        warnings.warn(f"This argument is unsafe. ('{input_str}')", UserWarning)
+    return input_str
+
+
+def legacy_validate_filenames(func):
+    """Previous decorator: rebuilds the argument list and dict on every call."""
+    def wrapper(*args, **kwargs):
+        args = [legacy_sanitize_filename(arg) if isinstance(arg, str) else arg for arg in args]
+        kwargs = {key: legacy_sanitize_filename(value) if isinstance(value, str) else value for key, value in kwargs.items()}
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def _target(dset, type, dir='in', prefix='', name=None, verbose=False):
+    return dset
+
+
+STRINGS = ['data/raw/3.5m.v3i.yolov8/', 'train', 'label', 'out', 'tile00x03', '209_205_50_JPG.rf.a6fd0b5ca2bf']
+
+
+def run(calls: int = 100_000, repeat: int = 3) -> dict:
+    """
+    Nanoseconds per call of every case.
+    """
+    legacy_call = legacy_validate_filenames(_target)
+    new_call = security.validate_filenames('dset', 'type', 'dir', 'prefix', 'name')(_target)
+    strings = (STRINGS * (calls // len(STRINGS) + 1))[:calls]
+    file_management.PATH = STRINGS[0]
+
+    cases = {
+        'sanitize (legacy)': lambda: [legacy_sanitize_filename(value) for value in strings],
+        'sanitize (memoized)': lambda: [security.sanitize_filename(value) for value in strings],
+        'undecorated call': lambda: [_target('train', 'label', dir='out', prefix='tile00x03', name=STRINGS[-1]) for _ in range(calls)],
+        'decorated call (legacy)': lambda: [legacy_call('train', 'label', dir='out', prefix='tile00x03', name=STRINGS[-1]) for _ in range(calls)],
+        'decorated call (declared paths)': lambda: [new_call('train', 'label', dir='out', prefix='tile00x03', name=STRINGS[-1]) for _ in range(calls)],
+        'build_filename': lambda: [file_management.build_filename('train', 'label', dir='out', prefix='tile00x03', name=STRINGS[-1]) for _ in range(calls)],
+    }
+    return {name: best_of(func, repeat) / calls * 1e9 for name, func in cases.items()}
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Per-call cost of the filename sanitization layer.")
+    parser.add_argument('--calls', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"{'case':<34} {'ns/call':>9}")
+    for name, nanoseconds in run(args.calls, args.repeat).items():
+        print(f"{name:<34} {nanoseconds:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
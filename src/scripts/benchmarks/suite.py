@@ -0,0 +1,194 @@
+# HOT PATH BENCHMARK SUITE
+# Usage (from src/scripts):
+#     python -m benchmarks.suite --preset quick --save benchmarks/baseline.json
+#     python -m benchmarks.suite --preset quick --compare benchmarks/baseline.json --max-regression 15
+
+# Standard library imports
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+# Local modules
+from benchmarks.label_writer import best_of, synthetic_labels
+from utils import file_management, format, visualization
+
+
+PRESETS = {
+    'quick': {'boxes': [1_000, 10_000, 100_000], 'megapixels': [1, 10]},
+    'full': {'boxes': [1_000, 10_000, 100_000, 1_000_000], 'megapixels': [1, 10, 100]},
+}
+RENDER_BOXES = 10_000  # Grains drawn on every synthetic image
+IMAGE_RATIO = (4, 3)  # Width : height of the synthetic photos
+
+
+def synthetic_image(megapixels: float, n_grains: int = RENDER_BOXES, seed: int = 0) -> tuple[np.ndarray, pd.DataFrame]:
+    """
+    Field-like photo (noisy soil background with small grain discs) and the YOLO labels of its grains.
+    """
+    rng = np.random.default_rng(seed)
+    width = int(round((megapixels * 1e6 * IMAGE_RATIO[0] / IMAGE_RATIO[1]) ** 0.5))
+    height = int(round(megapixels * 1e6 / width))
+
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:] = (40, 80, 100)
+    image += rng.integers(0, 24, (height, 1, 3), dtype=np.uint8)  # Cheap row noise, no full-size random array
+
+    labels = synthetic_labels(n_grains, seed)
+    centers = labels[['x_center', 'y_center']].to_numpy() * (width, height)
+    visualization.render_points(image, centers, radius=3, copy=False)
+    return image, labels
+
+
+def measure(func, repeat: int) -> tuple[float, float]:
+    """
+    Best wall time (seconds) and peak traced memory (MB) of a callable.
+
+    The memory is measured in an extra untimed run, since tracemalloc slows the code down.
+    """
+    seconds = best_of(func, repeat)
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peak / 2 ** 20
+
+
+def label_cases(n_boxes: int, tmp: str) -> dict:
+    """
+    Label hot paths of format/file_management on n_boxes synthetic labels.
+    """
+    im_height, im_width = 3000, 4000
+    labels = synthetic_labels(n_boxes)
+    absolute = format.label_transform(labels, 'absolute', im_height, im_width)
+    boxes = format.lbl_to_bb(absolute)
+    label_file = os.path.join(tmp, 'labels.txt')
+
+    return {
+        'label_to_str': lambda: format.label_to_str(labels),
+        'save_labels': lambda: file_management.save_labels(label_file, labels, verbose=False),
+        'label_transform': lambda: format.label_transform(labels, 'absolute', im_height, im_width),
+        'lbl_to_bb': lambda: format.lbl_to_bb(absolute),
+        'bb_to_lbl': lambda: format.bb_to_lbl(boxes),
+        'to_origin': lambda: format.to_origin(boxes, [100, 100]),
+    }
+
+
+def filename_cases(n_calls: int) -> dict:
+    """
+    n_calls tile paths with distinct prefixes (the per-tile cost of the pipeline).
+    """
+    name = '209_205_50_JPG.rf.a6fdbfed5ddcebe949b5a721c39c6a1f'
+    prefixes = [f"tile{i % 100:02d}x{i // 100 % 100:02d}" for i in range(n_calls)]
+
+    def build_filename():
+        for prefix in prefixes:
+            file_management.build_filename(dset='train', type='label', dir='out', prefix=prefix, name=name)
+
+    def tile_paths():
+        paths = file_management.TilePaths('train', name, dir='out')
+        for prefix in prefixes:
+            paths.path('label', prefix)
+
+    return {'build_filename': build_filename, 'tile_paths': tile_paths,
+            'tile_paths_batch': lambda: file_management.TilePaths('train', name, dir='out').batch('label', prefixes)}
+
+
+def render_cases(image: np.ndarray, labels: pd.DataFrame) -> dict:
+    return {
+        'render_boxes': lambda: visualization.render_labels(image, labels, style='boxes'),
+        'render_points': lambda: visualization.render_labels(image, labels, style='points'),
+    }
+
+
+def run(preset: str = 'quick', repeat: int = 3, only: list[str] | None = None, verbose: bool = True) -> dict:
+    """
+    Runs every case of a preset.
+
+    Returns:
+        Results keyed by 'function[size]' with seconds, throughput (items/s) and peak memory (MB).
+    """
+    config = PRESETS[preset]
+    file_management.PATH = 'data/raw/benchmark/'
+    results = {}
+
+    def add(name: str, size: int, unit: str, func):
+        if only and name not in only:
+            return
+        seconds, peak_mb = measure(func, repeat)
+        key = f"{name}[{size}]"
+        results[key] = {'function': name, 'size': size, 'unit': unit, 'seconds': seconds,
+                        'throughput': size / seconds if seconds else float('inf'), 'peak_mb': peak_mb}
+        if verbose:
+            print(f"{key:>28} {seconds:>10.4f} s {results[key]['throughput']:>14,.0f} {unit}/s {peak_mb:>9.1f} MB")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_boxes in config['boxes']:
+            for name, func in label_cases(n_boxes, tmp).items():
+                add(name, n_boxes, 'boxes', func)
+            n_calls = min(n_boxes, 100_000)
+            for name, func in filename_cases(n_calls).items():
+                add(name, n_calls, 'calls', func)
+
+    for megapixels in config['megapixels']:
+        image, labels = synthetic_image(megapixels)
+        for name, func in render_cases(image, labels).items():
+            add(name, megapixels, 'MP', func)
+
+    return results
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> list[str]:
+    """
+    Cases whose time grew more than max_regression percent over the baseline.
+    """
+    failures = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if reference is None or not reference['seconds']:
+            continue
+        change = (result['seconds'] / reference['seconds'] - 1) * 100
+        if change > max_regression:
+            failures.append(f"{key}: {reference['seconds']:.4f} s -> {result['seconds']:.4f} s (+{change:.1f}%)")
+    return failures
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Times the utils hot paths on synthetic rice datasets.")
+    parser.add_argument('--preset', default='quick', choices=PRESETS)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='+', default=None, help="Functions to run (default all)")
+    parser.add_argument('--save', default=None, metavar='FILE', help="Writes the results as a JSON baseline")
+    parser.add_argument('--compare', default=None, metavar='FILE', help="Baseline to check the results against")
+    parser.add_argument('--max-regression', type=float, default=10.0, help="Allowed slowdown in percent")
+    args = parser.parse_args(argv)
+
+    results = run(args.preset, args.repeat, args.only)
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump({'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                       'machine': platform.machine(), 'preset': args.preset, 'results': results}, file, indent=2)
+        print(f"✅ Baseline guardada en {args.save}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+        failures = compare(results, baseline, args.max_regression)
+        if failures:
+            print(f"🚨 {len(failures)} regresiones (> {args.max_regression}%):", *failures, sep='\n  ')
+            sys.exit(1)
+        print(f"✅ Sin regresiones (> {args.max_regression}%) frente a {args.compare}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# VALIDATE BENCHMARK
+# Usage (from src/scripts): python -m benchmarks.validate [--files 100000] [--workers 8]
+#
+# Writes a synthetic split (small JPEGs and label files, a few of them broken) and times
+# utils.validate over it; the target is a 100k-file split in under a minute.
+
+# Standard library imports
+import argparse
+import os
+import tempfile
+import time
+
+import cv2 as cv
+import numpy as np
+
+# Local modules
+from benchmarks.label_writer import synthetic_labels
+from utils import format, validate
+
+
+def synthetic_split(root: str, n_files: int, boxes_per_file: int = 50, broken_every: int = 100):
+    """
+    'root/train/images|labels' with n_files pairs; every broken_every-th label file has a bad box.
+    """
+    image_folder, label_folder = os.path.join(root, 'train', 'images'), os.path.join(root, 'train', 'labels')
+    os.makedirs(image_folder)
+    os.makedirs(label_folder)
+    _, encoded = cv.imencode('.jpg', np.full((640, 640, 3), 128, dtype=np.uint8))
+    jpeg = encoded.tobytes()
+    text = format.labels_to_text(synthetic_labels(boxes_per_file))
+    for i in range(n_files):
+        name = f"img{i:06d}_JPG.rf.{i:032x}"
+        with open(os.path.join(image_folder, f"{name}.jpg"), 'wb') as file:
+            file.write(jpeg)
+        with open(os.path.join(label_folder, f"{name}.txt"), 'w') as file:
+            file.write(text + ('0 1.5 0.5 0.1 0.1\n' if i % broken_every == 0 else ''))
+
+
+def run(n_files: int, workers: int | None = None) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, 'raw') + '/'
+        synthetic_split(root, n_files)
+        start = time.perf_counter()
+        report = validate.validate_split(root, 'train', workers=workers)
+        seconds = time.perf_counter() - start
+    return {'files': n_files, 'boxes': report['boxes'], 'issues': report['counts'], 'seconds': seconds}
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Throughput of the dataset validator.")
+    parser.add_argument('--files', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    result = run(args.files, args.workers)
+    print(f"{result['files']} archivos ({result['boxes']} granos) en {result['seconds']:.1f} s "
+          f"({result['files'] / result['seconds']:.0f} archivos/s)")
+    print({check: count for check, count in result['issues'].items() if count})
+
+
+if __name__ == '__main__':
+    main()
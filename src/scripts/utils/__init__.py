@@ -1,5 +1,22 @@
-# __init__.py (Recommended: Import specific functions)
-from .utils import security, file_management, format, visualization, performance  # . is important
+# __init__.py
+# Submodules are loaded on first use (PEP 562), so 'import utils' is cheap and a worker or CLI
+# only pays for the modules (and the numpy/pandas/OpenCV/asyncio imports) it actually touches:
+#     import utils
+#     utils.format.lbl_to_bb(...)       # imports utils.format here
+#     from utils import security        # imports only utils.security
 
-# __init__.py (Alternative: Import submodules - useful for larger packages)
-# from . import utils  # Then users would use my_library.utils.my_utility_function
\ No newline at end of file
+import importlib
+
+__all__ = ['adaptive', 'augment', 'dedup', 'evaluate', 'file_management', 'format', 'images', 'label_store',
+           'manifest', 'merge', 'mosaic', 'performance', 'pipeline', 'security', 'service', 'shards', 'stats',
+           'tiling', 'validate', 'visualization']
+
+
+def __getattr__(name: str):
+    if name in __all__:
+        return importlib.import_module(f'.{name}', __name__)  # Also sets it as an attribute of the package
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,400 @@
+# ADAPTIVE TILING MODULE
+# Picks the tile layout of every image from its grain density instead of one global grid:
+# sparse photos get few tiles, packed ones are split until no tile holds more grains than
+# the model can detect, and empty regions are skipped.
+#
+# Usage (from src/scripts):
+#     python -m utils.adaptive data/raw/3.5m.v3i.yolov8/ --strategy quadtree --max-per-tile 300 --rows 4 --columns 4 --report adaptive.json
+#
+# The chosen layout of every image is appended to '{processed split}/layouts.jsonl', so the
+# tile filenames (prefix) can be mapped back to their coordinates in the photo (eg: merge.merge_tiles).
+
+# Standard library imports
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import cv2 as cv
+import numpy as np
+
+# Local modules
+from utils import augment, file_management, format, images, manifest, performance, pipeline, tiling
+
+
+STRATEGIES = ('grid', 'quadtree')
+LAYOUTS_NAME = 'layouts.jsonl'
+
+
+def label_centers(labels, im_height: int, im_width: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (boxes, class_ids, centers) in pixels of the labels of an image.
+    """
+    values = format.label_array(labels)
+    boxes = format.yolo_to_xyxy(values[:, 1:5], im_height, im_width)
+    return boxes, values[:, 0], (boxes[:, 0:2] + boxes[:, 2:4]) / 2
+
+
+def image_centers(image_path: str, reduce: int = 8) -> np.ndarray:
+    """
+    Rough grain centers (pixels of the full image) from a reduced decode, when there are no labels.
+
+    Bright blobs of the Otsu mask are taken as grains, like service.stub_model.
+    """
+    image = images.read_image(image_path, reduce=reduce, color=False, cache=False)
+    _, mask = cv.threshold(image, 0, 255, cv.THRESH_BINARY | cv.THRESH_OTSU)
+    _, _, _, centroids = cv.connectedComponentsWithStats(mask)
+    return centroids[1:] * reduce
+
+
+def tile_counts(centers: np.ndarray, im_height: int, im_width: int, rows: int, columns: int) -> np.ndarray:
+    """
+    Grains per tile of a rows x columns grid (each grain counted once, in the tile of its center).
+    """
+    x_starts, _ = tiling.axis_bounds(im_width, columns)
+    y_starts, _ = tiling.axis_bounds(im_height, rows)
+    column = np.searchsorted(x_starts, centers[:, 0], side='right') - 1
+    row = np.searchsorted(y_starts, centers[:, 1], side='right') - 1
+    return np.bincount(column + row * columns, minlength=rows * columns)
+
+
+def choose_grid(centers: np.ndarray, im_height: int, im_width: int, max_per_tile: int, max_size: int | None = None,
+                max_tiles: int = 64) -> tuple[int, int]:
+    """
+    Smallest rows x columns grid whose busiest tile has at most max_per_tile grains.
+
+    Grids with the same number of tiles are tried from the most square tiles to the least.
+
+    Args:
+        max_size: Maximum tile side in pixels (eg: a few times the model input size).
+        max_tiles: Largest grid tried (returned when nothing smaller fits).
+    """
+    best = (1, 1)
+    for n_tiles in range(1, max_tiles + 1):
+        grids = [(rows, n_tiles // rows) for rows in range(1, n_tiles + 1) if n_tiles % rows == 0]
+        grids.sort(key=lambda grid: abs(np.log((im_width / grid[1]) / (im_height / grid[0]))))
+        for rows, columns in grids:
+            if max_size and (-(-im_height // rows) > max_size or -(-im_width // columns) > max_size):
+                continue
+            try:
+                counts = tile_counts(centers, im_height, im_width, rows, columns)
+            except ValueError:
+                continue  # Too many tiles for the image (axis_bounds)
+            best = (rows, columns)
+            if counts.max(initial=0) <= max_per_tile:
+                return best
+    return best
+
+
+def quadtree(centers: np.ndarray, im_height: int, im_width: int, max_per_tile: int, min_size: int = 320,
+             max_size: int | None = None) -> list[tuple[str, tuple[int, int, int, int], int]]:
+    """
+    Splits the image in quadrants until every region has at most max_per_tile grains.
+
+    A region is not split below min_size pixels per side; regions larger than max_size are
+    always split.
+
+    Returns:
+        Leaves in depth-first order as (key, (x0, y0, x1, y1), grains): the key holds the
+        quadrant of every level ('' is the whole image, '03' the bottom right of the top left).
+    """
+    leaves = []
+    stack = [('', (0, 0, im_width, im_height), np.arange(len(centers)))]
+    while stack:
+        key, (x0, y0, x1, y1), inside = stack.pop()
+        too_big = max_size is not None and max(x1 - x0, y1 - y0) > max_size
+        splittable = min(x1 - x0, y1 - y0) >= 2 * min_size
+        if (len(inside) > max_per_tile or too_big) and splittable:
+            mx, my = (x0 + x1) // 2, (y0 + y1) // 2
+            right = centers[inside, 0] >= mx
+            bottom = centers[inside, 1] >= my
+            quadrants = [(x0, y0, mx, my), (mx, y0, x1, my), (x0, my, mx, y1), (mx, my, x1, y1)]
+            masks = [~right & ~bottom, right & ~bottom, ~right & bottom, right & bottom]
+            # Pushed in reverse so they are popped (and numbered) in 0..3 order
+            for quadrant in range(3, -1, -1):
+                stack.append((key + str(quadrant), quadrants[quadrant], inside[masks[quadrant]]))
+        else:
+            leaves.append((key, (x0, y0, x1, y1), len(inside)))
+    return leaves
+
+
+def _expand(coord: tuple, overlap: int, im_height: int, im_width: int) -> tuple[int, int, int, int]:
+    x0, y0, x1, y1 = coord
+    return max(x0 - overlap, 0), max(y0 - overlap, 0), min(x1 + overlap, im_width), min(y1 + overlap, im_height)
+
+
+def plan(centers: np.ndarray, im_height: int, im_width: int, strategy: str = 'quadtree', max_per_tile: int = 300,
+         overlap: int = 0, min_size: int = 320, max_size: int | None = None, skip_empty: bool = True) -> dict:
+    """
+    Tile layout of one image.
+
+    Args:
+        centers: (N, 2) grain centers in pixels (label_centers or image_centers).
+        strategy: 'grid' (choose_grid) or 'quadtree'.
+        max_per_tile: Grains a tile may hold (eg: the max_det of the model).
+        overlap: Pixels added around each quadtree region / shared by grid tiles.
+        min_size, max_size: Tile side limits in pixels.
+        skip_empty: Leaves out the tiles without any grain center.
+
+    Returns:
+        Layout: {'strategy', 'size': [height, width], 'grid': [rows, columns] | None,
+        'tiles': [{'prefix', 'coord', 'grains'}, ...]} in get_index order (grid) or
+        depth-first order (quadtree).
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"❕Invalid 'strategy': must be one of {STRATEGIES}.")
+
+    tiles, grid = [], None
+    if strategy == 'grid':
+        rows, columns = choose_grid(centers, im_height, im_width, max_per_tile, max_size)
+        counts = tile_counts(centers, im_height, im_width, rows, columns)
+        grid = [rows, columns]
+        for index, coord in enumerate(tiling.tile_grid(im_height, im_width, rows, columns, overlap).tolist()):
+            tiles.append({'prefix': tiling.tile_prefix(*divmod(index, columns)), 'coord': coord, 'grains': int(counts[index])})
+    else:
+        for key, coord, grains in quadtree(centers, im_height, im_width, max_per_tile, min_size, max_size):
+            tiles.append({'prefix': f"quad{key}", 'coord': list(_expand(coord, overlap, im_height, im_width)), 'grains': grains})
+
+    if skip_empty:
+        tiles = [tile for tile in tiles if tile['grains']]
+    return {'strategy': strategy, 'size': [im_height, im_width], 'grid': grid, 'tiles': tiles}
+
+
+def fixed_grid_stats(centers: np.ndarray, im_height: int, im_width: int, rows: int, columns: int, max_per_tile: int) -> dict:
+    """
+    Tiles, empty tiles and grains beyond max_per_tile of the usual fixed grid (the baseline).
+    """
+    counts = tile_counts(centers, im_height, im_width, rows, columns)
+    return {'tiles': len(counts), 'empty': int((counts == 0).sum()),
+            'over_limit': int(np.clip(counts - max_per_tile, 0, None).sum()), 'max_grains': int(counts.max(initial=0))}
+
+
+def layout_stats(layout: dict, max_per_tile: int) -> dict:
+    counts = np.array([tile['grains'] for tile in layout['tiles']], dtype=np.int64)
+    return {'tiles': len(counts), 'empty': int((counts == 0).sum()),
+            'over_limit': int(np.clip(counts - max_per_tile, 0, None).sum()), 'max_grains': int(counts.max(initial=0))}
+
+
+def adaptive_file(dset: str, name: str, params: dict, write: bool = True) -> tuple[dict, list[str]]:
+    """
+    Plans (and optionally writes) the adaptive tiles of one raw image.
+
+    Returns:
+        (layout, paths): the layout with the name and the baseline stats, and the files written.
+    """
+    image_path = file_management.build_filename(dset=dset, type='image', dir='in', name=name)
+    label_path = file_management.build_filename(dset=dset, type='label', dir='in', name=name)
+    im_height, im_width = images.image_size(image_path)
+
+    with performance.stage('label'):
+        labels = tiling.read_labels(label_path) if os.path.exists(label_path) else np.empty(0, dtype=format.LABEL_DTYPE)
+        boxes, class_ids, centers = label_centers(labels, im_height, im_width)
+    if params['estimate'] == 'image':
+        with performance.stage('estimate'):
+            centers = image_centers(image_path)
+    with performance.stage('plan'):
+        layout = plan(centers, im_height, im_width, params['strategy'], params['max_per_tile'], params['overlap'],
+                      params['min_size'], params['max_size'], params['skip_empty'])
+    layout = {'name': name, **layout}
+
+    rows, columns = params['baseline']
+    true_centers = (boxes[:, 0:2] + boxes[:, 2:4]) / 2
+    layout['baseline'] = fixed_grid_stats(true_centers, im_height, im_width, rows, columns, params['max_per_tile'])
+    # Labelled grains whose center is in no tile of the layout (lost to skipped regions)
+    covered = np.zeros(len(true_centers), dtype=bool)
+    for tile in layout['tiles']:
+        x0, y0, x1, y1 = tile['coord']
+        covered |= (true_centers[:, 0] >= x0) & (true_centers[:, 0] < x1) & (true_centers[:, 1] >= y0) & (true_centers[:, 1] < y1)
+    layout['missed'] = int((~covered).sum())
+
+    written = []
+    if write and layout['tiles']:
+        with performance.stage('decode'):
+            image = images.read_image(image_path, cache=False)  # Every photo is decoded once
+        paths = file_management.TilePaths(dset, name, 'out')
+        for tile in layout['tiles']:
+            tile_labels = augment.window_labels(boxes, class_ids, tile['coord'], min_visibility=params['min_visibility'])
+            image_out, label_out = paths.path('image', tile['prefix']), paths.path('label', tile['prefix'])
+            if not written:
+                os.makedirs(os.path.dirname(image_out), exist_ok=True)
+                os.makedirs(os.path.dirname(label_out), exist_ok=True)
+            with performance.stage('write'):
+                if not cv.imwrite(image_out, images.crop(image, tile['coord'])):
+                    raise OSError(f"🚫 No se pudo guardar el mosaico:\n {image_out}")
+                file_management.save_labels(label_out, tile_labels, verbose=False, precision=params['precision'])
+            written += [image_out, label_out]
+    return layout, written
+
+
+def _init_worker(path: str):
+    file_management.PATH = path
+
+
+def remove_tiles(dset: str, names: set[str]) -> int:
+    """
+    Deletes the processed tiles of these images, whatever their layout ('tileRRxCC', 'quad...').
+
+    Each tile is named '{name before .rf.}.{prefix}{.rf. part}' (see TilePaths), so the image of a
+    file is its name without the last dotted part before '.rf.'.
+
+    Returns:
+        Number of files deleted.
+    """
+    removed = 0
+    for type in ('image', 'label'):
+        folder = file_management.build_filename(dset=dset, type=type, dir='out')
+        if not os.path.isdir(folder):
+            continue
+        with os.scandir(folder) as entries:
+            files = [entry.name for entry in entries]
+        for filename in files:
+            stem = os.path.splitext(filename)[0]
+            pointer = stem.find('.rf.')
+            head, tail = (stem, '') if pointer == -1 else (stem[:pointer], stem[pointer:])
+            base, dot, _ = head.rpartition('.')
+            if dot and base + tail in names:
+                os.remove(os.path.join(folder, filename))
+                removed += 1
+    return removed
+
+
+def _adaptive_chunk(dset: str, names: list[str], params: dict, write: bool) -> list[tuple[dict, list[str]]]:
+    return [adaptive_file(dset, name, params, write) for name in names]
+
+
+def layouts_path(dset: str) -> str:
+    """
+    Layout journal of a processed split (next to its images/ and labels/ folders).
+    """
+    return os.path.join(file_management.processed_root(), dset, LAYOUTS_NAME)
+
+
+def load_layouts(dset: str) -> dict[str, dict]:
+    """
+    {name: layout} of a processed split (the last record of a name wins).
+    """
+    layouts = {}
+    path = layouts_path(dset)
+    if os.path.exists(path):
+        with open(path) as file:
+            for line in file:
+                if line.strip():
+                    layout = json.loads(line)
+                    layouts[layout['name']] = layout
+    return layouts
+
+
+def tile_coords(layout: dict) -> tuple[list[str], np.ndarray]:
+    """
+    (prefixes, int64 (T, 4) coordinates) of a layout, ready for merge.merge_tiles.
+    """
+    return [tile['prefix'] for tile in layout['tiles']], np.array([tile['coord'] for tile in layout['tiles']],
+                                                                  dtype=np.int64).reshape(-1, 4)
+
+
+def run(path: str, splits: tuple[str, ...] = pipeline.SPLITS, strategy: str = 'quadtree', max_per_tile: int = 300,
+        overlap: int = 0, min_size: int = 320, max_size: int | None = None, skip_empty: bool = True,
+        estimate: str = 'labels', baseline: tuple[int, int] = (4, 4), min_visibility: float = 0.5,
+        precision: int | None = None, write: bool = True, workers: int | None = None, chunk_size: int = 8) -> dict:
+    """
+    Adaptive tiling of every image of the selected splits and the trade-off against a fixed grid.
+
+    Args:
+        path: Root of the raw dataset (the PATH used by build_filename).
+        strategy, max_per_tile, overlap, min_size, max_size, skip_empty: See plan.
+        estimate: 'labels' plans with the labelled centers, 'image' with a reduced-decode
+            estimate (what is available at inference time).
+        baseline: (rows, columns) of the fixed grid to compare with.
+        write: Writes the tiles and the layouts, replacing the processed tiles of the same
+            photos, which the pipeline manifest forgets (False only reports).
+        workers: Number of processes (default os.cpu_count(); 1 runs in the current process).
+
+    Returns:
+        Report per split: images, tiles of both layouts, empty tiles, grains beyond
+        max_per_tile (crowded tiles the model would undercount) and grains left out.
+    """
+    if estimate not in ('labels', 'image'):
+        raise ValueError("❕Invalid 'estimate': must be 'labels' or 'image'.")
+    params = {'strategy': strategy, 'max_per_tile': max_per_tile, 'overlap': overlap, 'min_size': min_size,
+              'max_size': max_size, 'skip_empty': skip_empty, 'estimate': estimate, 'baseline': tuple(baseline),
+              'min_visibility': min_visibility, 'precision': precision}
+    _init_worker(path)
+    workers = workers or os.cpu_count() or 1
+
+    report = {}
+    for dset in splits:
+        names = pipeline.list_images(dset)
+        chunks = [names[start:start + chunk_size] for start in range(0, len(names), chunk_size)]
+        if write:
+            # The tiles of a previous layout (or of the fixed-grid pipeline) would stay next to the new ones,
+            # and an incremental pipeline run would still take the photos as processed
+            remove_tiles(dset, set(names))
+            if os.path.exists(os.path.join(file_management.processed_root(path), manifest.MANIFEST_NAME)):
+                with manifest.Manifest(file_management.processed_root(path), params={}) as journal:
+                    journal.forget(f"{dset}/{name}" for name in names)
+        if workers == 1:
+            results = [result for chunk in chunks for result in _adaptive_chunk(dset, chunk, params, write)]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(path,)) as pool:
+                futures = [pool.submit(_adaptive_chunk, dset, chunk, params, write) for chunk in chunks]
+                results = [result for future in futures for result in future.result()]
+
+        layouts = [layout for layout, _ in results]
+        if write and layouts:
+            os.makedirs(os.path.dirname(layouts_path(dset)), exist_ok=True)
+            with open(layouts_path(dset), 'a') as file:
+                file.writelines(json.dumps(layout) + '\n' for layout in layouts)
+
+        adaptive = [layout_stats(layout, max_per_tile) for layout in layouts]
+        fixed = [layout['baseline'] for layout in layouts]
+        n_images = max(len(layouts), 1)
+        report[dset] = {
+            'images': len(layouts),
+            'files': sum(len(paths) for _, paths in results),
+            'adaptive': {'tiles_per_image': sum(s['tiles'] for s in adaptive) / n_images,
+                         'over_limit': sum(s['over_limit'] for s in adaptive),
+                         'missed': sum(layout['missed'] for layout in layouts),
+                         'max_grains': max((s['max_grains'] for s in adaptive), default=0)},
+            'fixed': {'grid': list(baseline), 'tiles_per_image': sum(s['tiles'] for s in fixed) / n_images,
+                      'empty_per_image': sum(s['empty'] for s in fixed) / n_images,
+                      'over_limit': sum(s['over_limit'] for s in fixed),
+                      'max_grains': max((s['max_grains'] for s in fixed), default=0)},
+        }
+    return report
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Density-adaptive tiling with a report against a fixed grid.")
+    parser.add_argument('path', help="Root of the raw dataset (eg: data/raw/3.5m.v3i.yolov8/)")
+    parser.add_argument('--splits', nargs='+', default=list(pipeline.SPLITS), choices=pipeline.SPLITS)
+    parser.add_argument('--strategy', default='quadtree', choices=STRATEGIES)
+    parser.add_argument('--max-per-tile', type=int, default=300, help="Grains a tile may hold (model max_det)")
+    parser.add_argument('--overlap', type=int, default=0)
+    parser.add_argument('--min-size', type=int, default=320, help="Smallest quadtree tile side in pixels")
+    parser.add_argument('--max-size', type=int, default=None, help="Largest tile side in pixels")
+    parser.add_argument('--keep-empty', action='store_true', help="Also writes the tiles without grains")
+    parser.add_argument('--estimate', default='labels', choices=['labels', 'image'])
+    parser.add_argument('--rows', type=int, default=4, help="Fixed grid to compare with")
+    parser.add_argument('--columns', type=int, default=4)
+    parser.add_argument('--precision', type=int, default=None)
+    parser.add_argument('--dry-run', action='store_true', help="Only reports, nothing is written")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--report', default=None, metavar='FILE', help="Writes the report as JSON")
+    args = parser.parse_args(argv)
+
+    path = args.path if args.path.endswith('/') else args.path + '/'
+    report = run(path, tuple(args.splits), args.strategy, args.max_per_tile, args.overlap, args.min_size, args.max_size,
+                 not args.keep_empty, args.estimate, (args.rows, args.columns), precision=args.precision,
+                 write=not args.dry_run, workers=args.workers)
+    if args.report:
+        with open(args.report, 'w') as file:
+            json.dump(report, file, indent=2)
+    for dset, split in report.items():
+        adaptive, fixed = split['adaptive'], split['fixed']
+        print(f"> {dset}: {split['images']} imágenes | adaptativo {adaptive['tiles_per_image']:.1f} mosaicos/imagen "
+              f"(sobre el límite: {adaptive['over_limit']}, fuera: {adaptive['missed']}) | "
+              f"fijo {fixed['grid'][0]}x{fixed['grid'][1]} {fixed['tiles_per_image']:.1f} mosaicos/imagen "
+              f"(vacíos: {fixed['empty_per_image']:.1f}, sobre el límite: {fixed['over_limit']})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+# AUGMENTATION MODULE
+# Random crops (offset, scale and flips) of the raw photos with their YOLO labels, generated on
+# the fly for a training loop instead of storing every augmented tile on disk.
+#
+# Example:
+#     for window, tile, labels in augment.random_tiles(image, labels, 640, n=16, seed=0, worker_id=rank):
+#         ...
+#
+# The crops are sampled from numpy generators seeded with (seed, worker_id, epoch), so the same
+# arguments always give the same tiles. Tiles are views of the decoded image unless they are resized.
+
+# Standard library imports
+import os
+from collections.abc import Iterator
+import numpy as np
+import pandas as pd
+import cv2 as cv
+
+# Local modules
+from utils import file_management, format, images, pipeline, tiling
+
+
+def make_rng(seed: int, worker_id: int = 0, epoch: int = 0) -> np.random.Generator:
+    """
+    Independent generator for every (seed, worker_id, epoch) combination.
+    """
+    return np.random.default_rng(np.random.SeedSequence([seed, worker_id, epoch]))
+
+
+def _tile_size(size: int | tuple[int, int]) -> tuple[int, int]:
+    height, width = (size, size) if isinstance(size, int) else size
+    if height < 1 or width < 1:
+        raise ValueError("❕The tile size must be positive.")
+    return int(height), int(width)
+
+
+def sample_windows(rng: np.random.Generator, im_height: int, im_width: int, n: int, size: int | tuple[int, int],
+                   scale: tuple[float, float] = (1.0, 1.0)) -> np.ndarray:
+    """
+    Random crop windows of an image.
+
+    Args:
+        rng: Generator (see make_rng).
+        im_height, im_width: Image size in pixels.
+        n: Number of windows.
+        size: Output tile size, int or (height, width).
+        scale: Range of the zoom factor; a window covers size / zoom pixels of the image
+            (clamped to the image) and is resized to size afterwards.
+
+    Returns:
+        int64 array (n, 4) with (x0, y0, x1, y1).
+    """
+    height, width = _tile_size(size)
+    zoom = rng.uniform(scale[0], scale[1], n) if scale[0] != scale[1] else np.full(n, float(scale[0]))
+    if np.any(zoom <= 0):
+        raise ValueError("❕The scale range must be positive.")
+    win_w = np.clip(np.rint(width / zoom), 1, im_width).astype(np.int64)
+    win_h = np.clip(np.rint(height / zoom), 1, im_height).astype(np.int64)
+    x0 = (rng.random(n) * (im_width - win_w + 1)).astype(np.int64)
+    y0 = (rng.random(n) * (im_height - win_h + 1)).astype(np.int64)
+    return np.stack([x0, y0, x0 + win_w, y0 + win_h], axis=1)
+
+
+def window_labels(boxes: np.ndarray, class_ids: np.ndarray, window: tuple | list, hflip: bool = False,
+                  vflip: bool = False, min_visibility: float = 0.5) -> np.ndarray:
+    """
+    Clips absolute boxes to a crop window and returns them as YOLO labels of the crop.
+
+    Same clipping and visibility rule as tiling.assign_boxes; the labels are relative to the
+    window, so they do not change when the crop is resized.
+
+    Args:
+        boxes: float array (N, 4) with absolute (x0, y0, x1, y1).
+        class_ids: Class of each box.
+        window: (x0, y0, x1, y1) of the crop.
+        hflip, vflip: The crop is mirrored horizontally / vertically.
+        min_visibility: Minimum fraction of the box area inside the window to keep it.
+
+    Returns:
+        float64 (K, 5) array with (class_id, x_center, y_center, width, height).
+    """
+    wx0, wy0, wx1, wy1 = (float(value) for value in window)
+    clipped = np.empty((len(boxes), 4), dtype=np.float64)
+    np.maximum(boxes[:, 0], wx0, out=clipped[:, 0])
+    np.maximum(boxes[:, 1], wy0, out=clipped[:, 1])
+    np.minimum(boxes[:, 2], wx1, out=clipped[:, 2])
+    np.minimum(boxes[:, 3], wy1, out=clipped[:, 3])
+
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    visible = np.clip(clipped[:, 2] - clipped[:, 0], 0, None) * np.clip(clipped[:, 3] - clipped[:, 1], 0, None)
+    keep = (area > 0) & (visible > 0) & (visible >= min_visibility * area)
+
+    output = np.empty((int(keep.sum()), 5), dtype=np.float64)
+    output[:, 0] = np.asarray(class_ids)[keep]
+    format.translate_boxes(clipped[keep], -wx0, -wy0, out=output[:, 1:5])
+    format.xyxy_to_yolo(output[:, 1:5], wy1 - wy0, wx1 - wx0, out=output[:, 1:5])
+    if hflip:
+        np.subtract(1.0, output[:, 1], out=output[:, 1])
+    if vflip:
+        np.subtract(1.0, output[:, 2], out=output[:, 2])
+    return output
+
+
+def random_tiles(image: np.ndarray, labels: pd.DataFrame | np.ndarray, size: int | tuple[int, int], n: int = 16,
+                 seed: int = 0, worker_id: int = 0, epoch: int = 0, scale: tuple[float, float] = (1.0, 1.0),
+                 hflip: float = 0.5, vflip: float = 0.5, min_visibility: float = 0.5,
+                 rng: np.random.Generator | None = None) -> Iterator[tuple[tuple, np.ndarray, np.ndarray]]:
+    """
+    Yields randomly placed, scaled and flipped crops of an image with their labels.
+
+    Every window is sampled up front; the labels of a window only look at the boxes whose
+    x0 can reach it (searchsorted over the boxes sorted by x0), not at every box of the image.
+
+    Args:
+        image: Source image (as returned by images.read_image).
+        labels: Labels of the image (relative YOLO format).
+        size: Output tile size, int or (height, width).
+        n: Number of crops.
+        seed, worker_id, epoch: Seed of the crops (see make_rng), ignored when rng is given.
+        scale: Zoom range (see sample_windows); (1, 1) keeps the crops as views of the image.
+        hflip, vflip: Probability of mirroring a crop horizontally / vertically.
+        min_visibility: Minimum visible fraction to keep a clipped box.
+        rng: Generator to use instead of one built from the seed.
+
+    Yields:
+        (window, tile, tile_labels): (x0, y0, x1, y1) in the image, the (height, width) crop
+        (flips are negative-stride views: use np.ascontiguousarray before handing it to a framework
+        that needs contiguous memory) and its float64 (K, 5) labels.
+    """
+    height, width = _tile_size(size)
+    rng = make_rng(seed, worker_id, epoch) if rng is None else rng
+    im_height, im_width = image.shape[:2]
+    windows = sample_windows(rng, im_height, im_width, n, (height, width), scale)
+    flips = rng.random((n, 2)) < (hflip, vflip)
+
+    values = format.label_array(labels)
+    boxes = format.yolo_to_xyxy(values[:, 1:5], im_height, im_width)
+    order = np.argsort(boxes[:, 0], kind='stable')
+    boxes, class_ids = boxes[order], values[order, 0]
+    x0s = boxes[:, 0]
+    max_width = float(np.max(boxes[:, 2] - boxes[:, 0])) if len(boxes) else 0.0
+
+    for window, (flip_x, flip_y) in zip(windows.tolist(), flips.tolist()):
+        wx0, wy0, wx1, wy1 = window
+        lo, hi = np.searchsorted(x0s, [wx0 - max_width, wx1], side='left')
+        tile_labels = window_labels(boxes[lo:hi], class_ids[lo:hi], window, flip_x, flip_y, min_visibility)
+
+        tile = images.crop(image, window)
+        if tile.shape[:2] != (height, width):
+            tile = cv.resize(tile, (width, height), interpolation=cv.INTER_AREA if wx1 - wx0 > width else cv.INTER_LINEAR)
+        if flip_x:
+            tile = tile[:, ::-1]
+        if flip_y:
+            tile = tile[::-1]
+        yield tuple(window), tile, tile_labels
+
+
+def random_tiles_file(dset: str, name: str, size: int | tuple[int, int], n: int = 16, seed: int = 0,
+                      worker_id: int = 0, epoch: int = 0, **kwargs) -> Iterator[tuple[tuple, np.ndarray, np.ndarray]]:
+    """
+    random_tiles of one image of the raw dataset ('in'); the decode goes through the image cache.
+    """
+    image_path = file_management.build_filename(dset=dset, type='image', dir='in', name=name)
+    label_path = file_management.build_filename(dset=dset, type='label', dir='in', name=name)
+    image = images.read_image(image_path)
+    labels = tiling.read_labels(label_path) if os.path.exists(label_path) else np.empty(0, dtype=format.LABEL_DTYPE)
+    yield from random_tiles(image, labels, size, n, seed, worker_id, epoch, **kwargs)
+
+
+def stream(path: str, dset: str, size: int | tuple[int, int], tiles_per_image: int = 16, seed: int = 0,
+           worker_id: int = 0, num_workers: int = 1, epoch: int = 0, shuffle: bool = True,
+           **kwargs) -> Iterator[tuple[str, tuple, np.ndarray, np.ndarray]]:
+    """
+    Random tiles of a split for one data loader worker (one pass over its images per call).
+
+    The images are shuffled per epoch and split between the workers (image i goes to
+    worker i % num_workers). Each image draws its crops from its own generator, seeded with
+    (seed, epoch, image position in the split), so the tiles of an epoch do not depend on
+    how many workers share it.
+
+    Args:
+        path: Root of the raw dataset (the PATH used by build_filename).
+        dset: Split ('train', 'valid' or 'test').
+        size: Output tile size, int or (height, width).
+        tiles_per_image: Crops of every image.
+        seed: Seed of the run.
+        worker_id, num_workers: This worker and the total number of workers.
+        epoch: Epoch number (changes the order and the crops).
+        shuffle: Shuffles the images every epoch.
+        kwargs: Other arguments of random_tiles (scale, hflip, vflip, min_visibility).
+
+    Yields:
+        (name, window, tile, tile_labels)
+    """
+    file_management.PATH = path
+    names = pipeline.list_images(dset, 'in')
+    positions = make_rng(seed, epoch=epoch).permutation(len(names)) if shuffle else np.arange(len(names))
+    for position in positions[worker_id::num_workers].tolist():
+        rng = np.random.default_rng(np.random.SeedSequence([seed, epoch, position, 1]))
+        name = names[position]
+        for window, tile, tile_labels in random_tiles_file(dset, name, size, tiles_per_image, rng=rng, **kwargs):
+            yield name, window, tile, tile_labels
@@ -0,0 +1,360 @@
+# DEDUP MODULE
+# Perceptual hashes of the dataset photos, to find the same field photo exported several times
+# (re-uploads and augmentations get a new '.rf.<hash>' suffix) and the copies leaked between splits.
+#
+# Hashes (dHash and pHash, 64 bits) are computed on 1/8 decodes and kept in a JSON lines index that
+# is only updated for new or changed photos. Near duplicates are found with a multi-index lookup:
+# the hashes are split in 4 chunks of 16 bits and two hashes within 7 bits of each other share a
+# chunk with at most one different bit, so only hashes in those buckets are compared.
+#
+# Usage (from src/scripts):
+#     python -m utils.dedup data/raw/3.5m.v3i.yolov8/ --max-distance 6 --output dedup.json
+
+# Standard library imports
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import cv2 as cv
+import numpy as np
+
+# Local modules
+from utils import file_management, images, manifest, pipeline
+
+
+INDEX_NAME = 'hashes.jsonl'
+KINDS = ('dhash', 'phash')
+CHUNKS = 4  # Multi-index: 4 chunks of 16 bits
+CHUNK_BITS = 16
+MAX_DISTANCE = 2 * CHUNKS - 1  # Largest distance found probing each chunk with up to 1 flipped bit
+DEFAULT_DISTANCE = 6
+
+
+def dhash(gray: np.ndarray) -> int:
+    """
+    Difference hash: sign of the horizontal gradient of a 9 x 8 thumbnail (64 bits).
+    """
+    small = cv.resize(gray, (9, 8), interpolation=cv.INTER_AREA)
+    return int(np.packbits(small[:, 1:] > small[:, :-1]).view('>u8')[0])
+
+
+def phash(gray: np.ndarray) -> int:
+    """
+    Perceptual hash: low frequencies of the DCT of a 32 x 32 thumbnail above their median (64 bits).
+    """
+    small = cv.resize(gray, (32, 32), interpolation=cv.INTER_AREA).astype(np.float32)
+    low = cv.dct(small)[:8, :8].ravel()
+    return int(np.packbits(low > np.median(low[1:])).view('>u8')[0])  # DC term left out of the median
+
+
+def image_hashes(image_path: str, reduce: int = 8) -> dict[str, int]:
+    """
+    {'dhash', 'phash'} of an image, decoded in grayscale at 1/reduce resolution.
+    """
+    gray = images.read_image(image_path, reduce=reduce, color=False, cache=False)
+    return {'dhash': dhash(gray), 'phash': phash(gray)}
+
+
+if hasattr(np, 'bitwise_count'):  # NumPy >= 2.0
+    def popcount(values: np.ndarray) -> np.ndarray:
+        return np.bitwise_count(values).astype(np.int64)
+else:
+    _BYTE_BITS = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.int64)
+
+    def popcount(values: np.ndarray) -> np.ndarray:
+        """
+        Set bits of every uint64 value.
+        """
+        return _BYTE_BITS[values.reshape(-1, 1).view(np.uint8)].sum(axis=1)
+
+
+def hamming_pairs(hashes: np.ndarray, max_distance: int = DEFAULT_DISTANCE,
+                  queries: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Pairs of hashes within max_distance bits, without comparing every pair.
+
+    Args:
+        hashes: uint64 hashes of the index.
+        max_distance: Largest Hamming distance (at most MAX_DISTANCE).
+        queries: uint64 hashes to look up in the index (default: the index against itself).
+
+    Returns:
+        (first, second, distance): positions in queries (or hashes) and in hashes, and their
+        distance. Against itself only pairs first < second are returned.
+    """
+    if not 0 <= max_distance <= MAX_DISTANCE:
+        raise ValueError(f"❕'max_distance' must be between 0 and {MAX_DISTANCE}.")
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    targets = hashes if queries is None else np.asarray(queries, dtype=np.uint64)
+    # Pigeonhole: a pair within max_distance has a chunk with at most max_distance // CHUNKS different bits
+    probes = [0] + ([1 << bit for bit in range(CHUNK_BITS)] if max_distance >= CHUNKS else [])
+
+    mask = np.uint64((1 << CHUNK_BITS) - 1)
+    firsts, seconds, distances = [], [], []
+    for chunk in range(CHUNKS):
+        shift = np.uint64(chunk * CHUNK_BITS)
+        keys = ((hashes >> shift) & mask).astype(np.intp)
+        order = np.argsort(keys, kind='stable')
+        # Bucket table: the hashes with chunk value k are order[starts[k]:starts[k + 1]]
+        starts = np.searchsorted(keys[order], np.arange((1 << CHUNK_BITS) + 1))
+        target_keys = ((targets >> shift) & mask).astype(np.intp)
+        for probe in probes:
+            target = target_keys ^ probe
+            lo, counts = starts[target], starts[target + 1] - starts[target]
+            # Same range expansion as merge.candidate_pairs
+            first = np.repeat(np.arange(len(targets)), counts)
+            local = np.arange(len(first)) - np.repeat(np.cumsum(counts) - counts, counts)
+            second = order[np.repeat(lo, counts) + local]
+            distance = popcount(targets[first] ^ hashes[second])
+            keep = distance <= max_distance
+            if queries is None:
+                keep &= first < second
+            firsts.append(first[keep])
+            seconds.append(second[keep])
+            distances.append(distance[keep])
+
+    # A pair found in several chunks (or probes) is kept once
+    pairs, unique = np.unique(np.concatenate(firsts) * len(hashes) + np.concatenate(seconds), return_index=True)
+    first, second = np.divmod(pairs, max(len(hashes), 1))
+    return first, second, np.concatenate(distances)[unique]
+
+
+def _hash_chunk(path: str, items: list[tuple[str, str]]) -> list[dict]:
+    file_management.PATH = path
+    records = []
+    for dset, name in items:
+        image_path = file_management.build_filename(dset=dset, type='image', dir='in', name=name)
+        stat = os.stat(image_path)
+        hashes = image_hashes(image_path)
+        records.append({'key': f"{dset}/{name}", 'stat': [stat.st_size, stat.st_mtime_ns],
+                        **{kind: f"{value:016x}" for kind, value in hashes.items()}})
+    return records
+
+
+class HashIndex:
+    """
+    Perceptual hashes of the photos of a dataset, kept in a JSON lines journal.
+
+    Entries keep the order in which the photos were first indexed, so the earliest copy of a
+    photo is the one that was 'seen' first (see seen). Like manifest.Manifest, every change is
+    appended and the journal is rewritten by compact().
+
+    Args:
+        index_path: JSON lines file of the index (created on the first update).
+    """
+
+    def __init__(self, index_path: str):
+        self.path = index_path
+        self.entries = {}
+        self._arrays = None
+        for record in manifest.read_journal(index_path):  # Drops a last line cut by a crash
+            if record.get('removed'):
+                self.entries.pop(record['key'], None)
+            elif record['key'] not in self.entries:
+                self.entries[record['key']] = record
+            else:
+                self.entries[record['key']].update(record)  # Changed photo keeps its position
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def keys(self) -> list[str]:
+        return list(self.entries)
+
+    def hashes(self, kind: str = 'dhash') -> np.ndarray:
+        """
+        uint64 hashes of every entry (in index order).
+        """
+        if kind not in KINDS:
+            raise ValueError(f"❕Invalid 'kind': must be one of {KINDS}.")
+        if self._arrays is None:
+            self._arrays = {}
+        if kind not in self._arrays:
+            self._arrays[kind] = np.array([int(entry[kind], 16) for entry in self.entries.values()], dtype=np.uint64)
+        return self._arrays[kind]
+
+    def update(self, path: str, splits: tuple[str, ...] = pipeline.SPLITS, workers: int | None = None,
+               chunk_size: int = 64) -> dict:
+        """
+        Hashes the new or changed photos of the splits and forgets the deleted ones.
+
+        Args:
+            path: Root of the raw dataset (the PATH used by build_filename).
+            workers: Number of processes (default os.cpu_count(); 1 runs in the current process).
+
+        Returns:
+            {'added', 'updated', 'removed', 'unchanged'} counts.
+        """
+        file_management.PATH = path
+        current, pending = set(), []
+        for dset in splits:
+            for name in pipeline.list_images(dset):
+                key = f"{dset}/{name}"
+                current.add(key)
+                entry = self.entries.get(key)
+                if entry is not None:
+                    stat = os.stat(file_management.build_filename(dset=dset, type='image', dir='in', name=name))
+                    if entry['stat'] == [stat.st_size, stat.st_mtime_ns]:
+                        continue
+                pending.append((dset, name))
+
+        removed = [key for key in self.entries if key not in current and key.split('/', 1)[0] in splits]
+        chunks = [pending[start:start + chunk_size] for start in range(0, len(pending), chunk_size)]
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(chunks) < 2:
+            records = [record for chunk in chunks for record in _hash_chunk(path, chunk)]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                records = [record for result in pool.map(_hash_chunk, [path] * len(chunks), chunks) for record in result]
+
+        added = sum(record['key'] not in self.entries for record in records)
+        with self._journal() as journal:
+            for key in removed:
+                del self.entries[key]
+                journal.write(json.dumps({'key': key, 'removed': True}) + '\n')
+            for record in records:
+                if record['key'] in self.entries:
+                    self.entries[record['key']].update(record)
+                else:
+                    self.entries[record['key']] = record
+                journal.write(json.dumps(record) + '\n')
+        self._arrays = None
+        return {'added': added, 'updated': len(records) - added, 'removed': len(removed),
+                'unchanged': len(current) - len(records)}
+
+    def _journal(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        return open(self.path, 'a')
+
+    def compact(self):
+        """
+        Rewrites the journal with the current entries only, in index order (atomic replace).
+        """
+        tmp_path = f"{self.path}.tmp"
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(tmp_path, 'w') as file:
+            file.writelines(json.dumps(entry) + '\n' for entry in self.entries.values())
+        os.replace(tmp_path, self.path)
+
+    def near_duplicates(self, max_distance: int = DEFAULT_DISTANCE, kind: str = 'dhash') -> list[tuple[str, str, int]]:
+        """
+        (earlier key, later key, distance) of every pair of indexed photos within max_distance bits.
+        """
+        keys = self.keys
+        first, second, distance = hamming_pairs(self.hashes(kind), max_distance)
+        return [(keys[i], keys[j], d) for i, j, d in zip(first.tolist(), second.tolist(), distance.tolist())]
+
+    def query(self, hashes: np.ndarray, max_distance: int = DEFAULT_DISTANCE, kind: str = 'dhash') -> list[list[str]]:
+        """
+        Indexed keys within max_distance bits of each hash (eg: of photos not indexed yet).
+        """
+        keys = self.keys
+        matches = [[] for _ in range(len(hashes))]
+        for i, j, _ in zip(*hamming_pairs(self.hashes(kind), max_distance, queries=hashes)):
+            matches[i].append(keys[j])
+        return matches
+
+    def seen(self, keys: list[str], max_distance: int = DEFAULT_DISTANCE, kind: str = 'dhash') -> set[str]:
+        """
+        Keys that are near duplicates of an entry indexed before them (the copies to skip).
+        """
+        wanted = set(keys)
+        return {later for _, later, _ in self.near_duplicates(max_distance, kind) if later in wanted}
+
+
+def index_path(path: str) -> str:
+    """
+    Default index of a raw dataset: next to the manifest, in the processed root.
+    """
+    return os.path.join(file_management.processed_root(path), INDEX_NAME)
+
+
+def _groups(keys: list[str], pairs: list[tuple[str, str, int]]) -> list[list[str]]:
+    """
+    Connected components (2 photos or more) of the near-duplicate pairs (union-find).
+    """
+    order = {key: i for i, key in enumerate(keys)}
+    parent = {}
+
+    def find(key):
+        root = key
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while key != root:  # Path compression
+            parent[key], key = root, parent[key]
+        return root
+
+    for a, b, _ in pairs:
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            if order[root_a] > order[root_b]:
+                root_a, root_b = root_b, root_a
+            parent[root_b] = parent.setdefault(root_a, root_a)  # The earliest copy stays the root
+
+    groups = {}
+    for key in parent:
+        groups.setdefault(find(key), []).append(key)
+    return sorted((sorted(members, key=order.get) for members in groups.values()), key=lambda group: order[group[0]])
+
+
+def report(index: HashIndex, max_distance: int = DEFAULT_DISTANCE, kind: str = 'dhash') -> dict:
+    """
+    Duplicate groups of the index and the pairs that leak between splits.
+
+    Returns:
+        {'images', 'pairs', 'groups' (first key is the earliest copy), 'duplicates' (copies
+        beyond the first of each group), 'leakage' {'train/valid': [...], ...} and
+        'same_stem' (groups whose photos share the name before '.rf.')}.
+    """
+    keys = index.keys
+    pairs = index.near_duplicates(max_distance, kind)
+    groups = _groups(keys, pairs)
+
+    leakage = {}
+    for a, b, distance in pairs:
+        split_a, split_b = a.split('/', 1)[0], b.split('/', 1)[0]
+        if split_a != split_b:
+            leakage.setdefault('/'.join(sorted((split_a, split_b))), []).append({'a': a, 'b': b, 'distance': distance})
+    stem = lambda key: key.split('/', 1)[1].split('.rf.', 1)[0]
+    return {
+        'images': len(keys),
+        'kind': kind,
+        'max_distance': max_distance,
+        'pairs': len(pairs),
+        'duplicates': sum(len(group) - 1 for group in groups),
+        'same_stem': sum(len({stem(key) for key in group}) == 1 for group in groups),
+        'leakage': leakage,
+        'groups': groups,
+    }
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Perceptual-hash index of a dataset: duplicates and split leakage.")
+    parser.add_argument('path', help="Root of the raw dataset (eg: data/raw/3.5m.v3i.yolov8/)")
+    parser.add_argument('--splits', nargs='+', default=list(pipeline.SPLITS), choices=pipeline.SPLITS)
+    parser.add_argument('--index', default=None, help=f"Index file (default '{INDEX_NAME}' in the processed root)")
+    parser.add_argument('--kind', default='dhash', choices=KINDS)
+    parser.add_argument('--max-distance', type=int, default=DEFAULT_DISTANCE, help=f"Bits (at most {MAX_DISTANCE})")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default='dedup.json', help="JSON report")
+    args = parser.parse_args(argv)
+
+    path = args.path if args.path.endswith('/') else args.path + '/'
+    index = HashIndex(args.index or index_path(path))
+    changes = index.update(path, tuple(args.splits), args.workers)
+    index.compact()
+    result = report(index, args.max_distance, args.kind)
+    with open(args.output, 'w') as file:
+        json.dump(result, file, indent=2)
+
+    print(f"> Índice: {len(index)} imágenes (nuevas: {changes['added']}, cambiadas: {changes['updated']}, "
+          f"eliminadas: {changes['removed']})")
+    print(f"> Duplicados: {result['duplicates']} en {len(result['groups'])} grupos")
+    for splits, pairs in result['leakage'].items():
+        print(f"❕ Fuga {splits}: {len(pairs)} pares")
+    print(f"✅ Informe guardado en {args.output}")
+
+
+if __name__ == '__main__':
+    main()
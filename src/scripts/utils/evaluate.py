@@ -0,0 +1,288 @@
+# EVALUATION MODULE
+# Counting accuracy (per-photo grain count error) and detection quality (precision, recall, AP)
+# of a set of predicted YOLO label files against the ground truth of a split.
+#
+# Usage (from src/scripts), with the labels written by 'yolo predict save_txt=True save_conf=True':
+#     python -m utils.evaluate data/raw/3.5m.v3i.yolov8/ --split valid --predictions runs/detect/predict/labels --output eval.json
+
+# Standard library imports
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# Local modules
+from utils import file_management, format, images, label_store, merge, pipeline
+
+
+IOU_THRESHOLDS = tuple(np.round(np.linspace(0.5, 0.95, 10), 2).tolist())  # COCO: AP50 ... AP95
+RECALL_POINTS = np.linspace(0, 1, 101)
+
+
+def read_predictions(label_path: str) -> np.ndarray:
+    """
+    Reads one predicted label file: 'class x y w h [conf]' per line (confidence 1 when missing).
+
+    Returns:
+        float64 (M, 6) array with (class_id, x_center, y_center, width, height, conf).
+    """
+    if not os.path.exists(label_path):
+        return np.empty((0, 6))  # No file: the model found nothing
+    with open(label_path, 'rb') as file:
+        content = file.read()
+    lines = content.split(b'\n', 1)
+    columns = len(lines[0].split())
+    if not columns:
+        return np.empty((0, 6))
+    if columns not in (5, 6):
+        raise ValueError(f"❕'{label_path}' must have 5 or 6 values per box ({columns} values).")
+    values = np.array(content.split(), dtype=np.float64)
+    if len(values) % columns:
+        raise ValueError(f"❕'{label_path}' has lines with different numbers of values.")
+    values = values.reshape(-1, columns)
+    return values if columns == 6 else np.column_stack([values, np.ones(len(values))])
+
+
+def match_boxes(gt_boxes: np.ndarray, gt_classes: np.ndarray, pred_boxes: np.ndarray, pred_classes: np.ndarray,
+                pred_conf: np.ndarray, iou_thresholds: tuple = IOU_THRESHOLDS, class_agnostic: bool = False) -> np.ndarray:
+    """
+    Greedy COCO-style matching of the predictions of one image with its ground truth.
+
+    Predictions are taken by decreasing confidence and each one is matched to the unmatched
+    ground-truth box it overlaps most (IoU >= threshold, same class). Only the pairs found
+    by merge.candidate_pairs (neighbour grid cells per box size class) are scored, so the cost
+    grows with the number of boxes and not with their product, even with a few huge boxes.
+
+    Args:
+        gt_boxes, pred_boxes: (x0, y0, x1, y1) arrays in pixels (the candidate grid has cells of
+            at least one pixel).
+        gt_classes, pred_classes: Class of each box.
+        pred_conf: Confidence of each prediction.
+        iou_thresholds: Thresholds to match at.
+        class_agnostic: Matches boxes of different classes too.
+
+    Returns:
+        bool (M, T) array: prediction m is a true positive at threshold t.
+    """
+    n_gt, n_pred = len(gt_boxes), len(pred_boxes)
+    tp = np.zeros((n_pred, len(iou_thresholds)), dtype=bool)
+    if not n_gt or not n_pred:
+        return tp
+
+    first, second = merge.candidate_pairs(np.concatenate([gt_boxes, pred_boxes]), min(iou_thresholds))
+    cross = (first < n_gt) & (second >= n_gt)  # first < second, so the ground truth is always first
+    gt_index, pred_index = first[cross], second[cross] - n_gt
+    iou = merge.box_iou(gt_boxes[gt_index], pred_boxes[pred_index])
+    valid = iou >= min(iou_thresholds)
+    if not class_agnostic:
+        valid &= gt_classes[gt_index] == pred_classes[pred_index]
+    gt_index, pred_index, iou = gt_index[valid], pred_index[valid], iou[valid]
+
+    # Pairs by prediction rank (decreasing confidence), then by decreasing IoU
+    rank = np.empty(n_pred, dtype=np.int64)
+    rank[np.argsort(-pred_conf, kind='stable')] = np.arange(n_pred)
+    order = np.lexsort((-iou, rank[pred_index]))
+    gt_index, pred_index, iou = gt_index[order].tolist(), pred_index[order].tolist(), iou[order]
+
+    for t, threshold in enumerate(iou_thresholds):
+        matched_gt, matched_pred = set(), set()
+        for g, p, above in zip(gt_index, pred_index, (iou >= threshold).tolist()):
+            if above and g not in matched_gt and p not in matched_pred:
+                matched_gt.add(g)
+                matched_pred.add(p)
+        tp[list(matched_pred), t] = True
+    return tp
+
+
+def average_precision(tp: np.ndarray, conf: np.ndarray, n_gt: int) -> np.ndarray:
+    """
+    101-point interpolated AP (COCO) of a set of predictions, for every IoU threshold.
+
+    Args:
+        tp: bool (M, T) true positive flags (see match_boxes).
+        conf: Confidence of each prediction.
+        n_gt: Number of ground-truth boxes.
+
+    Returns:
+        float64 (T,) array, NaN when there is no ground truth (AP is undefined).
+    """
+    if not n_gt:
+        return np.full(tp.shape[1], np.nan)
+    if not len(tp):
+        return np.zeros(tp.shape[1])
+    order = np.argsort(-conf, kind='stable')
+    true = np.cumsum(tp[order], axis=0)
+    false = np.arange(1, len(tp) + 1)[:, None] - true
+    recall = true / n_gt
+    precision = true / (true + false)
+    precision = np.maximum.accumulate(precision[::-1], axis=0)[::-1]  # Precision envelope
+
+    ap = np.empty(tp.shape[1])
+    for t in range(tp.shape[1]):
+        index = np.searchsorted(recall[:, t], RECALL_POINTS, side='left')
+        values = np.zeros(len(RECALL_POINTS))
+        reached = index < len(precision)
+        values[reached] = precision[index[reached], t]
+        ap[t] = values.mean()
+    return ap
+
+
+def _init_worker(path: str):
+    file_management.PATH = path
+
+
+def _evaluate_chunk(dset: str, dir: str, predictions: str, names: list[str], iou_thresholds: tuple,
+                    conf_threshold: float, class_agnostic: bool) -> dict:
+    """
+    Matches the images of a chunk and returns the per-image counts and per-prediction flags.
+    """
+    gt_folder = file_management.build_filename(dset=dset, type='label', dir=dir)
+    gt_counts, pred_counts, gt_classes, confs, classes, tps = [], [], [], [], [], []
+    for name in names:
+        gt_path = os.path.join(gt_folder, f"{name}.txt")
+        if os.path.exists(gt_path):
+            with open(gt_path, 'rb') as file:
+                gt = format.label_array(label_store.parse_labels([file.read()])[0])
+        else:
+            gt = np.empty((0, 5))
+        pred = read_predictions(os.path.join(predictions, f"{name}.txt"))
+
+        if class_agnostic:
+            gt[:, 0] = 0
+            pred[:, 0] = 0
+        im_height, im_width = images.image_size(file_management.build_filename(dset=dset, type='image', dir=dir, name=name))
+        gt_boxes = format.yolo_to_xyxy(gt[:, 1:5], im_height, im_width)
+        pred_boxes = format.yolo_to_xyxy(pred[:, 1:5], im_height, im_width)
+        tps.append(match_boxes(gt_boxes, gt[:, 0], pred_boxes, pred[:, 0], pred[:, 5], iou_thresholds))
+        confs.append(pred[:, 5])
+        classes.append(pred[:, 0])
+        gt_classes.append(gt[:, 0])
+        gt_counts.append(len(gt))
+        pred_counts.append(int((pred[:, 5] >= conf_threshold).sum()))
+
+    return {'names': names, 'gt_counts': np.asarray(gt_counts, dtype=np.int64),
+            'pred_counts': np.asarray(pred_counts, dtype=np.int64),
+            'gt_classes': np.concatenate(gt_classes or [np.empty(0)]).astype(np.int64),
+            'conf': np.concatenate(confs or [np.empty(0)]), 'classes': np.concatenate(classes or [np.empty(0)]).astype(np.int64),
+            'tp': np.concatenate(tps or [np.empty((0, len(iou_thresholds)), dtype=bool)])}
+
+
+def count_metrics(gt_counts: np.ndarray, pred_counts: np.ndarray) -> dict:
+    """
+    Per-photo count error: MAE, RMSE, MAPE (photos with grains), bias and total relative error.
+    """
+    gt_counts = np.asarray(gt_counts, dtype=np.float64)
+    error = np.asarray(pred_counts, dtype=np.float64) - gt_counts
+    if not len(error):
+        return {'images': 0}
+    counted = gt_counts > 0
+    return {'images': len(error), 'mae': float(np.abs(error).mean()), 'rmse': float(np.sqrt((error ** 2).mean())),
+            'mape': float(np.abs(error[counted] / gt_counts[counted]).mean() * 100) if counted.any() else None,
+            'bias': float(error.mean()),
+            'total_error_pct': float(error.sum() / gt_counts.sum() * 100) if gt_counts.sum() else None}
+
+
+def evaluate_split(path: str, dset: str, predictions: str, dir: str = 'in', iou_thresholds: tuple = IOU_THRESHOLDS,
+                   conf_threshold: float = 0.25, class_agnostic: bool = False, workers: int | None = None,
+                   chunk_size: int = 64, worst: int = 10) -> dict:
+    """
+    Evaluates the predicted labels of a split against its ground truth in a pool of processes.
+
+    Args:
+        path: Root of the raw dataset (the PATH used by build_filename).
+        dset: Split ('train', 'valid' or 'test').
+        predictions: Folder with a '{name}.txt' per image (missing files: no detections).
+        dir: Dataset of the ground truth ('in' raw photos, 'out' processed tiles).
+        iou_thresholds: Matching thresholds; the first one is used for precision/recall.
+        conf_threshold: Minimum confidence of the predictions that are counted.
+        class_agnostic: Treats every class as the same one.
+        workers: Number of processes (default os.cpu_count(); 1 runs in the current process).
+        chunk_size: Images per task.
+        worst: Number of photos with the largest count error to list.
+
+    Returns:
+        Report with the count metrics, precision/recall, AP per class and mAP.
+    """
+    _init_worker(path)
+    names = pipeline.list_images(dset, dir)
+    iou_thresholds = tuple(iou_thresholds)
+    chunks = [names[start:start + chunk_size] for start in range(0, len(names), chunk_size)]
+    args = (dir, predictions)
+    options = (iou_thresholds, conf_threshold, class_agnostic)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        partials = [_evaluate_chunk(dset, *args, chunk, *options) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(path,)) as pool:
+            futures = [pool.submit(_evaluate_chunk, dset, *args, chunk, *options) for chunk in chunks]
+            partials = [future.result() for future in futures]
+
+    def joined(key: str, empty: np.ndarray) -> np.ndarray:
+        return np.concatenate([partial[key] for partial in partials]) if partials else empty
+
+    gt_counts, pred_counts = joined('gt_counts', np.empty(0, np.int64)), joined('pred_counts', np.empty(0, np.int64))
+    gt_classes, classes = joined('gt_classes', np.empty(0, np.int64)), joined('classes', np.empty(0, np.int64))
+    conf, tp = joined('conf', np.empty(0)), joined('tp', np.empty((0, len(iou_thresholds)), dtype=bool))
+
+    # Precision / recall at the counting confidence and the first IoU threshold
+    counted = conf >= conf_threshold
+    true_positives = int(tp[counted, 0].sum())
+    n_pred, n_gt = int(counted.sum()), len(gt_classes)
+
+    per_class = {}
+    for class_id in np.union1d(np.unique(gt_classes), np.unique(classes)).tolist():
+        mine = classes == class_id
+        ap = average_precision(tp[mine], conf[mine], int((gt_classes == class_id).sum()))
+        defined = not np.isnan(ap).any()  # No ground truth of the class: None instead of NaN (invalid JSON)
+        per_class[str(class_id)] = {'ground_truth': int((gt_classes == class_id).sum()), 'predictions': int(mine.sum()),
+                                    'ap50': float(ap[0]) if defined else None,
+                                    'ap': float(np.mean(ap)) if defined else None}
+    scored = [values for values in per_class.values() if values['ground_truth']]
+
+    error = pred_counts - gt_counts
+    all_names = [name for partial in partials for name in partial['names']]
+    return {
+        'split': dset, 'iou_thresholds': list(iou_thresholds), 'conf_threshold': conf_threshold,
+        'count': count_metrics(gt_counts, pred_counts),
+        'precision': true_positives / n_pred if n_pred else 0.0,
+        'recall': true_positives / n_gt if n_gt else 0.0,
+        'map50': float(np.mean([values['ap50'] for values in scored])) if scored else 0.0,
+        'map': float(np.mean([values['ap'] for values in scored])) if scored else 0.0,
+        'per_class': per_class,
+        'worst_images': [{'name': all_names[i], 'ground_truth': int(gt_counts[i]), 'predicted': int(pred_counts[i])}
+                         for i in np.argsort(-np.abs(error), kind='stable')[:worst].tolist()],
+    }
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Count error and detection metrics of predicted YOLO labels.")
+    parser.add_argument('path', help="Root of the raw dataset (eg: data/raw/3.5m.v3i.yolov8/)")
+    parser.add_argument('--split', default='valid', choices=pipeline.SPLITS)
+    parser.add_argument('--predictions', required=True, help="Folder with the predicted label files")
+    parser.add_argument('--dir', default='in', choices=['in', 'out'], help="'out' evaluates the processed tiles")
+    parser.add_argument('--conf', type=float, default=0.25, help="Minimum confidence of a counted grain")
+    parser.add_argument('--class-agnostic', action='store_true')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default=None, help="JSON report")
+    args = parser.parse_args(argv)
+
+    path = args.path if args.path.endswith('/') else args.path + '/'
+    report = evaluate_split(path, args.split, args.predictions, args.dir, conf_threshold=args.conf,
+                            class_agnostic=args.class_agnostic, workers=args.workers)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    count = report['count']
+    print(f"> {args.split}: {count['images']} imágenes")
+    if count['images']:
+        mape = f"{count['mape']:.2f}%" if count['mape'] is not None else '-'
+        print(f"  Error de conteo: MAE {count['mae']:.2f}, RMSE {count['rmse']:.2f}, MAPE {mape}, sesgo {count['bias']:+.2f}")
+    print(f"  Precision {report['precision']:.3f}, recall {report['recall']:.3f}, mAP50 {report['map50']:.3f}, "
+          f"mAP50-95 {report['map']:.3f}")
+
+
+if __name__ == '__main__':
+    main()
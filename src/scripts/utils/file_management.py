@@ -2,79 +2,252 @@
 
 #Standard library imports
 import os
-import shutil
-import sys
+import queue
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 
 # Local modules
-from utils import security
-
-
-@validate_filenames()
-def create_dir(folder_path):
-    # 1) Verifica si el directorio existe y confirma si es necesario vaciarlo
-    if os.path.exists(folder_path):
-        print(f"🚨 ALERTA: El directorio en el que quieres guardar ya tiene contenido, para proceder deberás eliminarlo.")
-        confirmation = input(f"❓¿Estás seguro de que deseas eliminar el directorio '{folder_path}' y su contenido? (y/n): ").lower()
-        if confirmation in ['y', 'yes']:
-            shutil.rmtree(folder_path)  # Elimina el directorio y todo su contenido
-            print("> Directorio eliminado:\n",folder_path)
-        else:
-            print(f"❌ Operación cancelada por el usuario. El directorio no se eliminó.\n⏸️ La ejecución se ha detenido.")
-            sys.exit()
-    else:
-        print("🆕 El directorio no existe, se creará uno nuevo:",{folder_path})
-        
+from utils import security, format
+
+
+DIR_MODES = ('ask', 'fail', 'overwrite', 'append')
+
+# Background removals of replaced trees (non-daemon threads: the process waits for them at exit)
+_REMOVER = ThreadPoolExecutor(max_workers=2, thread_name_prefix='remove_tree')
+
+
+def _check_mode(mode: str, modes: tuple = DIR_MODES):
+    if mode not in modes:
+        raise ValueError(f"❕Invalid 'mode': must be one of {modes}.")
+
+
+def _confirm(question: str) -> bool:
+    return input(f"❓{question} (y/n): ").lower() in ['y', 'yes']
+
+
+def _aside(folder_path: str, tag: str) -> str:
+    """
+    Unused sibling path (same filesystem, so a rename is instant).
+    """
+    return f"{folder_path.rstrip('/')}.{tag}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def _delete_tree(folder_path: str, workers: int = 8):
+    """
+    Deletes a tree: worker threads unlink batches of files while the tree is walked with
+    os.scandir, then the (empty) directories are removed from the deepest up.
+
+    Plain threads instead of an executor, so it still works when it runs at interpreter exit.
+    """
+    batches = queue.SimpleQueue()
+
+    def unlink_batches():
+        while (batch := batches.get()) is not None:
+            _remove_files(batch)
+
+    threads = [threading.Thread(target=unlink_batches) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    folders = []
+    pending = [folder_path]
+    try:
+        while pending:
+            folder = pending.pop()
+            folders.append(folder)
+            batch = []
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                        continue
+                    batch.append(entry.path)
+                    if len(batch) == 256:
+                        batches.put(batch)
+                        batch = []
+            if batch:
+                batches.put(batch)
+    finally:
+        for _ in threads:
+            batches.put(None)
+        for thread in threads:
+            thread.join()
+
+    for folder in reversed(folders):
+        os.rmdir(folder)
+
+
+def _remove_files(paths: list[str]):
+    for path in paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def remove_tree(folder_path: str, background: bool = False, workers: int = 8) -> Future | None:
+    """
+    Removes a directory tree quickly.
+
+    The tree is first renamed aside, so folder_path is free at once, and then deleted with
+    parallel unlinks (see _delete_tree).
+
+    Args:
+        folder_path: Directory to remove.
+        background: Returns right after the rename and deletes in a background thread.
+        workers: Threads unlinking files.
+
+    Returns:
+        Future of the background deletion (None when background is False).
+    """
+    if not os.path.exists(folder_path):
+        return None
+    trash = _aside(folder_path, 'trash')
+    os.rename(folder_path, trash)
+    if background:
+        return _REMOVER.submit(_delete_tree, trash, workers)
+    _delete_tree(trash, workers)
+    return None
+
+
+class OutputDir:
+    """
+    Non-interactive output directory, usable as a context manager.
+
+    Modes:
+        'fail': Raises FileExistsError if the directory already has content.
+        'overwrite': Everything is written to a staging directory that replaces the target
+            when the block ends without errors (the old tree is deleted in the background).
+            If the block fails, the target is left untouched.
+        'append': Writes straight into the directory (created if needed), keeping its content.
+            Incremental runs use it and let the pipeline manifest decide what is processed
+            again (pipeline.run(mode='incremental')).
+
+    Example:
+        with file_management.OutputDir('data/processed/set/', mode='overwrite') as folder:
+            ...  # write everything under 'folder'
+    """
+
+    def __init__(self, folder_path: str, mode: str = 'fail'):
+        _check_mode(mode, DIR_MODES[1:])
+        self.folder_path = folder_path.rstrip('/')
+        self.mode = mode
+        self.path = self.folder_path  # Where the content is written
+        self.removal = None  # Future of the background deletion of the replaced tree
+
+    def __enter__(self) -> str:
+        exists = os.path.exists(self.folder_path)
+        if self.mode == 'fail' and exists and os.listdir(self.folder_path):
+            raise FileExistsError(f"❗️El directorio '{self.folder_path}' ya tiene contenido (mode='fail').")
+        if self.mode == 'overwrite':
+            self.path = _aside(self.folder_path, 'staging')
+        os.makedirs(self.path, exist_ok=True)
+        return self.path
+
+    def __exit__(self, exc_type, exc, traceback):
+        if self.path == self.folder_path:
+            return
+        if exc_type is not None:
+            remove_tree(self.path, background=True)
+            return
+        self.commit()
+
+    def commit(self):
+        """
+        Swaps the staging directory into place (two renames, then background deletion).
+        """
+        old = None
+        if os.path.exists(self.folder_path):
+            old = _aside(self.folder_path, 'trash')
+            os.rename(self.folder_path, old)
+        os.rename(self.path, self.folder_path)
+        self.path = self.folder_path
+        if old is not None:
+            self.removal = _REMOVER.submit(_delete_tree, old)
+
+
+@security.validate_filenames('folder_path')
+def create_dir(folder_path, mode: str = 'ask'):
+    """
+    Crea el directorio de salida.
+
+    Args:
+        folder_path: Ruta del directorio.
+        mode: 'ask' pide confirmación para eliminar un directorio existente;
+            'fail' lanza FileExistsError si ya tiene contenido;
+            'overwrite' lo reemplaza por uno vacío sin preguntar;
+            'append' lo conserva (en pipeline.run(mode='incremental') el manifest decide qué se reprocesa).
+
+    Raises:
+        FileExistsError: Si el directorio tiene contenido y no se puede eliminar ('fail' o cancelado en 'ask').
+    """
+    _check_mode(mode)
+
+    # 1) Verifica si el directorio existe y si es necesario vaciarlo
+    if os.path.exists(folder_path) and mode == 'append':
+        print("♻️ Se conserva el contenido del directorio:\n", folder_path)
+    elif os.path.exists(folder_path) and os.listdir(folder_path):
+        if mode == 'fail':
+            raise FileExistsError(f"❗️El directorio '{folder_path}' ya tiene contenido (mode='fail').")
+        if mode == 'ask':
+            print(f"🚨 ALERTA: El directorio en el que quieres guardar ya tiene contenido, para proceder deberás eliminarlo.")
+            if not _confirm(f"¿Estás seguro de que deseas eliminar el directorio '{folder_path}' y su contenido?"):
+                raise FileExistsError(f"❌ Operación cancelada por el usuario. El directorio no se eliminó: '{folder_path}'")
+        remove_tree(folder_path, background=True)  # Libera la ruta al instante y borra en segundo plano
+        print("> Directorio eliminado:\n", folder_path)
+    elif not os.path.exists(folder_path):
+        print("🆕 El directorio no existe, se creará uno nuevo:", {folder_path})
+
     # 2) Crea el directorio especificado
     os.makedirs(folder_path, exist_ok=True)
-    print("✅ El directorio ya está disponible:\n",{folder_path})
+    print("✅ El directorio ya está disponible:\n", {folder_path})
 
 
-@validate_filenames()
-def empty_dir(folder_path):
+@security.validate_filenames('folder_path')
+def empty_dir(folder_path, mode: str = 'ask'):
     """
     Elimina todo el contenido (archivos y subdirectorios) de una carpeta especificada.
 
     Args:
         folder_path: La ruta de la carpeta que se va a limpiar.
+        mode: 'ask' pide confirmación antes de borrar; 'overwrite' borra sin preguntar;
+            'append' no borra nada (las salidas obsoletas las elimina el manifest del pipeline).
 
     Raises:
         FileNotFoundError: Si la carpeta especificada no existe.
+        FileExistsError: Si el usuario cancela la operación ('ask').
         OSError: Si ocurre un error durante la eliminación de archivos o directorios.
     """
-
+    _check_mode(mode, ('ask', 'overwrite', 'append'))
     if not os.path.exists(folder_path):
         raise FileNotFoundError(f"❗️La carpeta '{folder_path}' no existe.")
+    if mode == 'append':
+        return
+    if mode == 'ask' and not _confirm(f"¿Estás seguro de que deseas eliminar el contenido de '{folder_path}'?"):
+        raise FileExistsError(f"❌ Operación cancelada por el usuario. El directorio no se vació: '{folder_path}'")
 
     try:
-        confirmation = input(f"❓¿Estás seguro de que deseas eliminar el contenido de '{folder_path}'? (y/n): ").lower()
-        if confirmation in ['y', 'yes']:
-            for file in os.listdir(folder_path):  # Itera sobre los archivos y directorios
-                file_path = os.path.join(folder_path, file)  # Crea la ruta completa
-
-                if os.path.isfile(file_path):  # Si es un archivo
-                    os.remove(file_path)  # Elimina el archivo
-                    #print(f"Archivo eliminado: {file_path}")
+        # La carpeta se aparta y se recrea vacía; el contenido se borra en segundo plano
+        permissions = os.stat(folder_path).st_mode & 0o7777
+        remove_tree(folder_path, background=True)
+        os.makedirs(folder_path)
+        os.chmod(folder_path, permissions)
+        print("✔️ Contenido de la carpeta eliminado:\n", folder_path)
+    except OSError as e:
+        raise OSError(f"🚫 Error al limpiar la carpeta:\n {e}")
 
-                elif os.path.isdir(file_path):  # Si es un directorio
-                    shutil.rmtree(file_path)  # Elimina el directorio y su contenido de forma recursiva
-                    #print(f"Directorio eliminado: {file_path}")
 
-            print("✔️ Contenido de la carpeta eliminado:\n", folder_path)
+def processed_root(path: str | None = None) -> str:
+    """
+    Root of the processed dataset of a raw dataset root (default PATH): 'data/raw/...' -> 'data/processed/...'.
+    """
+    return (PATH if path is None else path).replace('raw', 'processed')
 
-        else:
-            print(f"❌ Operación cancelada por el usuario. El directorio no se eliminó.\n⏸️ La ejecución se ha detenido.")
-            sys.exit()
 
-    except OSError as e:
-        raise OSError(f"🚫 Error al limpiar la carpeta:\n {e}")    
-    except FileNotFoundError as e:
-        print(f"🚨 El archivo no existe:\n {e}")
-    except Exception as e:
-        raise Exception(f"❗️ Error inesperado:\n {e}")
-    
-
-@validate_filenames()
+@security.validate_filenames('dset', 'type', 'dir', 'prefix', 'name')
 def build_filename(dset: str, type: str, dir: str='in', prefix: str = '', name: str | None = None, verbose: bool = False) -> str:
     """ 
     Construye el nombre y ruta necesaria para cargar/guardar cada archivo del dataset.
@@ -114,7 +287,7 @@ def build_filename(dset: str, type: str, dir: str='in', prefix: str = '', name:
     #             {prefix}.{filename}.{type}        <- Full filename
 
     if dir == 'out':
-        root = PATH.replace('raw','processed')
+        root = processed_root()
     elif dir == 'in':
         root = PATH
     else:
@@ -162,6 +335,75 @@ def build_filename(dset: str, type: str, dir: str='in', prefix: str = '', name:
     return f"{root}{dset}{type_folder}/{filename}"
 
 
+def _sanitize(value: str) -> str:
+    # Allowed ASCII strings come back from sanitize_filename unchanged: skip its cache (tile prefixes are unique)
+    return value if value.isascii() and security.ALLOWED_CHARS.fullmatch(value) else security.sanitize_filename(value)
+
+
+class TilePaths:
+    """
+    Paths of every tile of one image, with the same result as build_filename.
+
+    The root, split and name are sanitized and validated once and the filename template
+    is split around the prefix, so each tile path is a single string concatenation.
+
+    Args:
+        dset: Split ('train', 'valid' or 'test').
+        name: Filename without extension (eg: '209_205_50_JPG.rf.a6fd...').
+        dir: Dataset of input or output ('in' or 'out').
+
+    Example:
+        paths = TilePaths('train', name, dir='out')
+        paths.path('label', 'tile00x03')  # == build_filename('train', 'label', 'out', 'tile00x03', name)
+    """
+
+    TYPES = {'image': ('images', 'jpg'), 'label': ('labels', 'txt')}
+
+    def __init__(self, dset: str, name: str, dir: str = 'in'):
+        assert isinstance(dset, str) and isinstance(name, str) and isinstance(dir, str), "❕All arguments must be strings."
+        dset, name, dir = _sanitize(dset), _sanitize(name), _sanitize(dir)
+
+        if dir == 'out':
+            root = processed_root()
+        elif dir == 'in':
+            root = PATH
+        else:
+            raise ValueError("❕Invalid 'dir': must be 'in' (default) or 'out'.")
+        if dset.lower() not in ('train', 'valid', 'test'):
+            raise ValueError("❕Invalid 'dset': must be 'train', 'valid', or 'test'.")
+
+        # Prefix goes before the '.rf.' hash part, or at the end when the name has none
+        pointer = name.find('.rf.')
+        head, tail = (f"{name}.", '') if pointer == -1 else (f"{name[:pointer]}.", name[pointer:])
+
+        # type -> (path before the prefix, path after the prefix, path without prefix)
+        self._parts = {}
+        for type, (type_folder, extension) in self.TYPES.items():
+            folder = f"{root}{dset.lower()}/{type_folder}/"
+            self._parts[type] = (folder + head, f"{tail}.{extension}", f"{folder}{name}.{extension}")
+
+    def path(self, type: str, prefix: str = '') -> str:
+        """
+        Path of the file of type 'image' or 'label' with the given tile prefix.
+        """
+        try:
+            start, end, plain = self._parts[type]
+        except KeyError:
+            raise ValueError("❕Invalid 'type': must be 'image' or 'label'.") from None
+        if not prefix:
+            return plain
+        return start + _sanitize(prefix) + end
+
+    def batch(self, type: str, prefixes: list[str]) -> list[str]:
+        """
+        Paths for many prefixes at once (eg: every tile of the grid).
+        """
+        if type not in self._parts:
+            self.path(type)  # Raises the usual ValueError
+        start, end, plain = self._parts[type]
+        return [start + _sanitize(prefix) + end if prefix else plain for prefix in prefixes]
+
+
 def filenames_for_tiles(dset: str, type: str, dir: str='in', name: str | None = None) -> callable:
     """ 
     Crea una función anidada para generar nombres de archivo y ruta para cada mosaico.
@@ -175,31 +417,47 @@ def filenames_for_tiles(dset: str, type: str, dir: str='in', name: str | None =
     Retorna:
         - callable: Retorna la función generadora anidada.
     """
+    if name is None:
+        def generate_filename(prefix: str = '') -> str:
+            """
+            Construye la ruta de la carpeta (sin nombre de archivo el prefijo se ignora).
+            """
+            return build_filename(dset=dset, type=type, dir=dir, prefix=prefix, name=name, verbose=False)
+
+        return generate_filename
+
+    # Se valida una sola vez; cada mosaico es solo una concatenación
+    paths = TilePaths(dset, name, dir)
+
     def generate_filename(prefix: str = '') -> str:
         """
         Construye el nombre y ruta para el mosaico especificado.
         """
-        return build_filename(dset=dset, type=type, dir=dir, prefix=prefix, name=name, verbose=False)
+        return paths.path(type, prefix)
 
     return generate_filename  # Return the nested function
 
 
-@validate_filenames()
-def save_labels(dest_labels_file: str, export: pd.DataFrame, verbose: bool = True) -> bool:
+@security.validate_filenames('dest_labels_file')
+def save_labels(dest_labels_file: str, export: pd.DataFrame | np.ndarray, verbose: bool = True, precision: int | None = None) -> bool:
     """
     Saves a DataFrame to a file, with each row as a space-separated string.
 
     Args:
         dest_labels_file: Path to the output file.
-        export: DataFrame to save.
+        export: DataFrame (or 2D array) to save.
+        verbose: Prints a confirmation message.
+        precision: Fixed number of decimals for the coordinates (default None
+            keeps the shortest representation of each value).
 
     Returns:
         True if the file was saved successfully, False otherwise.
     """
     try:
-        lines = label_to_str(export)
+        # The whole file is formatted in memory and written as a single buffer
+        text = format.labels_to_text(export, precision=precision)
         with open(dest_labels_file, 'w') as file:
-            file.writelines(line + "\n" for line in lines)
+            file.write(text)
         if verbose:
             print("El archivo de etiquetas se ha creado correctamente. Se han guardado todos los datos.")
         return True
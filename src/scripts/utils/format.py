@@ -4,6 +4,12 @@
 import numpy as np
 import pandas as pd
 
+# Record layouts for array-backed labels (see label_store)
+LABEL_DTYPE = np.dtype([('class_id', np.uint16), ('x_center', np.float32), ('y_center', np.float32),
+                        ('width', np.float32), ('height', np.float32)])
+BB_DTYPE = np.dtype([('class_id', np.uint16), ('x0', np.int32), ('x1', np.int32),
+                     ('y0', np.int32), ('y1', np.int32)])
+
 
 def label_to_str(export: pd.DataFrame) -> list[str]:
     
@@ -17,12 +23,7 @@ def label_to_str(export: pd.DataFrame) -> list[str]:
     - List with labels in text (list[str])
     """
     
-    lines = []
-    for _, row in export.iterrows():
-        row_list = list(row)
-        row_list[0] = int(row_list[0])
-        line = ' '.join(map(str, row_list))
-        lines.append(line)
+    lines = labels_to_text(export).split('\n')[:-1]
         
     # Verificar que la cantidad de lineas coincide con la cantidad de labels
     if not len(lines) == len(export):
@@ -31,6 +32,187 @@ def label_to_str(export: pd.DataFrame) -> list[str]:
     return lines
 
 
+def labels_to_text(export: pd.DataFrame | np.ndarray, precision: int | None = None) -> str:
+    """
+    Formats a whole label table as YOLO text in a single pass.
+
+    The class column is written as an integer and the remaining columns either
+    with their shortest representation (same output as the former row by row
+    loop) or with a fixed number of decimals.
+
+    Args:
+        export: DataFrame or 2D array with labels (class_id first).
+        precision: Number of decimals for the coordinates (default None keeps
+            the shortest representation of each value).
+
+    Returns:
+        Text with one label per line, each line ended by a newline.
+
+    Raises:
+        ValueError: If the labels are not a 2D table or precision is negative.
+    """
+    values = export.to_numpy() if isinstance(export, pd.DataFrame) else np.asarray(export)
+
+    if values.ndim != 2:
+        raise ValueError("❕Labels must be a 2D table with one row per box.")
+    if precision is not None and (not isinstance(precision, int) or precision < 0):
+        raise ValueError("❕Precision must be a non-negative integer or None.")
+
+    n_rows, n_cols = values.shape
+    if n_rows == 0 or n_cols == 0:
+        return ''
+
+    # '%s' on Python scalars gives the same text as str() on each pandas cell
+    cell = '%s' if precision is None else f'%.{precision}f'
+
+    # One format operation for the whole table ('%d' truncates the class id like int())
+    line = '%d' + (' ' + cell) * (n_cols - 1) + '\n'
+    return (line * n_rows) % tuple(values.ravel().tolist())
+
+
+def is_structured(labels) -> bool:
+    """
+    Checks if the labels are a NumPy structured array (eg: a LabelStore slice).
+    """
+    return isinstance(labels, np.ndarray) and labels.dtype.names is not None
+
+
+def label_array(labels: pd.DataFrame | np.ndarray) -> np.ndarray:
+    """
+    YOLO labels (DataFrame, structured array or (N, 5) array) as a float64 (N, 5) array.
+    """
+    if isinstance(labels, pd.DataFrame):
+        return labels[list(LABEL_DTYPE.names)].to_numpy(dtype=np.float64)
+    if is_structured(labels):
+        return np.column_stack([labels[field].astype(np.float64) for field in LABEL_DTYPE.names]).reshape(-1, 5)
+    return np.asarray(labels, dtype=np.float64).reshape(-1, 5)
+
+
+# BOX KERNELS
+# NumPy kernels over (N, 4) float arrays (float32 by default, the dtype of the input is kept).
+# Every kernel accepts out= (which can be the input itself) to chain conversions without temporaries.
+
+ROUNDING = ('none', 'rint', 'floor', 'ceil', 'trunc')
+_ROUNDING_UFUNCS = {'rint': np.rint, 'floor': np.floor, 'ceil': np.ceil, 'trunc': np.trunc}
+
+
+def as_boxes(boxes, dtype: np.dtype | None = None) -> np.ndarray:
+    """
+    Boxes as a C-contiguous (N, 4) floating array (float32 unless the input already is floating).
+    """
+    boxes = np.asarray(boxes)
+    if dtype is None:
+        dtype = boxes.dtype if np.issubdtype(boxes.dtype, np.floating) else np.float32
+    return np.ascontiguousarray(boxes, dtype=dtype).reshape(-1, 4)
+
+
+def _output(boxes: np.ndarray, out: np.ndarray | None) -> np.ndarray:
+    if out is None:
+        return np.empty_like(boxes)
+    if out.shape != boxes.shape:
+        raise ValueError(f"❕'out' must have shape {boxes.shape} (got {out.shape}).")
+    return out
+
+
+def round_boxes(boxes: np.ndarray, rounding: str = 'rint', out: np.ndarray | None = None) -> np.ndarray:
+    """
+    Rounds coordinates with an explicit policy.
+
+    Args:
+        rounding: 'none', 'rint' (half to even, like DataFrame.round), 'floor', 'ceil'
+            or 'trunc' (towards zero, like astype(int)).
+    """
+    if rounding not in ROUNDING:
+        raise ValueError(f"❕Invalid 'rounding': must be one of {ROUNDING}.")
+    if rounding == 'none':
+        if out is not None and out is not boxes:
+            np.copyto(out, boxes)
+            return out
+        return boxes
+    return _ROUNDING_UFUNCS[rounding](boxes, out=_output(boxes, out))
+
+
+def xywh_to_xyxy(boxes: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+    """
+    (x_center, y_center, width, height) -> (x0, y0, x1, y1).
+    """
+    out = _output(boxes, out)
+    half = boxes[:, 2:] / 2  # Only (N, 2) temporary, so out can be boxes
+    np.add(boxes[:, :2], half, out=out[:, 2:])
+    np.subtract(boxes[:, :2], half, out=out[:, :2])
+    return out
+
+
+def xyxy_to_xywh(boxes: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+    """
+    (x0, y0, x1, y1) -> (x_center, y_center, width, height).
+    """
+    out = _output(boxes, out)
+    size = boxes[:, 2:] - boxes[:, :2]
+    np.add(boxes[:, :2], boxes[:, 2:], out=out[:, :2])
+    out[:, :2] /= 2
+    out[:, 2:] = size
+    return out
+
+
+def scale_boxes(boxes: np.ndarray, sx: float, sy: float, out: np.ndarray | None = None) -> np.ndarray:
+    """
+    Multiplies x coordinates by sx and y coordinates by sy (eg: relative -> absolute).
+    """
+    return np.multiply(boxes, np.array([sx, sy, sx, sy], dtype=boxes.dtype), out=_output(boxes, out))
+
+
+def translate_boxes(boxes: np.ndarray, dx: float, dy: float, out: np.ndarray | None = None) -> np.ndarray:
+    """
+    Adds (dx, dy) to corner coordinates (eg: to tile-local with the negated tile origin).
+    """
+    return np.add(boxes, np.array([dx, dy, dx, dy], dtype=boxes.dtype), out=_output(boxes, out))
+
+
+def yolo_to_xyxy(boxes: np.ndarray, im_height: int, im_width: int, origin: tuple = (0, 0),
+                 rounding: str = 'none', out: np.ndarray | None = None) -> np.ndarray:
+    """
+    Fused relative (x_center, y_center, width, height) -> absolute (x0, y0, x1, y1) -> local to origin.
+
+    Args:
+        boxes: (N, 4) YOLO coordinates (relative to the image).
+        im_height, im_width: Image size in pixels.
+        origin: (x, y) subtracted from the result (eg: tile origin to get tile-local boxes).
+        rounding: Rounding policy of the result (see round_boxes).
+        out: Output array (can be boxes).
+    """
+    out = scale_boxes(boxes, im_width, im_height, out)
+    xywh_to_xyxy(out, out)
+    if origin[0] or origin[1]:
+        translate_boxes(out, -origin[0], -origin[1], out)
+    return round_boxes(out, rounding, out)
+
+
+def xyxy_to_yolo(boxes: np.ndarray, im_height: int, im_width: int, origin: tuple = (0, 0),
+                 out: np.ndarray | None = None) -> np.ndarray:
+    """
+    Fused inverse of yolo_to_xyxy: absolute (x0, y0, x1, y1) local to origin -> relative YOLO.
+    """
+    out = _output(boxes, out)
+    if origin[0] or origin[1]:
+        translate_boxes(boxes, origin[0], origin[1], out)
+    else:
+        np.copyto(out, boxes)
+    xyxy_to_xywh(out, out)
+    return np.divide(out, np.array([im_width, im_height, im_width, im_height], dtype=out.dtype), out=out)
+
+
+def _to_structured(dtype: np.dtype, **columns) -> np.ndarray:
+    """
+    Builds a structured array from equally sized columns (casting to the field types).
+    """
+    size = len(next(iter(columns.values())))
+    output = np.empty(size, dtype=dtype)
+    for field, values in columns.items():
+        output[field] = values
+    return output
+
+
 def get_index(row:int , column:int ) -> int:
     """
     Calcula el índice lineal en una estructura de datos de los mosaicos definidos en el setup inicial.
@@ -56,17 +238,19 @@ def to_origin(labels: pd.DataFrame, coord: list):
     """
     Lleva las coordenadas a la ordenada para que la gráfica sea comparativa
     """
+    boxes = labels[['x0', 'y0', 'x1', 'y1']].to_numpy().astype(np.int64)  # Trunca como astype(int)
+    translate_boxes(boxes, -coord[0], -coord[1], boxes)
     labels = labels.copy()
-    labels[['x0', 'y0', 'x1', 'y1']] = labels[['x0', 'y0', 'x1', 'y1']].astype(int)
-    labels[['x0', 'y0', 'x1', 'y1']] -= coord * 2
+    labels[['x0', 'y0', 'x1', 'y1']] = boxes
     return labels
 
-def label_transform(df_labels: pd.DataFrame, mode: str, im_height: int, im_width: int, round: bool = True) -> pd.DataFrame:
+def label_transform(df_labels: pd.DataFrame | np.ndarray, mode: str, im_height: int, im_width: int, round: bool = True) -> pd.DataFrame | np.ndarray:
     """
     Transforms bounding box coordinates based on the specified mode.
 
     Args:
-        df_labels: DataFrame containing bounding box coordinates (x, y, width, height).
+        df_labels: DataFrame containing bounding box coordinates (x, y, width, height),
+            or a structured array with LABEL_DTYPE fields (returns the same kind).
         mode: Transformation mode ('absolute' or 'relative').
         im_height: Image height in pixels.
         im_width: Image width in pixels.
@@ -83,83 +267,127 @@ def label_transform(df_labels: pd.DataFrame, mode: str, im_height: int, im_width
     assert isinstance(im_width, int), "Dimensions should be int numbers."
     assert isinstance(im_height, int), "Dimensions should be int numbers."
     assert isinstance(mode, str), "Mode should be a string"    
-    assert isinstance(df_labels, pd.DataFrame), "df_labels must be a pandas DataFrame"
+    assert isinstance(df_labels, pd.DataFrame) or is_structured(df_labels), "df_labels must be a pandas DataFrame or a structured array"
 
     if im_height == 0 or im_width == 0:
         raise ValueError("❕Debe introducir las dimensiones de la imagen (no pueden ser 0).")
+    if is_structured(df_labels):
+        return _label_transform_array(df_labels, mode, im_height, im_width, round)
+    if mode not in ('absolute', 'relative'):
+        raise ValueError("❕Debe indicar el modo de transformación deseado ('absolute' o 'relative')")
+
+    # A single float64 copy of the table, scaled and rounded in place
+    values = df_labels.to_numpy(dtype=np.float64, copy=True)
+    coords = values[:, 1:]
     if mode == 'absolute':
-        df_labels_abs = df_labels * [1, im_width, im_height, im_width, im_height]
+        scale_boxes(coords, im_width, im_height, coords)
         if round:
-            df_labels_abs = df_labels_abs.round(0).astype(int)
-        df_labels_abs['class_id'] = df_labels_abs['class_id'].astype(int)
-        return df_labels_abs
+            round_boxes(coords, 'rint', coords)
+            values = values.astype(int)
+    else:
+        np.divide(coords, [im_width, im_height, im_width, im_height], out=coords)
+
+    output = pd.DataFrame(values, index=df_labels.index, columns=df_labels.columns)
+    output['class_id'] = output['class_id'].astype(int)
+    return output
+
+
+def _label_transform_array(labels: np.ndarray, mode: str, im_height: int, im_width: int, round: bool) -> np.ndarray:
+    """
+    label_transform for structured arrays, computed field by field without pandas.
+    """
+    if mode == 'absolute':
+        operation = np.multiply
+        coord_type = np.int32 if round else np.float32
     elif mode == 'relative':
-        df_labels_rel = df_labels / [1, im_width, im_height, im_width, im_height]
-        df_labels_rel['class_id'] = df_labels_rel['class_id'].astype(int)
-        return df_labels_rel
+        operation = np.divide
+        coord_type = np.float32
     else:
         raise ValueError("❕Debe indicar el modo de transformación deseado ('absolute' o 'relative')")
 
+    def scale(values: np.ndarray, size: int) -> np.ndarray:
+        # float64 intermediates, like the pandas path
+        scaled = operation(values.astype(np.float64), size)
+        return np.round(scaled) if coord_type is np.int32 else scaled
+
+    dtype = np.dtype([('class_id', np.uint16), ('x_center', coord_type), ('y_center', coord_type),
+                      ('width', coord_type), ('height', coord_type)])
+    return _to_structured(dtype,
+                          class_id=labels['class_id'],
+                          x_center=scale(labels['x_center'], im_width),
+                          y_center=scale(labels['y_center'], im_height),
+                          width=scale(labels['width'], im_width),
+                          height=scale(labels['height'], im_height))
 
-def lbl_to_bb(df_input: pd.DataFrame) -> pd.DataFrame:
+
+def lbl_to_bb(df_input: pd.DataFrame | np.ndarray) -> pd.DataFrame | np.ndarray:
 
     """
     Transforma un DataFrame de 'Etiquetas' a 'Bounding Boxes'.
     
     Args:
         df_input: Dataframe de coordenadas de Labels (x, y, width, height).
+            También acepta un array estructurado (devuelve uno con BB_DTYPE).
         
     Returns:
         df_output: Dataframe de coordenadas de Bounding Boxes (x0, y0, x1, y1).
     """
     
-    # Extraer los valores como arrays NumPy (evita el overhead de Pandas)
-    class_id = df_input['class_id'].values
-    x_center, y_center = df_input[['x_center', 'y_center']].to_numpy().T
-    width, height = df_input[['width', 'height']].to_numpy().T
-
-    # Calcular coordenadas de bounding box de manera vectorizada
-    x0 = x_center - width / 2
-    x1 = x_center + width / 2
-    y0 = y_center - height / 2
-    y1 = y_center + height / 2
-
-
-    # Crear el DataFrame con los resultados optimizados
-    return pd.DataFrame({'class_id': class_id, 'x0': x0, 'x1': x1, 'y0': y0, 'y1': y1}).astype(int)
-
-
-def bb_to_lbl(df_input: pd.DataFrame) -> pd.DataFrame:
+    if is_structured(df_input):
+        half_w = df_input['width'] / 2
+        half_h = df_input['height'] / 2
+        return _to_structured(BB_DTYPE,
+                              class_id=df_input['class_id'],
+                              x0=df_input['x_center'] - half_w,
+                              x1=df_input['x_center'] + half_w,
+                              y0=df_input['y_center'] - half_h,
+                              y1=df_input['y_center'] + half_h)
+
+    # Kernel sobre un único array (N, 4) y truncado como astype(int)
+    boxes = df_input[['x_center', 'y_center', 'width', 'height']].to_numpy(dtype=np.float64, copy=True)
+    xywh_to_xyxy(boxes, boxes)
+    boxes = boxes.astype(int)
+
+    return pd.DataFrame({'class_id': df_input['class_id'].to_numpy().astype(int),
+                         'x0': boxes[:, 0], 'x1': boxes[:, 2], 'y0': boxes[:, 1], 'y1': boxes[:, 3]})
+
+
+def bb_to_lbl(df_input: pd.DataFrame | np.ndarray) -> pd.DataFrame | np.ndarray:
     
     """
     Transforma un DataFrame de 'Bounding Boxes' a 'Etiquetas'.
     
     Args:
         df_input: Dataframe de coordenadas de Bounding Boxes (x0, y0, x1, y1).
+            También acepta un array estructurado (devuelve uno con campos enteros).
         
     Returns:
         df_output:  Dataframe de coordenadas de Labels (x, y, width, height).
 
     """
 
-    # Extraer los valores de las coordenadas de los Bounding Boxes como arrays NumPy
-    class_id = df_input['class_id'].values
-    x0, x1 = df_input['x0'].values, df_input['x1'].values
-    y0, y1 = df_input['y0'].values, df_input['y1'].values
-
-    # Calcular las coordenadas del centro usando NumPy
-    x_center = np.ceil((x0 + x1) / 2)
-    y_center = np.ceil((y0 + y1) / 2)
-
-    # Calcular el ancho (width) y la altura (height) usando NumPy
-    width = x1 - x0
-    height = y1 - y0
+    if is_structured(df_input):
+        x0, x1 = df_input['x0'], df_input['x1']
+        y0, y1 = df_input['y0'], df_input['y1']
+        dtype = np.dtype([('class_id', np.uint16), ('x_center', np.int32), ('y_center', np.int32),
+                          ('width', np.int32), ('height', np.int32)])
+        return _to_structured(dtype,
+                              class_id=df_input['class_id'],
+                              x_center=np.ceil((x0 + x1) / 2),
+                              y_center=np.ceil((y0 + y1) / 2),
+                              width=x1 - x0,
+                              height=y1 - y0)
+
+    # Kernel sobre un único array (N, 4): centro redondeado hacia arriba, el resto truncado
+    boxes = df_input[['x0', 'y0', 'x1', 'y1']].to_numpy(dtype=np.float64, copy=True)
+    xyxy_to_xywh(boxes, boxes)
+    round_boxes(boxes[:, :2], 'ceil', boxes[:, :2])
+    boxes = boxes.astype(int)
 
-    # Crear el DataFrame con los resultados optimizados usando NumPy
     return pd.DataFrame({
-        'class_id': class_id, 
-        'x_center': x_center, 
-        'y_center': y_center, 
-        'width': width, 
-        'height': height
-    }).astype(int)
\ No newline at end of file
+        'class_id': df_input['class_id'].to_numpy().astype(int),
+        'x_center': boxes[:, 0],
+        'y_center': boxes[:, 1],
+        'width': boxes[:, 2],
+        'height': boxes[:, 3]
+    })
\ No newline at end of file
@@ -0,0 +1,203 @@
+# IMAGES MODULE
+# Decoded image access shared by tiling, rendering and statistics.
+#
+# Decoded images are kept in a byte-budgeted LRU cache and returned read-only, so every
+# crop handed out is a view of the same parent array instead of a copy.
+
+# Standard library imports
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import cv2 as cv
+
+
+# reduce factor -> imread flag (color, grayscale); libjpeg scales the reduced modes while decoding
+_READ_FLAGS = {
+    1: (cv.IMREAD_COLOR, cv.IMREAD_GRAYSCALE),
+    2: (cv.IMREAD_REDUCED_COLOR_2, cv.IMREAD_REDUCED_GRAYSCALE_2),
+    4: (cv.IMREAD_REDUCED_COLOR_4, cv.IMREAD_REDUCED_GRAYSCALE_4),
+    8: (cv.IMREAD_REDUCED_COLOR_8, cv.IMREAD_REDUCED_GRAYSCALE_8),
+}
+DEFAULT_CACHE_MB = int(os.environ.get('VISIONRICE_IMAGE_CACHE_MB', 256))
+
+
+class ImageCache:
+    """
+    LRU cache of decoded images limited by their total size in bytes.
+
+    Entries are keyed by path, decode mode, size and modification time, so an edited
+    file is decoded again. An image larger than the whole budget is returned but not kept.
+
+    Args:
+        max_bytes: Memory budget for the decoded pixels (0 disables the cache).
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_MB * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: tuple) -> np.ndarray | None:
+        with self._lock:
+            image = self._entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key: tuple, image: np.ndarray):
+        if image.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous.nbytes
+            self._entries[key] = image
+            self.bytes += image.nbytes
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Hit/miss/eviction counters and current usage.
+        """
+        requests = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hits / requests if requests else 0.0,
+                'entries': len(self._entries), 'bytes': self.bytes, 'max_bytes': self.max_bytes}
+
+
+# Shared by every module of the process (each pool worker has its own)
+CACHE = ImageCache()
+
+
+def read_image(image_path: str, reduce: int = 1, color: bool = True, cache: ImageCache | None | bool = True) -> np.ndarray:
+    """
+    Decodes an image, reusing the cached pixels when the file was already read.
+
+    Args:
+        image_path: Path of the image.
+        reduce: Decode at 1/reduce resolution (1, 2, 4 or 8), much faster for previews or statistics.
+        color: BGR (True) or grayscale (False).
+        cache: True uses the shared CACHE, False skips caching, or a specific ImageCache.
+
+    Returns:
+        Read-only array (cached images are shared: copy it before drawing in place).
+
+    Raises:
+        FileNotFoundError: If the image does not exist or can not be decoded.
+    """
+    if reduce not in _READ_FLAGS:
+        raise ValueError(f"❕Invalid 'reduce': must be one of {tuple(_READ_FLAGS)}.")
+    cache = CACHE if cache is True else (cache if isinstance(cache, ImageCache) else None)  # An empty cache is falsy
+
+    key = None
+    if cache is not None:
+        try:
+            stat = os.stat(image_path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"❗️No se pudo leer la imagen '{image_path}'.") from None
+        key = (image_path, reduce, color, stat.st_size, stat.st_mtime_ns)
+        image = cache.get(key)
+        if image is not None:
+            return image
+
+    image = cv.imread(image_path, _READ_FLAGS[reduce][0 if color else 1])
+    if image is None:
+        raise FileNotFoundError(f"❗️No se pudo leer la imagen '{image_path}'.")
+    image.setflags(write=False)
+
+    if cache is not None:
+        cache.put(key, image)
+    return image
+
+
+def _exif_orientation(segment: bytes) -> int:
+    """
+    Orientation tag (1-8) of the payload of a JPEG APP1 segment (1 when it has none).
+    """
+    if not segment.startswith(b'Exif\x00\x00') or len(segment) < 14:
+        return 1
+    tiff = segment[6:]
+    order = {b'II': 'little', b'MM': 'big'}.get(tiff[:2])
+    if order is None:
+        return 1
+    ifd = int.from_bytes(tiff[4:8], order)
+    if ifd + 2 > len(tiff):
+        return 1
+    for entry in range(int.from_bytes(tiff[ifd:ifd + 2], order)):
+        start = ifd + 2 + 12 * entry
+        if start + 12 > len(tiff):
+            break
+        if int.from_bytes(tiff[start:start + 2], order) == 0x0112:  # Orientation (SHORT)
+            return int.from_bytes(tiff[start + 8:start + 10], order)
+    return 1
+
+
+def image_size(image_path: str) -> tuple[int, int]:
+    """
+    (height, width) of an image without decoding it (JPEG header; other formats are decoded).
+
+    Like cv.imread, the EXIF orientation is applied: rotated photos (orientations 5-8) get
+    their height and width swapped.
+    """
+    with open(image_path, 'rb') as file:
+        if file.read(2) == b'\xff\xd8':
+            orientation = 1
+            # Walks the JPEG markers up to the frame header (SOF0..SOF15 except DHT/JPG/DAC)
+            while True:
+                marker = file.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    break
+                if marker[1] in (0x01, 0xFF) or 0xD0 <= marker[1] <= 0xD7:
+                    continue
+                length = int.from_bytes(file.read(2), 'big')
+                if marker[1] == 0xE1 and orientation == 1:  # APP1: Exif comes before the frame header
+                    orientation = _exif_orientation(file.read(length - 2))
+                    continue
+                if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                    header = file.read(5)
+                    height, width = int.from_bytes(header[1:3], 'big'), int.from_bytes(header[3:5], 'big')
+                    return (width, height) if 5 <= orientation <= 8 else (height, width)
+                file.seek(length - 2, os.SEEK_CUR)
+
+    return read_image(image_path, cache=False).shape[:2]
+
+
+def crop(image: np.ndarray, coord: tuple | list) -> np.ndarray:
+    """
+    Region (x0, y0, x1, y1) of an image as a view (no pixels are copied).
+    """
+    x0, y0, x1, y1 = (int(value) for value in coord)
+    return image[y0:y1, x0:x1]
+
+
+def crops(image: np.ndarray, coords: np.ndarray) -> list[np.ndarray]:
+    """
+    Views of many regions (eg: every tile of tiling.tile_grid) of the same parent image.
+    """
+    return [image[y0:y1, x0:x1] for x0, y0, x1, y1 in np.asarray(coords).tolist()]
+
+
+def cache_info() -> dict:
+    """
+    Counters of the shared cache.
+    """
+    return CACHE.stats()
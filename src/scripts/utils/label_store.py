@@ -0,0 +1,235 @@
+# LABEL STORE MODULE
+
+# Standard library imports
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# Local modules
+from utils import file_management
+from utils.format import LABEL_DTYPE
+
+
+CACHE_MAGIC = b'VRLABEL1'
+CACHE_ALIGN = 64
+CACHE_SUFFIX = '.npcache'  # 'labels.cache' is already used by Ultralytics
+
+
+class LabelStore:
+    """
+    Boxes of a whole labels folder in one contiguous structured array.
+
+    Attributes:
+        boxes: Structured array (LABEL_DTYPE) with the boxes of every file, file after file.
+        offsets: int64 array of len(names) + 1; boxes of file i are boxes[offsets[i]:offsets[i + 1]].
+        names: Label filenames without extension (same order as offsets).
+        signature: Fingerprint of the folder the store was parsed from.
+    """
+
+    def __init__(self, boxes: np.ndarray, offsets: np.ndarray, names: list[str], signature: str = ''):
+        if len(offsets) != len(names) + 1 or offsets[-1] != len(boxes):
+            raise ValueError("❕Offsets do not match the number of files and boxes.")
+        self.boxes = boxes
+        self.offsets = offsets
+        self.names = names
+        self.signature = signature
+        self._lookup = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, key: int | str) -> np.ndarray:
+        """
+        Boxes of one file (by position or name) as a view of the shared array.
+        """
+        i = self.index(key) if isinstance(key, str) else key
+        return self.boxes[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self):
+        for i in range(len(self.names)):
+            yield self.names[i], self[i]
+
+    def index(self, name: str) -> int:
+        """
+        Position of a label file in the store (name without extension).
+        """
+        if self._lookup is None:
+            self._lookup = {n: i for i, n in enumerate(self.names)}
+        return self._lookup[name]
+
+    @property
+    def counts(self) -> np.ndarray:
+        """
+        Number of boxes in each file.
+        """
+        return np.diff(self.offsets)
+
+    @property
+    def file_ids(self) -> np.ndarray:
+        """
+        Position of the owning file for every box.
+        """
+        return np.repeat(np.arange(len(self.names), dtype=np.int64), self.counts)
+
+    def to_dataframe(self, key: int | str | None = None) -> pd.DataFrame:
+        """
+        Boxes of one file (or all of them) as the usual labels DataFrame.
+        """
+        boxes = self.boxes if key is None else self[key]
+        return pd.DataFrame({field: boxes[field] for field in LABEL_DTYPE.names})
+
+    def save(self, cache_path: str):
+        """
+        Writes the store to a cache file that can be memory-mapped by LabelStore.open.
+        """
+        header = json.dumps({
+            'n_files': len(self.names),
+            'n_boxes': int(len(self.boxes)),
+            'names': self.names,
+            'signature': self.signature,
+        }).encode()
+        preamble = len(CACHE_MAGIC) + 8 + len(header)
+        padding = -preamble % CACHE_ALIGN
+
+        # Written aside and renamed, so a crash never leaves a half written cache
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(CACHE_MAGIC)
+            file.write(len(header).to_bytes(8, 'little'))
+            file.write(header)
+            file.write(b'\0' * padding)
+            file.write(np.ascontiguousarray(self.offsets, dtype='<i8').tobytes())
+            file.write(np.ascontiguousarray(self.boxes, dtype=LABEL_DTYPE).tobytes())
+        os.replace(tmp_path, cache_path)
+
+    @classmethod
+    def open(cls, cache_path: str, mmap: bool = True) -> 'LabelStore':
+        """
+        Opens a cache file written by save (memory-mapped by default, no text parsing).
+        """
+        with open(cache_path, 'rb') as file:
+            if file.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+                raise ValueError(f"❕'{cache_path}' is not a label cache file.")
+            header_size = int.from_bytes(file.read(8), 'little')
+            header = json.loads(file.read(header_size))
+
+        start = len(CACHE_MAGIC) + 8 + header_size
+        start += -start % CACHE_ALIGN
+        n_offsets = header['n_files'] + 1
+        boxes_start = start + n_offsets * 8
+
+        if mmap:
+            offsets = np.memmap(cache_path, dtype='<i8', mode='r', offset=start, shape=(n_offsets,))
+            boxes = (np.memmap(cache_path, dtype=LABEL_DTYPE, mode='r', offset=boxes_start, shape=(header['n_boxes'],))
+                     if header['n_boxes'] else np.empty(0, dtype=LABEL_DTYPE))
+        else:
+            with open(cache_path, 'rb') as file:
+                file.seek(start)
+                offsets = np.fromfile(file, dtype='<i8', count=n_offsets)
+                boxes = np.fromfile(file, dtype=LABEL_DTYPE, count=header['n_boxes'])
+
+        return cls(boxes, offsets, header['names'], header['signature'])
+
+
+def _label_files(folder: str) -> list[os.DirEntry]:
+    """
+    Label files ('.txt') of a folder, sorted by name.
+    """
+    with os.scandir(folder) as entries:
+        files = [entry for entry in entries if entry.name.endswith('.txt') and entry.is_file()]
+    return sorted(files, key=lambda entry: entry.name)
+
+
+def folder_signature(files: list[os.DirEntry]) -> str:
+    """
+    Cheap fingerprint of a labels folder (names, sizes and modification times, no reads).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for entry in files:
+        stat = entry.stat()
+        digest.update(f"{entry.name}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def parse_labels(contents: list[bytes]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Parses the text of many YOLO label files at once.
+
+    Args:
+        contents: Raw content of each label file.
+
+    Returns:
+        (boxes, offsets): Structured array with LABEL_DTYPE and the int64 offsets of each file.
+
+    Raises:
+        ValueError: If a file does not have 5 values per box.
+    """
+    tokens = []
+    counts = np.empty(len(contents), dtype=np.int64)
+    for i, content in enumerate(contents):
+        values = content.split()
+        if len(values) % 5:
+            raise ValueError(f"❕Label file #{i} does not have 5 values per box ({len(values)} values).")
+        counts[i] = len(values) // 5
+        tokens.extend(values)
+
+    offsets = np.zeros(len(contents) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    # A single conversion for every value of every file
+    values = np.array(tokens, dtype=np.float64).reshape(-1, 5)
+    boxes = np.empty(len(values), dtype=LABEL_DTYPE)
+    for column, field in enumerate(LABEL_DTYPE.names):
+        boxes[field] = values[:, column]
+
+    return boxes, offsets
+
+
+def load_labels(folder: str, cache: str | bool | None = None, refresh: bool = False) -> LabelStore:
+    """
+    Loads every label file of a folder into a single LabelStore.
+
+    Args:
+        folder: Labels folder (eg: build_filename(dset, 'label')).
+        cache: Path of the cache file, True for '<folder>.npcache' or None to always parse.
+        refresh: Ignores an existing cache and parses the text files again.
+
+    Returns:
+        LabelStore with the boxes of all the files (sorted by name).
+    """
+    if not os.path.isdir(folder):
+        raise FileNotFoundError(f"❗️La carpeta '{folder}' no existe.")
+
+    if cache is True:
+        cache = folder.rstrip('/') + CACHE_SUFFIX
+
+    files = _label_files(folder)
+    signature = folder_signature(files)
+
+    # The cache is only reused while the folder still has the same files
+    if cache and not refresh and os.path.exists(cache):
+        store = LabelStore.open(cache)
+        if store.signature == signature:
+            return store
+
+    contents = []
+    for entry in files:
+        with open(entry.path, 'rb') as file:
+            contents.append(file.read())
+
+    boxes, offsets = parse_labels(contents)
+    store = LabelStore(boxes, offsets, [entry.name[:-len('.txt')] for entry in files], signature)
+
+    if cache:
+        store.save(cache)
+    return store
+
+
+def load_split(dset: str, dir: str = 'in', cache: str | bool | None = None, refresh: bool = False) -> LabelStore:
+    """
+    Loads the labels folder of a dataset split ('train', 'valid' or 'test').
+    """
+    folder = file_management.build_filename(dset=dset, type='label', dir=dir)
+    return load_labels(folder, cache=cache, refresh=refresh)
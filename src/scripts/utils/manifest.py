@@ -0,0 +1,185 @@
+# MANIFEST MODULE
+# Keeps track of which inputs were already processed, so the pipeline can run incrementally.
+
+# Standard library imports
+import hashlib
+import json
+import os
+
+
+MANIFEST_NAME = 'manifest.jsonl'
+
+
+def params_key(params: dict) -> str:
+    """
+    Stable identifier of a set of processing parameters.
+    """
+    return hashlib.blake2b(json.dumps(params, sort_keys=True).encode(), digest_size=8).hexdigest()
+
+
+def file_digest(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Content hash of a file (read in chunks).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as file:
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def input_hash(image_path: str, label_path: str) -> str:
+    """
+    Fingerprint of an input image and its labels.
+
+    Roboflow filenames already carry the image content hash ('<name>.rf.<hash>.jpg'), which
+    avoids reading big photos again; other images are hashed. Label files are small and
+    always hashed, since they can be edited without renaming the image.
+    """
+    name = os.path.basename(image_path)
+    pointer = name.find('.rf.')
+    image_part = name[pointer + 4:].rsplit('.', 1)[0] if pointer != -1 else file_digest(image_path)
+    label_part = file_digest(label_path) if os.path.exists(label_path) else '-'
+    return f"{image_part}:{label_part}"
+
+
+def read_journal(path: str) -> list[dict]:
+    """
+    Records of a JSON lines journal (empty if it does not exist).
+
+    A last line cut by a crash is dropped and the file is truncated after the last complete
+    record, so the next appended record starts on its own line.
+    """
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, 'rb+') as file:
+        end = 0
+        for line in file:
+            try:
+                if not line.endswith(b'\n'):
+                    raise ValueError
+                records.append(json.loads(line))
+            except ValueError:  # Also json.JSONDecodeError and UnicodeDecodeError
+                file.truncate(end)
+                break
+            end += len(line)
+    return records
+
+
+class Manifest:
+    """
+    Journal of processed inputs: hash, processing parameters and outputs of each one.
+
+    Every change is appended to a JSON lines file and flushed at once, so after a crash
+    the finished inputs are still recorded and only the rest is processed again.
+    The journal is rewritten with one line per input by compact().
+
+    Args:
+        folder: Output folder where the manifest is kept.
+        params: Processing parameters (any change invalidates every entry).
+        verify_outputs: is_current also checks that every recorded output still exists
+            (one stat per output file).
+    """
+
+    def __init__(self, folder: str, params: dict, verify_outputs: bool = False):
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self.params = params_key(params)
+        self.verify_outputs = verify_outputs
+        self.entries = {}
+        self._journal = None
+
+        for record in read_journal(self.path):
+            if record.get('removed'):
+                self.entries.pop(record['key'], None)
+            else:
+                self.entries[record['key']] = record
+
+    def __enter__(self) -> 'Manifest':
+        return self
+
+    def __exit__(self, *exc):
+        self.compact()
+
+    def _append(self, record: dict):
+        if self._journal is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._journal = open(self.path, 'a')
+        self._journal.write(json.dumps(record) + '\n')
+        self._journal.flush()
+
+    def is_current(self, key: str, content_hash: str) -> bool:
+        """
+        True if the input was already processed with the same content and parameters.
+        """
+        entry = self.entries.get(key)
+        return (entry is not None
+                and entry['hash'] == content_hash
+                and entry['params'] == self.params
+                and (not self.verify_outputs or all(os.path.exists(path) for path in entry['outputs'])))
+
+    def record(self, key: str, content_hash: str, outputs: list[str]):
+        """
+        Registers a finished input. Outputs of a previous run that were not produced again are deleted.
+        """
+        previous = self.entries.get(key)
+        if previous:
+            _remove_files(set(previous['outputs']) - set(outputs))
+        entry = {'key': key, 'hash': content_hash, 'params': self.params, 'outputs': outputs}
+        self.entries[key] = entry
+        self._append(entry)
+
+    def forget(self, keys) -> list[str]:
+        """
+        Forgets the entries of these inputs (their outputs are left alone), so they are processed again.
+
+        Returns:
+            Keys removed.
+        """
+        forgotten = [key for key in keys if key in self.entries]
+        for key in forgotten:
+            del self.entries[key]
+            self._append({'key': key, 'removed': True})
+        return forgotten
+
+    def remove_orphans(self, keys: set[str], scope: tuple[str, ...] | None = None) -> list[str]:
+        """
+        Forgets the entries whose input no longer exists and deletes their outputs.
+
+        Args:
+            keys: Keys of the current inputs.
+            scope: Only entries whose key starts with one of these prefixes are checked
+                (eg: the splits being processed).
+
+        Returns:
+            Keys removed.
+        """
+        orphans = [key for key in self.entries
+                   if key not in keys and (scope is None or key.startswith(scope))]
+        for key in orphans:
+            _remove_files(self.entries.pop(key)['outputs'])
+            self._append({'key': key, 'removed': True})
+        return orphans
+
+    def compact(self):
+        """
+        Rewrites the journal with the current entries only (atomic replace).
+        """
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if not self.entries and not os.path.exists(self.path):
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as file:
+            for key in sorted(self.entries):
+                file.write(json.dumps(self.entries[key]) + '\n')
+        os.replace(tmp_path, self.path)
+
+
+def _remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
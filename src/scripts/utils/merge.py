@@ -0,0 +1,232 @@
+# MERGE MODULE
+# Stitches per-tile detections back into whole-image detections and counts.
+#
+# Detections use the Ultralytics 'boxes.data' layout: float (K, 6) arrays with
+# (x0, y0, x1, y1, conf, class_id) in pixels of the tile they were predicted on.
+
+# Standard library imports
+import numpy as np
+
+# Local modules
+from utils import performance, tiling
+
+
+METHODS = ('nms', 'wbf')
+
+
+def to_global(tile_detections: list[np.ndarray] | dict[int, np.ndarray], tiles: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Moves the detections of every tile to image coordinates (inverse of to_origin).
+
+    Args:
+        tile_detections: Detections per tile, as a list in get_index order or a dict
+            {get_index: detections} (tiles without detections can be left out).
+        tiles: Tile coordinates (x0, y0, x1, y1) from tiling.tile_grid.
+
+    Returns:
+        (detections, tile_index): float64 (N, 6) detections in image pixels and the tile of each one.
+    """
+    items = tile_detections.items() if isinstance(tile_detections, dict) else enumerate(tile_detections)
+    parts, owners = [], []
+    for index, detections in items:
+        detections = np.asarray(detections, dtype=np.float64).reshape(-1, 6)
+        parts.append(detections)
+        owners.append(np.full(len(detections), index, dtype=np.int64))
+    if not parts:
+        return np.empty((0, 6)), np.empty(0, dtype=np.int64)
+
+    detections = np.concatenate(parts)
+    tile_index = np.concatenate(owners)
+    origin = np.asarray(tiles, dtype=np.float64)[tile_index, :2]
+    detections[:, 0:4] += np.tile(origin, 2)
+    return detections, tile_index
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    IoU of the box pairs a[k], b[k] (both (K, 4) with x0, y0, x1, y1).
+    """
+    width = np.clip(np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0]), 0, None)
+    height = np.clip(np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1]), 0, None)
+    intersection = width * height
+    union = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1]) + (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1]) - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def _grid_pairs(queries: np.ndarray, pool: np.ndarray, cell: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Pairs (q, p) of local indices of query and pool boxes whose centers fall in the same or
+    neighbour cells of a grid of the given cell size.
+    """
+    centers = np.concatenate([queries[:, 0:2] + queries[:, 2:4], pool[:, 0:2] + pool[:, 2:4]]) / 2
+    grid = np.floor(centers / cell).astype(np.int64)
+    grid -= grid.min(axis=0) - 1  # Keeps neighbour cells of the border non-negative
+    stride = int(grid[:, 1].max()) + 2
+    keys = grid[:, 0] * stride + grid[:, 1]
+    query_keys, pool_keys = keys[:len(queries)], keys[len(queries):]
+
+    order = np.argsort(pool_keys, kind='stable')
+    sorted_keys = pool_keys[order]
+    firsts, seconds = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            target = query_keys + dx * stride + dy
+            lo = np.searchsorted(sorted_keys, target, side='left')
+            hi = np.searchsorted(sorted_keys, target, side='right')
+            counts = hi - lo
+            # Same range expansion as tiling.assign_boxes
+            firsts.append(np.repeat(np.arange(len(queries)), counts))
+            local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            seconds.append(order[np.repeat(lo, counts) + local])
+    return np.concatenate(firsts), np.concatenate(seconds)
+
+
+def candidate_pairs(boxes: np.ndarray, min_iou: float = 0.0) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Pairs (i, j), i < j, of boxes that may overlap, without comparing every box with every other.
+
+    Boxes are split in size classes by their largest side (powers of 2, or of 1/min_iou when
+    larger). The boxes of each class are looked up in a grid with cells as large as their
+    largest side, filled with the boxes of the same and smaller classes: two overlapping boxes
+    always have their centers in neighbour cells, and a few huge boxes do not inflate the
+    cells of the small ones. With min_iou > 0 only the previous class is added, since boxes
+    with IoU >= min_iou have sides within a factor 1/min_iou.
+
+    Args:
+        boxes: (x0, y0, x1, y1) array (cells are at least 1.0 wide).
+        min_iou: Minimum IoU the caller is looking for (0 keeps every overlapping pair).
+
+    Returns:
+        (first, second) int64 arrays.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    if len(boxes) < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    side = np.maximum((boxes[:, 2:4] - boxes[:, 0:2]).max(axis=1), 1.0)
+    base = max(2.0, 1 / min_iou) if min_iou > 0 else 2.0
+    size_class = np.floor(np.log(side) / np.log(base)).astype(np.int64)
+
+    firsts, seconds = [], []
+    for size in np.unique(size_class).tolist():
+        queries = np.flatnonzero(size_class == size)
+        in_pool = size_class <= size
+        if min_iou > 0:
+            in_pool &= size_class >= size - 1
+        pool = np.flatnonzero(in_pool)
+        q, p = _grid_pairs(boxes[queries], boxes[pool], float(side[queries].max()))
+        first, second = queries[q], pool[p]
+        # Pairs of the same class are found from both boxes: only one is kept
+        keep = (size_class[second] < size) | (first < second)
+        firsts.append(np.minimum(first[keep], second[keep]))
+        seconds.append(np.maximum(first[keep], second[keep]))
+    return np.concatenate(firsts), np.concatenate(seconds)
+
+
+def merge_detections(detections: np.ndarray, tile_index: np.ndarray | None = None, iou_threshold: float = 0.5,
+                     method: str = 'nms', class_agnostic: bool = False) -> np.ndarray:
+    """
+    Removes the duplicates of boxes predicted twice in the overlap of neighbour tiles.
+
+    Candidate pairs come from candidate_pairs (near-linear in the number of boxes) and the
+    suppression is the usual greedy NMS: a box is dropped when a kept box with a higher
+    confidence overlaps it more than iou_threshold.
+
+    Args:
+        detections: float (N, 6) detections in image pixels (see to_global).
+        tile_index: Tile of each detection; when given only boxes of different tiles are
+            merged (each tile was already deduplicated by the model).
+        iou_threshold: Minimum IoU to consider two boxes the same grain.
+        method: 'nms' keeps the best box, 'wbf' replaces it with the confidence-weighted
+            average of the boxes it suppressed (confidence: their mean).
+        class_agnostic: Merges boxes of different classes too.
+
+    Returns:
+        float64 (M, 6) detections, sorted by decreasing confidence.
+    """
+    if method not in METHODS:
+        raise ValueError(f"❕Invalid 'method': must be one of {METHODS}.")
+
+    detections = np.asarray(detections, dtype=np.float64).reshape(-1, 6)
+    order = np.argsort(-detections[:, 4], kind='stable')
+    detections = detections[order]
+    boxes = detections[:, 0:4]
+
+    first, second = candidate_pairs(boxes, iou_threshold)  # first < second: 'first' has the higher confidence
+    keep = np.ones(len(detections), dtype=bool)
+    if len(first):
+        valid = box_iou(boxes[first], boxes[second]) > iou_threshold
+        if not class_agnostic:
+            valid &= detections[first, 5] == detections[second, 5]
+        if tile_index is not None:
+            tiles = np.asarray(tile_index)[order]
+            valid &= tiles[first] != tiles[second]
+        first, second = first[valid], second[valid]
+
+    # Greedy NMS over the (few) overlapping pairs: sorted by the stronger box, a pair only
+    # suppresses when that box is still kept, which is final once its own pairs come up
+    owner = np.arange(len(detections))
+    pair_order = np.lexsort((second, first))
+    for i, j in zip(first[pair_order].tolist(), second[pair_order].tolist()):
+        if keep[i] and keep[j]:
+            keep[j] = False
+            owner[j] = i
+
+    if method == 'wbf' and not keep.all():
+        weights = detections[:, 4:5]
+        fused = np.zeros((len(detections), 4))
+        np.add.at(fused, owner, boxes * weights)
+        total = np.zeros(len(detections))
+        np.add.at(total, owner, weights[:, 0])
+        members = np.bincount(owner, minlength=len(detections))
+        merged = detections.copy()
+        merged[keep, 0:4] = fused[keep] / np.maximum(total[keep], 1e-12)[:, None]
+        merged[keep, 4] = total[keep] / members[keep]
+        return merged[keep]
+
+    return detections[keep]
+
+
+def merge_tiles(tile_detections: list[np.ndarray] | dict[int, np.ndarray], tiles: np.ndarray,
+                iou_threshold: float = 0.5, conf_threshold: float = 0.0, method: str = 'nms',
+                class_agnostic: bool = False) -> np.ndarray:
+    """
+    Per-tile detections -> deduplicated detections of the whole image.
+
+    Args:
+        tile_detections: Detections per tile (list in get_index order or {get_index: detections}).
+        tiles: Tile coordinates from tiling.tile_grid.
+        iou_threshold, method, class_agnostic: See merge_detections.
+        conf_threshold: Detections below this confidence are discarded first.
+
+    Returns:
+        float64 (M, 6) detections in image pixels.
+    """
+    with performance.stage('merge'):
+        detections, tile_index = to_global(tile_detections, tiles)
+        if conf_threshold > 0:
+            confident = detections[:, 4] >= conf_threshold
+            detections, tile_index = detections[confident], tile_index[confident]
+        return merge_detections(detections, tile_index, iou_threshold, method, class_agnostic)
+
+
+def count_image(tile_detections: list[np.ndarray] | dict[int, np.ndarray], im_height: int, im_width: int,
+                rows: int, columns: int, overlap: int = 0, iou_threshold: float = 0.5,
+                conf_threshold: float = 0.25, method: str = 'nms', per_class: bool = False) -> int | np.ndarray:
+    """
+    Final rice count of an image from the detections of its tiles.
+
+    Args:
+        tile_detections: Detections per tile (list in get_index order or {get_index: detections}).
+        im_height, im_width: Size of the whole image.
+        rows, columns, overlap: Grid used to slice the image (see tiling.tile_grid).
+        per_class: Returns the count of every class (index = class_id) instead of the total.
+
+    Returns:
+        Number of grains (or int64 array with the number per class).
+    """
+    tiles = tiling.tile_grid(im_height, im_width, rows, columns, overlap)
+    detections = merge_tiles(tile_detections, tiles, iou_threshold, conf_threshold, method)
+    if per_class:
+        return np.bincount(detections[:, 5].astype(np.int64), minlength=1)
+    return len(detections)
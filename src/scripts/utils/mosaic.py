@@ -0,0 +1,314 @@
+# MOSAIC MODULE
+# Tiles field orthomosaics too large to decode into RAM (20k x 20k px and more).
+#
+# The mosaic is memory-mapped (raw pixels, '.npy' or uncompressed 8-bit TIFF, in strips or tiles)
+# and read one window at a time: each window covers a row of tiles (or part of it) and is sized to
+# a memory budget, so the peak memory does not depend on the mosaic size. Tiles come out in
+# get_index order. Compressed TIFFs can not be read by windows: convert them first (eg: gdal_translate).
+#
+# Usage (from src/scripts):
+#     python -m utils.mosaic field.npy --labels field.txt --tile-size 640 --overlap 64 --budget-mb 1024 --dest tiles/
+
+# Standard library imports
+import argparse
+import json
+import os
+import time
+from collections.abc import Iterator
+import numpy as np
+
+# Local modules
+from utils import file_management, performance, tiling
+
+
+class Mosaic:
+    """
+    Memory-mapped mosaic: pixels are only read (and kept resident) for the window in use.
+
+    Args:
+        path: Raw interleaved pixels, '.npy' (C order) or an uncompressed 8-bit L/RGB TIFF
+            (contiguous, in strips or in tiles; reading TIFF headers needs Pillow).
+        shape: (height, width[, channels]) for raw files (read from the header otherwise).
+        dtype: Pixel type for raw files.
+        offset: Bytes before the pixels for raw files.
+
+    Attributes:
+        rgb: The pixels are RGB (TIFF); tiles are converted to BGR like cv.imread images.
+        blocks: int64 (B, 6) strips/tiles (x0, y0, x1, y1, offset, row stride in bytes) of a TIFF
+            not stored contiguously, None otherwise.
+    """
+
+    def __init__(self, path: str, shape: tuple | None = None, dtype: np.dtype = np.uint8, offset: int = 0):
+        self.path = path
+        self.rgb = False
+        self.blocks = None
+        extension = os.path.splitext(path)[1].lower()
+        if extension == '.npy':
+            array = np.load(path, mmap_mode='r')
+            if not array.flags.c_contiguous:
+                raise ValueError(f"❕'{path}' must be stored in C order.")
+            shape, dtype, offset = array.shape, array.dtype, array.offset
+            del array
+        elif extension in ('.tif', '.tiff'):
+            shape, dtype, blocks = self._tiff_layout(path)
+            self.rgb = len(shape) == 3
+            offset = self._contiguous_offset(blocks, shape)
+            if offset is None:
+                self.blocks = blocks
+                offset = 0
+        elif shape is None:
+            raise ValueError("❕'shape' is needed for raw mosaics.")
+
+        self.shape = tuple(int(value) for value in shape) + ((1,) if len(shape) == 2 else ())
+        self.dtype = np.dtype(dtype)
+        self.offset = offset
+        self.row_bytes = self.shape[1] * self.shape[2] * self.dtype.itemsize
+        expected = (offset + self.shape[0] * self.row_bytes if self.blocks is None
+                    else int((self.blocks[:, 4] + (self.blocks[:, 3] - self.blocks[:, 1]) * self.blocks[:, 5]).max()))
+        if os.path.getsize(path) < expected:
+            raise ValueError(f"❕'{path}' is smaller than a {self.shape} {self.dtype} mosaic ({expected} bytes).")
+        self._gray = len(shape) == 2
+
+    @staticmethod
+    def _tiff_layout(path: str) -> tuple[tuple, np.dtype, np.ndarray]:
+        """
+        (shape, dtype, blocks) of an uncompressed 8-bit L/RGB TIFF (see the blocks attribute).
+        """
+        try:
+            from PIL import Image  # Only reads the header
+        except ModuleNotFoundError:
+            raise ModuleNotFoundError("❗️Reading TIFF mosaics needs Pillow (pip install Pillow).") from None
+
+        # The pixel limit guards decoding; only the header is read, and mosaics are far above it
+        limit, Image.MAX_IMAGE_PIXELS = Image.MAX_IMAGE_PIXELS, None
+        try:
+            image = Image.open(path)
+        finally:
+            Image.MAX_IMAGE_PIXELS = limit
+        with image:
+            tiles = image.tile
+            raw = all(tile[0] == 'raw' and tile[3][0] == image.mode and tile[3][2:] in ((), (1,)) for tile in tiles)
+            if image.mode not in ('L', 'RGB') or not raw:
+                raise ValueError(f"❕'{path}' is compressed, planar or not 8-bit L/RGB: convert it to an uncompressed "
+                                 "TIFF or '.npy' to read it by windows.")
+            width, height = image.size
+            shape = (height, width) if image.mode == 'L' else (height, width, 3)
+            pixel_bytes = len(image.mode)
+            # Row stride of each strip/tile: 0 means packed rows, tiles at the border keep the full tile width
+            blocks = np.array([(*tile[1], tile[2], tile[3][1] or (tile[1][2] - tile[1][0]) * pixel_bytes)
+                               for tile in tiles], dtype=np.int64).reshape(-1, 6)
+            return shape, np.dtype(np.uint8), blocks
+
+    @staticmethod
+    def _contiguous_offset(blocks: np.ndarray, shape: tuple) -> int | None:
+        """
+        Offset of the pixels when the strips are full rows stored back to back (None otherwise).
+        """
+        row_bytes = shape[1] * (shape[2] if len(shape) == 3 else 1)
+        order = np.argsort(blocks[:, 1], kind='stable')
+        x0, y0, x1, y1, offset, stride = blocks[order].T
+        if ((x0 == 0).all() and (x1 == shape[1]).all() and (stride == row_bytes).all() and y0[0] == 0
+                and (y0[1:] == y1[:-1]).all() and (offset[1:] == offset[:-1] + (y1[:-1] - y0[:-1]) * row_bytes).all()):
+            return int(offset[0])
+        return None
+
+    @property
+    def height(self) -> int:
+        return self.shape[0]
+
+    @property
+    def width(self) -> int:
+        return self.shape[1]
+
+    def window_bytes(self, y0: int, y1: int, x0: int, x1: int) -> int:
+        return (y1 - y0) * (x1 - x0) * self.shape[2] * self.dtype.itemsize
+
+    def window(self, y0: int, y1: int, x0: int = 0, x1: int | None = None) -> np.ndarray:
+        """
+        Read-only view of rows [y0, y1) and columns [x0, x1); only these rows are mapped.
+
+        The windows of a TIFF stored in several strips or tiles are copied out of the
+        blocks they overlap (the copy is the size of the window).
+        """
+        x1 = self.width if x1 is None else x1
+        if self.blocks is not None:
+            return self._gather(y0, y1, x0, x1)
+        band = np.memmap(self.path, dtype=self.dtype, mode='r', offset=self.offset + y0 * self.row_bytes,
+                         shape=(y1 - y0, self.width, self.shape[2]))
+        view = band[:, x0:x1]
+        return view[..., 0] if self._gray else view
+
+    def _gather(self, y0: int, y1: int, x0: int, x1: int) -> np.ndarray:
+        channels = self.shape[2]
+        window = np.empty((y1 - y0, x1 - x0, channels), dtype=self.dtype)
+        bx0, by0, bx1, by1, offsets, strides = self.blocks.T
+        hit = np.flatnonzero((bx0 < x1) & (bx1 > x0) & (by0 < y1) & (by1 > y0))
+        for block in hit.tolist():
+            top, bottom = max(y0, int(by0[block])), min(y1, int(by1[block]))
+            left, right = max(x0, int(bx0[block])), min(x1, int(bx1[block]))
+            stride = int(strides[block])
+            rows = np.memmap(self.path, dtype=self.dtype, mode='r', offset=int(offsets[block]) + (top - int(by0[block])) * stride,
+                             shape=(bottom - top, stride // (channels * self.dtype.itemsize), channels))
+            window[top - y0:bottom - y0, left - x0:right - x0] = rows[:, left - int(bx0[block]):right - int(bx0[block])]
+            del rows
+        window.setflags(write=False)
+        return window[..., 0] if self._gray else window
+
+
+def grid_for_size(im_height: int, im_width: int, tile_size: int, overlap: int = 0) -> tuple[int, int]:
+    """
+    (rows, columns) of the grid whose tiles are at most tile_size pixels per side.
+    """
+    if tile_size <= overlap:
+        raise ValueError("❕The tile size must be larger than the overlap.")
+    return (max(1, -(-(im_height - overlap) // (tile_size - overlap))),
+            max(1, -(-(im_width - overlap) // (tile_size - overlap))))
+
+
+def column_groups(x_bounds: tuple, band_height: int, bytes_per_pixel: int, budget: int) -> list[tuple[int, int]]:
+    """
+    Splits a row of tiles in runs of consecutive columns whose window fits in the budget.
+
+    Returns:
+        [(first column, last column + 1), ...]
+    """
+    x_starts, x_ends = x_bounds
+    groups, first = [], 0
+    for column in range(len(x_starts)):
+        if (x_ends[column] - x_starts[column]) * band_height * bytes_per_pixel > budget:
+            raise MemoryError(f"❗️A single tile needs more than the budget ({budget / 2 ** 20:.0f} MB).")
+        if (x_ends[column] - x_starts[first]) * band_height * bytes_per_pixel > budget:
+            groups.append((first, column))
+            first = column
+    groups.append((first, len(x_starts)))
+    return groups
+
+
+def iter_tiles(mosaic: Mosaic, labels=None, rows: int | None = None, columns: int | None = None,
+               tile_size: int | None = None, overlap: int = 0, min_visibility: float = 0.5,
+               budget_mb: float = 1024) -> Iterator[tuple[int, str, tuple, np.ndarray, np.ndarray]]:
+    """
+    Yields the tiles of a mosaic and their labels, reading at most budget_mb of pixels at a time.
+
+    Args:
+        mosaic: Source (see Mosaic).
+        labels: Labels of the whole mosaic (relative YOLO format), optional.
+        rows, columns: Tile grid, or
+        tile_size: Maximum tile side in pixels (the grid is computed with grid_for_size).
+        overlap: Pixels shared by neighbour tiles.
+        min_visibility: Minimum visible fraction to keep a clipped box.
+        budget_mb: Pixels mapped at once; a window never spans more than one row of tiles.
+
+    Yields:
+        (index, prefix, coord, tile, tile_labels), like tiling.tile_image. Tiles are read-only
+        views valid until the consumer drops them (keeping one keeps its window mapped).
+    """
+    im_height, im_width = mosaic.height, mosaic.width
+    if tile_size is not None:
+        rows, columns = grid_for_size(im_height, im_width, tile_size, overlap)
+    if not rows or not columns:
+        raise ValueError("❕Give 'rows' and 'columns' or 'tile_size'.")
+
+    x_bounds = tiling.axis_bounds(im_width, columns, overlap)
+    y_starts, y_ends = tiling.axis_bounds(im_height, rows, overlap)
+    if labels is None:
+        tile_labels = None
+    else:
+        _, tile_labels = tiling.slice_labels(labels, im_height, im_width, rows, columns, overlap, min_visibility)
+    empty = np.empty((0, 5))
+    bytes_per_pixel = mosaic.shape[2] * mosaic.dtype.itemsize
+    budget = int(budget_mb * 2 ** 20)
+
+    for row in range(rows):
+        y0, y1 = int(y_starts[row]), int(y_ends[row])
+        for first, last in column_groups(x_bounds, y1 - y0, bytes_per_pixel, budget):
+            wx0, wx1 = int(x_bounds[0][first]), int(x_bounds[1][last - 1])
+            with performance.stage('decode'):
+                window = mosaic.window(y0, y1, wx0, wx1)
+            for column in range(first, last):
+                x0, x1 = int(x_bounds[0][column]), int(x_bounds[1][column])
+                tile = window[:, x0 - wx0:x1 - wx0]
+                if mosaic.rgb:
+                    tile = np.ascontiguousarray(tile[..., ::-1])  # RGB -> BGR
+                index = column + row * columns  # get_index order
+                labels_of_tile = empty if tile_labels is None else tile_labels[index]
+                yield index, tiling.tile_prefix(row, column), (x0, y0, x1, y1), tile, labels_of_tile
+            del window  # Unmaps the window once its tiles are released
+
+
+def tile_mosaic(path: str, dest: str, labels_path: str | None = None, tile_size: int = 640, overlap: int = 0,
+                min_visibility: float = 0.5, budget_mb: float = 1024, skip_empty: bool = False,
+                dry_run: bool = False, **source) -> dict:
+    """
+    Writes the tiles of a mosaic to 'dest/images' and 'dest/labels' ('{stem}.tileRRxCC.jpg/.txt').
+
+    Args:
+        path: Mosaic (see Mosaic); source holds shape/dtype/offset for raw files.
+        labels_path: YOLO label file of the whole mosaic (optional).
+        dry_run: Reads every tile (checksum) without writing anything.
+
+    Returns:
+        Report: tiles, elapsed seconds, budget and peak RSS of the process.
+    """
+    import cv2 as cv
+
+    mosaic = Mosaic(path, **source)
+    labels = tiling.read_labels(labels_path) if labels_path else None
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if not dry_run:
+        os.makedirs(os.path.join(dest, 'images'), exist_ok=True)
+        os.makedirs(os.path.join(dest, 'labels'), exist_ok=True)
+
+    start = time.perf_counter()
+    written, checksum = 0, 0
+    for _, prefix, _, tile, tile_labels in iter_tiles(mosaic, labels, tile_size=tile_size, overlap=overlap,
+                                                      min_visibility=min_visibility, budget_mb=budget_mb):
+        if skip_empty and not len(tile_labels):
+            continue
+        if dry_run:
+            checksum += int(tile.sum(dtype=np.uint64))
+        else:
+            with performance.stage('write'):
+                image_path = os.path.join(dest, 'images', f"{stem}.{prefix}.jpg")
+                if not cv.imwrite(image_path, tile):
+                    raise OSError(f"🚫 No se pudo guardar el mosaico:\n {image_path}")
+                if labels is not None:
+                    file_management.save_labels(os.path.join(dest, 'labels', f"{stem}.{prefix}.txt"), tile_labels, verbose=False)
+        written += 1
+
+    peak = performance.peak_rss()
+    return {'mosaic': path, 'shape': list(mosaic.shape), 'tiles': written, 'seconds': time.perf_counter() - start,
+            'budget_mb': budget_mb, 'peak_rss_mb': peak / 2 ** 20 if peak else None,
+            **({'checksum': checksum} if dry_run else {})}
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Tiles an orthomosaic by windows with bounded memory.")
+    parser.add_argument('path', help="Mosaic: '.npy', uncompressed TIFF (strips or tiles) or raw pixels (with --shape)")
+    parser.add_argument('--dest', default=None, help="Output folder (images/ and labels/)")
+    parser.add_argument('--labels', default=None, help="YOLO label file of the whole mosaic")
+    parser.add_argument('--shape', type=int, nargs='+', default=None, metavar='N', help="height width [channels] of raw files")
+    parser.add_argument('--dtype', default='uint8')
+    parser.add_argument('--offset', type=int, default=0, help="Header bytes of raw files")
+    parser.add_argument('--tile-size', type=int, default=640)
+    parser.add_argument('--overlap', type=int, default=0)
+    parser.add_argument('--budget-mb', type=float, default=1024, help="Pixels read at once")
+    parser.add_argument('--skip-empty', action='store_true')
+    parser.add_argument('--dry-run', action='store_true', help="Reads the tiles without writing them")
+    parser.add_argument('--report', default=None, metavar='FILE', help="Writes the report as JSON")
+    args = parser.parse_args(argv)
+    if args.dest is None and not args.dry_run:
+        parser.error("--dest is required unless --dry-run is given")
+
+    report = tile_mosaic(args.path, args.dest, args.labels, args.tile_size, args.overlap, budget_mb=args.budget_mb,
+                         skip_empty=args.skip_empty, dry_run=args.dry_run, shape=args.shape, dtype=args.dtype,
+                         offset=args.offset)
+    if args.report:
+        with open(args.report, 'w') as file:
+            json.dump(report, file, indent=2)
+    peak = f"{report['peak_rss_mb']:.0f} MB" if report['peak_rss_mb'] else '-'
+    print(f"✅ {report['tiles']} mosaicos en {report['seconds']:.1f} s (pico de memoria {peak}, presupuesto {args.budget_mb:.0f} MB)")
+
+
+if __name__ == '__main__':
+    main()
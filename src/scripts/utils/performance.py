@@ -1,14 +1,291 @@
 # PERFORMANCE MODULE
+# In-process stage timings (perf_counter_ns) aggregated in mergeable histograms.
+#
+# Profiling is off by default: instrumented code then costs one flag check per call.
+# Turn it on with enable() or the VISIONRICE_PROFILE=1 environment variable.
+
+# Standard library imports
+import functools
+import json
+import math
+import os
+import threading
+from time import perf_counter_ns
+
+
+SUBBUCKETS = 8  # Histogram buckets per power of two (~9% relative resolution)
+QUANTILES = (0.5, 0.95, 0.99)
+
+_enabled = os.environ.get('VISIONRICE_PROFILE', '') not in ('', '0')
+_lock = threading.Lock()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+class Histogram:
+    """
+    Durations of one stage in log-spaced buckets (count, total, min, max and bucket counts).
+
+    Two histograms are merged by adding their buckets, so the quantiles of several
+    processes can be combined without keeping every sample.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+        self.buckets = {}
+
+    def add(self, ns: int):
+        bucket = int(math.log2(ns) * SUBBUCKETS) if ns > 0 else -1
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total_ns += ns
+        self.min_ns = ns if self.min_ns is None else min(self.min_ns, ns)
+        self.max_ns = max(self.max_ns, ns)
+
+    def merge(self, other: 'Histogram'):
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += other.count
+        self.total_ns += other.total_ns
+        if other.min_ns is not None:
+            self.min_ns = other.min_ns if self.min_ns is None else min(self.min_ns, other.min_ns)
+        self.max_ns = max(self.max_ns, other.max_ns)
+
+    def quantile(self, q: float) -> int:
+        """
+        Approximate q-quantile in nanoseconds (center of the bucket, within min/max).
+        """
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                value = 0 if bucket < 0 else int(2 ** ((bucket + 0.5) / SUBBUCKETS))
+                return min(max(value, self.min_ns), self.max_ns)
+        return self.max_ns
+
+    def to_dict(self) -> dict:
+        return {'count': self.count, 'total_ns': self.total_ns, 'min_ns': self.min_ns or 0,
+                'max_ns': self.max_ns, 'buckets': {str(k): v for k, v in self.buckets.items()}}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Histogram':
+        histogram = cls()
+        histogram.count = data['count']
+        histogram.total_ns = data['total_ns']
+        histogram.min_ns = data['min_ns'] if data['count'] else None
+        histogram.max_ns = data['max_ns']
+        histogram.buckets = {int(k): v for k, v in data['buckets'].items()}
+        return histogram
+
+
+_stages: dict[str, Histogram] = {}
+
+
+def record(name: str, ns: int):
+    """
+    Adds a duration (nanoseconds) to a stage.
+    """
+    with _lock:
+        histogram = _stages.get(name)
+        if histogram is None:
+            histogram = _stages[name] = Histogram()
+        histogram.add(ns)
+
+
+class _Timer:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, perf_counter_ns() - self.start)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def stage(name: str):
+    """
+    Context manager that times a block into the 'name' stage (no-op while disabled).
+
+    Example:
+        with performance.stage('decode'):
+            image = cv.imread(image_path)
+    """
+    return _Timer(name) if _enabled else _NULL_TIMER
+
+
+def timed(name: str | None = None):
+    """
+    Decorator that times every call of a function into a stage (default the function name).
+    """
+    def decorator(func):
+        stage_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(stage_name, perf_counter_ns() - start)
+        return wrapper
+    return decorator
+
+
+def snapshot(reset: bool = False) -> dict:
+    """
+    Picklable copy of the collected histograms (eg: to send them from a pool worker).
+
+    Args:
+        reset: Clears the local histograms after copying them.
+    """
+    with _lock:
+        data = {name: histogram.to_dict() for name, histogram in _stages.items()}
+        if reset:
+            _stages.clear()
+    return data
+
+
+def merge(data: dict):
+    """
+    Adds the histograms of a snapshot (eg: from another process) to the local ones.
+    """
+    with _lock:
+        for name, values in data.items():
+            other = Histogram.from_dict(values)
+            if name in _stages:
+                _stages[name].merge(other)
+            else:
+                _stages[name] = other
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+
+
+def summary() -> dict:
+    """
+    Per-stage count, total, mean, min, max and p50/p95/p99 (seconds).
+    """
+    with _lock:
+        stages = dict(_stages)
+    report = {}
+    for name in sorted(stages):
+        histogram = stages[name]
+        report[name] = {
+            'count': histogram.count,
+            'total_s': histogram.total_ns / 1e9,
+            'mean_s': histogram.total_ns / histogram.count / 1e9 if histogram.count else 0.0,
+            'min_s': (histogram.min_ns or 0) / 1e9,
+            'max_s': histogram.max_ns / 1e9,
+            **{f"p{round(q * 100)}_s": histogram.quantile(q) / 1e9 for q in QUANTILES},
+        }
+    return report
+
+
+def to_json(indent: int | None = 2) -> str:
+    return json.dumps(summary(), indent=indent)
+
+
+def to_prometheus(metric: str = 'visionrice_stage_seconds') -> str:
+    """
+    Stage durations in the Prometheus text exposition format (one summary per stage).
+    """
+    lines = [f"# HELP {metric} Duration of the instrumented stages.", f"# TYPE {metric} summary"]
+    with _lock:
+        stages = dict(_stages)
+    for name in sorted(stages):
+        histogram = stages[name]
+        label = name.replace('\\', '\\\\').replace('"', '\\"')
+        for q in QUANTILES:
+            lines.append(f'{metric}{{stage="{label}",quantile="{q}"}} {histogram.quantile(q) / 1e9:.9f}')
+        lines.append(f'{metric}_sum{{stage="{label}"}} {histogram.total_ns / 1e9:.9f}')
+        lines.append(f'{metric}_count{{stage="{label}"}} {histogram.count}')
+    return '\n'.join(lines) + '\n'
+
+
+def export(file_path: str):
+    """
+    Writes the stage summary to a file ('.prom' -> Prometheus text, otherwise JSON).
+    """
+    text = to_prometheus() if file_path.endswith('.prom') else to_json()
+    with open(file_path, 'w') as file:
+        file.write(text)
+
+
+def rss() -> int | None:
+    """
+    Current resident set size of the process in bytes (Linux /proc; None elsewhere).
+    """
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss() -> int | None:
+    """
+    Peak resident set size of the process in bytes (None where it can not be read).
+
+    On Linux it is VmHWM, which starts over at exec; ru_maxrss would include the peak of the
+    parent process that spawned this one.
+    """
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024  # Linux reports KiB
 
-import time
 
 # Decorador para medir el tiempo de ejecución
 def duration(func):
-    def wrapper(*args, **kwargs):
-        start_time = time.time()  # Momento de inicio
-        result = func(*args, **kwargs)  # Ejecuta la función
-        end_time = time.time()  # Momento de fin
-        execution_time = end_time - start_time  # Calcula el tiempo de ejecución
-        print(f"\nTiempo de ejecución de {func.__name__}: {execution_time:.6f} segundos")
-        return result
-    return wrapper
\ No newline at end of file
+    """
+    Decorator that times every call into the func.__name__ stage (see timed).
+    """
+    return timed(func.__name__)(func)
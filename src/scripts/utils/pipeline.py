@@ -0,0 +1,235 @@
+# PIPELINE MODULE
+# Converts a raw Roboflow export (data/raw/...) into the tiled dataset (data/processed/...).
+#
+# Usage (from src/scripts):
+#     python -m utils.pipeline data/raw/3.5m.v3i.yolov8/ --rows 4 --columns 4 --workers 8
+
+# Standard library imports
+import argparse
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# Local modules
+from utils import file_management, format, manifest, performance, tiling
+
+
+SPLITS = ('train', 'valid', 'test')
+MODES = ('append', 'incremental')
+
+
+def list_images(dset: str, dir: str = 'in') -> list[str]:
+    """
+    Filenames (without extension) of the images of a split, sorted by name.
+    """
+    folder = file_management.build_filename(dset=dset, type='image', dir=dir)
+    if not os.path.isdir(folder):
+        return []
+    with os.scandir(folder) as entries:
+        return sorted(entry.name[:-len('.jpg')] for entry in entries if entry.name.endswith('.jpg'))
+
+
+def _init_worker(path: str, columns: int, profile: bool = False):
+    """
+    Sets the module constants used by build_filename/get_index inside each worker process.
+    """
+    file_management.PATH = path
+    format.COLUMNS = columns
+    if profile:
+        performance.enable()
+
+
+def _process_chunk(dset: str, names: list[str], params: dict) -> tuple[list[list[str]], dict | None]:
+    """
+    Decodes, tiles, relabels and writes a chunk of images.
+
+    Returns:
+        The files written per image and the stage timings of the chunk (None when profiling is off).
+    """
+    outputs = [tiling.tile_file(dset, name, **params) for name in names]
+    return outputs, performance.snapshot(reset=True) if performance.is_enabled() else None
+
+
+def _chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def run(path: str, rows: int, columns: int, splits: tuple[str, ...] = SPLITS, overlap: int = 0,
+        min_visibility: float = 0.5, skip_empty: bool = False, precision: int | None = None,
+        workers: int | None = None, chunk_size: int = 8, max_pending: int | None = None,
+        mode: str = 'append', skip_duplicates: bool = False, max_distance: int = 6, verbose: bool = True) -> dict:
+    """
+    Tiles every image of the selected splits using a pool of processes.
+
+    Every image is processed independently and written to a deterministic filename, so the
+    output is the same whatever the number of workers or the chunk size.
+
+    Args:
+        path: Root of the raw dataset (the PATH used by build_filename, eg: 'data/raw/3.5m.v3i.yolov8/').
+        rows, columns: Tile grid.
+        splits: Splits to process.
+        overlap: Pixels shared by neighbour tiles.
+        min_visibility: Minimum visible fraction to keep a clipped box.
+        skip_empty: Does not write tiles without any box.
+        precision: Fixed number of decimals for the labels.
+        workers: Number of processes (default os.cpu_count(); 1 runs in the current process).
+        chunk_size: Images sent to a worker per task (fewer, larger messages between processes).
+        max_pending: Maximum chunks submitted and not finished yet (default 2 x workers).
+        mode: 'append' writes every image over the existing output; 'incremental' keeps a
+            manifest in the output folder and only processes new or changed images, removes
+            the outputs of deleted images and resumes an interrupted run.
+        skip_duplicates: Updates the perceptual-hash index of the dataset (utils.dedup) and skips
+            the photos within max_distance bits of a photo indexed before them.
+        verbose: Prints progress and throughput.
+
+    Returns:
+        Summary with the number of images, files written, elapsed seconds and images per second.
+    """
+    if chunk_size < 1:
+        raise ValueError("❕chunk_size must be a positive integer.")
+    if mode not in MODES:
+        raise ValueError(f"❕Invalid 'mode': must be one of {MODES}.")
+
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    params = {'rows': rows, 'columns': columns, 'overlap': overlap, 'min_visibility': min_visibility,
+              'skip_empty': skip_empty, 'precision': precision}
+
+    profile = performance.is_enabled()
+    _init_worker(path, columns)
+    names = {dset: list_images(dset) for dset in splits}
+    skipped = removed = duplicates = 0
+    journal = None
+
+    if skip_duplicates:
+        from utils import dedup  # dedup imports this module
+
+        index = dedup.HashIndex(dedup.index_path(path))
+        index.update(path, splits, workers)
+        index.compact()
+        seen = index.seen([f"{dset}/{name}" for dset in splits for name in names[dset]], max_distance)
+        for dset in splits:
+            kept = [name for name in names[dset] if f"{dset}/{name}" not in seen]
+            duplicates += len(names[dset]) - len(kept)
+            names[dset] = kept
+
+    if mode == 'incremental':
+        journal = manifest.Manifest(file_management.processed_root(path), params)
+        hashes = {}
+        for dset in splits:
+            for name in names[dset]:
+                image_path = file_management.build_filename(dset=dset, type='image', dir='in', name=name)
+                label_path = file_management.build_filename(dset=dset, type='label', dir='in', name=name)
+                hashes[f"{dset}/{name}"] = manifest.input_hash(image_path, label_path)
+
+        removed = len(journal.remove_orphans(set(hashes), scope=tuple(f"{dset}/" for dset in splits)))
+        for dset in splits:
+            pending_names = [name for name in names[dset] if not journal.is_current(f"{dset}/{name}", hashes[f"{dset}/{name}"])]
+            skipped += len(names[dset]) - len(pending_names)
+            names[dset] = pending_names
+
+    tasks = [(dset, chunk) for dset in splits for chunk in _chunks(names[dset], chunk_size)]
+    n_images = sum(len(chunk) for _, chunk in tasks)
+
+    start = time.perf_counter()
+    files = 0
+    done_images = 0
+
+    def report(dset: str, chunk: list[str], result: tuple[list[list[str]], dict | None]):
+        nonlocal files, done_images
+        outputs, timings = result
+        if timings:
+            performance.merge(timings)
+        files += sum(len(paths) for paths in outputs)
+        done_images += len(chunk)
+        if journal is not None:
+            for name, paths in zip(chunk, outputs):
+                journal.record(f"{dset}/{name}", hashes[f"{dset}/{name}"], paths)
+        if verbose:
+            elapsed = time.perf_counter() - start
+            print(f"\r> {done_images}/{n_images} imágenes ({done_images / elapsed:.1f} img/s)", end='', flush=True)
+
+    try:
+        if workers == 1:
+            for dset, chunk in tasks:
+                report(dset, chunk, _process_chunk(dset, chunk, params))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(path, columns, profile)) as pool:
+                pending = {}
+                queue = iter(tasks)
+                # Bounded submission: only 'max_pending' chunks are queued at any time
+                while True:
+                    while len(pending) < max_pending:
+                        task = next(queue, None)
+                        if task is None:
+                            break
+                        pending[pool.submit(_process_chunk, *task, params)] = task
+                    if not pending:
+                        break
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        report(*pending.pop(future), future.result())
+    finally:
+        if journal is not None:
+            journal.compact()
+
+    elapsed = time.perf_counter() - start
+    summary = {
+        'images': n_images,
+        'files': files,
+        'seconds': elapsed,
+        'images_per_second': n_images / elapsed if elapsed else 0.0,
+        'skipped': skipped,
+        'removed': removed,
+        'duplicates': duplicates,
+        'workers': workers,
+        'chunk_size': chunk_size,
+    }
+    if verbose:
+        print(f"\n✅ {n_images} imágenes procesadas en {elapsed:.2f} s "
+              f"({summary['images_per_second']:.1f} img/s, {workers} procesos)")
+        if mode == 'incremental':
+            print(f"> Sin cambios: {skipped} | Eliminadas: {removed}")
+        if skip_duplicates:
+            print(f"> Duplicadas omitidas: {duplicates}")
+    return summary
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Tiles a raw YOLO dataset into the processed dataset.")
+    parser.add_argument('path', help="Root of the raw dataset (eg: data/raw/3.5m.v3i.yolov8/)")
+    parser.add_argument('--rows', type=int, required=True)
+    parser.add_argument('--columns', type=int, required=True)
+    parser.add_argument('--splits', nargs='+', default=list(SPLITS), choices=SPLITS)
+    parser.add_argument('--overlap', type=int, default=0, help="Pixels shared by neighbour tiles")
+    parser.add_argument('--min-visibility', type=float, default=0.5)
+    parser.add_argument('--skip-empty', action='store_true', help="Do not write tiles without boxes")
+    parser.add_argument('--precision', type=int, default=None, help="Decimals of the label coordinates")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=8)
+    parser.add_argument('--max-pending', type=int, default=None)
+    parser.add_argument('--mode', default='append', choices=MODES,
+                        help="'incremental' only processes new or changed images (manifest in the output folder)")
+    parser.add_argument('--skip-duplicates', action='store_true',
+                        help="Skips near-duplicate photos (perceptual-hash index in the output folder)")
+    parser.add_argument('--max-distance', type=int, default=6, help="Hamming bits of --skip-duplicates")
+    parser.add_argument('--profile', default=None, metavar='FILE',
+                        help="Times the decode/tile/label/write stages and saves them (.json or .prom)")
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        performance.enable()
+
+    path = args.path if args.path.endswith('/') else args.path + '/'
+    run(path, args.rows, args.columns, splits=tuple(args.splits), overlap=args.overlap,
+        min_visibility=args.min_visibility, skip_empty=args.skip_empty, precision=args.precision,
+        workers=args.workers, chunk_size=args.chunk_size, max_pending=args.max_pending, mode=args.mode,
+        skip_duplicates=args.skip_duplicates, max_distance=args.max_distance)
+    if args.profile:
+        performance.export(args.profile)
+        print(performance.to_json())
+
+
+if __name__ == '__main__':
+    main()
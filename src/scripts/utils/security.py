@@ -1,6 +1,7 @@
 # SECURITY MODULE
 
 # Standard library imports
+import functools
 import re
 import unicodedata
 import warnings
@@ -17,62 +18,98 @@ def timestamp(message=''):
 
 # DECORATOR FOR INPUT SANITIZATION
 # Safety Mesaures for verfying potential harmful user inputs
+ALLOWED_CHARS = re.compile(r"^[a-zA-Z0-9_\-\./]+$")  # Allow '/' in user input
+SANITIZE_CACHE_SIZE = 4096  # Distinct strings remembered as already validated
+
+
+@functools.lru_cache(maxsize=SANITIZE_CACHE_SIZE)
+def _warn_once(message: str):
+    """Issues a warning the first time a message shows up (while it stays in the memo)."""
+    warnings.warn(message, UserWarning)
+
+
 def remove_accents(input_str):
     """Replace accents from a string with equivalent letter, issuing a warning if changes are made."""
+    if input_str.isascii():
+        return input_str  # NFKD does not change ASCII text
+
     original_str = input_str  # Store the original string for comparison
     nfkd_form = unicodedata.normalize('NFKD', input_str)
     result = "".join(c for c in nfkd_form if not unicodedata.combining(c))
 
     if result != original_str:  # Check if any changes were made
-        warnings.warn(f"Accents were removed from input. ('{original_str}' -> '{result}')", UserWarning)
+        _warn_once(f"Accents were removed from input. ('{original_str}' -> '{result}')")
 
     return result
 
+
+@functools.lru_cache(maxsize=SANITIZE_CACHE_SIZE)
 def sanitize_filename(input_str):
-    """Sanitizes a filename by removing accents and disallowed characters."""
+    """
+    Sanitizes a filename by removing accents and disallowed characters.
+
+    Results are memoized (bounded LRU), so the dataset root, split names, etc. are only
+    normalized and checked the first time, and each unsafe value warns once.
+    """
     input_str = remove_accents(input_str)  # Remove accents first
     result = input_str
 
     # Checks for prohibited characters (then deletes them)
-    # allowed_chars = r"^[a-zA-Z0-9_\-\.]+$"
-    allowed_chars = r"^[a-zA-Z0-9_\-\./]+$" # Allow '/' in user input
-    if input_str and not re.fullmatch(allowed_chars, input_str):
-        result = re.sub(allowed_chars, "", input_str)  # Sanitize (remove invalid chars)
-        warnings.warn(f"This argument is unsafe. A sanitized version will be used instead. ('{input_str}' -> '{result}')", UserWarning)
+    if input_str and not ALLOWED_CHARS.fullmatch(input_str):
+        result = ALLOWED_CHARS.sub("", input_str)  # Sanitize (remove invalid chars)
+        _warn_once(f"This argument is unsafe. A sanitized version will be used instead. ('{input_str}' -> '{result}')")
 
     return result
 
+
+def _path_positions(func, paths: tuple[str, ...]) -> tuple[int, ...]:
+    """Positions of the declared path parameters of a function."""
+    code = func.__code__
+    parameters = code.co_varnames[:code.co_argcount + code.co_kwonlyargcount]
+    unknown = set(paths) - set(parameters)
+    if unknown:
+        raise ValueError(f"❕{func.__name__}() has no parameters named {sorted(unknown)}.")
+    return tuple(parameters.index(name) for name in paths)
+
+
 # Decorator wrapper
-def validate_filenames():
+def validate_filenames(*paths: str):
+    """
+    Sanitizes the string arguments of a function before calling it (see sanitize_filename).
+
+    Args:
+        paths: Names of the parameters that hold paths or filenames; the other arguments are
+            passed through untouched. Without names every string argument is checked.
+
+    Example:
+        @validate_filenames('folder_path')
+        def create_dir(folder_path, mode='ask'): ...
+    """
     def decorator(func):
+        indexes = _path_positions(func, paths) if paths else None
+        names = frozenset(paths)
+
+        def sanitize_arg(value, label):
+            sanitized = sanitize_filename(value)  # Sanitize argument
+            if sanitized != value:
+                _warn_once(f"{label} sanitized to '{sanitized}'.")
+            return sanitized
+
+        @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            # Arguments Sanitization 
-            sanitized_args = []
-            for arg in args:
-                if isinstance(arg, str):
-                    original_arg = arg
-                    sanitized_arg = sanitize_filename(arg) # Sanitize argument
-                    if sanitized_arg != original_arg:
-                        warnings.warn(f"Argument '{original_arg}' sanitized to '{sanitized_arg}'.", UserWarning)
-                else:
-                    sanitized_arg = arg
-                    # warnings.warn(f"Argument '{arg}' is not string type. Be sure the current function can handle it.", UserWarning)
-                sanitized_args.append(sanitized_arg)
-
-            # Keyword Arguments Sanitization 
-            sanitized_kwargs = {}
+            # Arguments Sanitization (the argument list is only copied when a value changes)
+            for index in (range(len(args)) if indexes is None else indexes):
+                if index < len(args):
+                    arg = args[index]
+                    if isinstance(arg, str) and sanitize_filename(arg) != arg:
+                        args = list(args)
+                        args[index] = sanitize_arg(arg, f"Argument '{arg}'")
+
+            # Keyword Arguments Sanitization
             for key, value in kwargs.items():
-                if isinstance(value, str):
-                    original_value = value
-                    sanitized_value = sanitize_filename(value) # Sanitize value for keyword
-                    if sanitized_value != original_value:
-                        warnings.warn(f"Keyword argument '{key}'='{original_value}' sanitized to '{sanitized_value}'.", UserWarning)
-                else:
-                    sanitized_value = value
-                    # warnings.warn(f"Argument '{value}' is not string type. Be sure the current function can handle it.", UserWarning)
-                sanitized_kwargs[key] = sanitized_value
-
-            # Return sanitized arguments
-            return func(*sanitized_args, **sanitized_kwargs)
+                if isinstance(value, str) and (indexes is None or key in names) and sanitize_filename(value) != value:
+                    kwargs[key] = sanitize_arg(value, f"Keyword argument '{key}'='{value}'")
+
+            return func(*args, **kwargs)
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
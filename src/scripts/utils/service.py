@@ -0,0 +1,336 @@
+# SERVICE MODULE
+# Counting service: receives photos over HTTP (TCP or Unix socket), tiles them and runs the
+# model on micro-batches that mix the tiles of concurrent requests.
+#
+# Usage (from src/scripts):
+#     python -m utils.service --port 8080 --model utils.service:yolo_model --weights best.pt
+#     curl --data-binary @photo.jpg 'http://127.0.0.1:8080/count?rows=4&columns=4&overlap=64'
+#
+# Endpoints: POST /count (image bytes), GET /metrics (Prometheus text), GET /health.
+
+# Standard library imports
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+import cv2 as cv
+
+# Local modules
+from utils import images, merge, performance, tiling
+
+
+# Model: callable(list of BGR tiles) -> list of (K, 6) detections (x0, y0, x1, y1, conf, class_id) per tile
+Model = Callable[[list[np.ndarray]], list[np.ndarray]]
+
+
+def stub_model(tiles: list[np.ndarray]) -> list[np.ndarray]:
+    """
+    CPU stand-in for the detector: bright connected blobs as grains (for tests and dry runs).
+    """
+    outputs = []
+    for tile in tiles:
+        gray = cv.cvtColor(tile, cv.COLOR_BGR2GRAY) if tile.ndim == 3 else tile
+        _, mask = cv.threshold(gray, 0, 255, cv.THRESH_BINARY | cv.THRESH_OTSU)
+        n, _, stats, _ = cv.connectedComponentsWithStats(mask)
+        x, y, w, h = stats[1:, :4].T.astype(np.float64)
+        outputs.append(np.column_stack([x, y, x + w, y + h, np.ones(n - 1), np.zeros(n - 1)]))
+    return outputs
+
+
+def yolo_model(weights: str, conf: float = 0.25, device: str | None = None) -> Model:
+    """
+    Ultralytics YOLO detector as a service model (ultralytics is only needed here).
+    """
+    from ultralytics import YOLO
+
+    model = YOLO(weights)
+
+    def predict(tiles: list[np.ndarray]) -> list[np.ndarray]:
+        results = model.predict(tiles, conf=conf, device=device, verbose=False)
+        return [result.boxes.data.cpu().numpy() for result in results]
+    return predict
+
+
+def load_model(spec: str, **kwargs) -> Model:
+    """
+    Model from a 'module:attribute' path; factories (like yolo_model) are called with kwargs.
+    """
+    module_name, _, attribute = spec.partition(':')
+    model = getattr(importlib.import_module(module_name), attribute)
+    return model(**kwargs) if kwargs else model
+
+
+class Busy(Exception):
+    """
+    The service already has the maximum number of requests in progress.
+    """
+
+
+class MicroBatcher:
+    """
+    Groups tiles of concurrent requests into model batches.
+
+    A batch is sent when it has max_batch tiles or max_wait seconds after its first tile.
+    The tile queue is bounded (max_queue), so producers wait when the model falls behind.
+
+    Args:
+        model: Model callable (runs in a worker thread, one batch at a time).
+        max_batch: Maximum tiles per model call.
+        max_wait: Seconds a partial batch waits for more tiles.
+        max_queue: Maximum tiles waiting for the model.
+    """
+
+    def __init__(self, model: Model, max_batch: int = 16, max_wait: float = 0.01, max_queue: int = 256):
+        if max_batch < 1:
+            raise ValueError("❕max_batch must be a positive integer.")
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.occupancy = performance.Histogram()  # Tiles per batch (total_ns holds the sum of tiles)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model')
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=False)
+
+    async def predict(self, tiles: list[np.ndarray]) -> list[np.ndarray]:
+        """
+        Detections of every tile (waits while the queue is full).
+        """
+        loop = asyncio.get_running_loop()
+        futures = []
+        for tile in tiles:
+            future = loop.create_future()
+            await self.queue.put((tile, future))
+            futures.append(future)
+        return await asyncio.gather(*futures)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            tiles = [tile for tile, _ in batch]
+            self.occupancy.add(len(batch))
+            try:
+                start = time.perf_counter_ns()
+                outputs = await loop.run_in_executor(self._executor, self.model, tiles)
+                performance.record('service.model', time.perf_counter_ns() - start)
+                if len(outputs) != len(tiles):
+                    raise ValueError(f"❕The model returned {len(outputs)} results for {len(tiles)} tiles.")
+            except Exception as error:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            for (_, future), output in zip(batch, outputs):
+                if not future.done():
+                    future.set_result(output)
+
+
+class CountingService:
+    """
+    Counts the grains of a photo: decode, tile, batched inference, merge.
+
+    Args:
+        model: Model callable (see MicroBatcher).
+        max_requests: Requests processed at the same time; more are rejected (HTTP 503).
+        max_batch, max_wait, max_queue: See MicroBatcher.
+        workers: Threads that decode and merge off the event loop (OpenCV releases the GIL).
+    """
+
+    def __init__(self, model: Model, max_requests: int = 32, max_batch: int = 16, max_wait: float = 0.01,
+                 max_queue: int = 256, workers: int | None = None):
+        self.batcher = MicroBatcher(model, max_batch, max_wait, max_queue)
+        self.max_requests = max_requests
+        self.active = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers or min(4, os.cpu_count() or 1),
+                                            thread_name_prefix='decode')
+
+    async def stop(self):
+        await self.batcher.stop()
+        self._executor.shutdown(wait=False)
+
+    @staticmethod
+    def _decode(data: bytes) -> np.ndarray | None:
+        with performance.stage('service.decode'):
+            return cv.imdecode(np.frombuffer(data, dtype=np.uint8), cv.IMREAD_COLOR)
+
+    @staticmethod
+    def _merge(outputs: list[np.ndarray], tiles: np.ndarray, iou_threshold: float, conf_threshold: float) -> np.ndarray:
+        with performance.stage('service.merge'):
+            return merge.merge_tiles(outputs, tiles, iou_threshold, conf_threshold)
+
+    async def count(self, data: bytes, rows: int = 4, columns: int = 4, overlap: int = 0,
+                    iou_threshold: float = 0.5, conf_threshold: float = 0.25, detections: bool = False) -> dict:
+        """
+        Counts the grains of an encoded image (JPEG/PNG bytes).
+        """
+        if self.active >= self.max_requests:
+            self.rejected += 1
+            raise Busy()
+        self.active += 1
+        start = time.perf_counter_ns()
+        loop = asyncio.get_running_loop()
+        try:
+            # Decoding a 20-40 MB photo and merging take long enough to stall every other connection
+            image = await loop.run_in_executor(self._executor, self._decode, data)
+            if image is None:
+                raise ValueError("❕The request body is not a valid image.")
+            im_height, im_width = image.shape[:2]
+            tiles = tiling.tile_grid(im_height, im_width, rows, columns, overlap)
+
+            outputs = await self.batcher.predict(images.crops(image, tiles))
+            merged = await loop.run_in_executor(self._executor, self._merge, outputs, tiles, iou_threshold,
+                                                conf_threshold)
+        finally:
+            self.active -= 1
+            elapsed = time.perf_counter_ns() - start
+            performance.record('service.request', elapsed)
+
+        response = {'count': len(merged), 'tiles': len(tiles), 'latency_ms': elapsed / 1e6}
+        if detections:
+            response['detections'] = merged.tolist()
+        return response
+
+    def metrics(self) -> str:
+        """
+        Stage timings plus request and batch occupancy metrics (Prometheus text format).
+        """
+        occupancy = self.batcher.occupancy
+        lines = [
+            performance.to_prometheus().rstrip('\n'),
+            "# TYPE visionrice_batch_tiles summary",
+            *(f'visionrice_batch_tiles{{quantile="{q}"}} {occupancy.quantile(q)}' for q in performance.QUANTILES),
+            f"visionrice_batch_tiles_sum {occupancy.total_ns}",
+            f"visionrice_batch_tiles_count {occupancy.count}",
+            f"visionrice_batch_max_tiles {self.batcher.max_batch}",
+            f"visionrice_requests_active {self.active}",
+            f"visionrice_requests_rejected_total {self.rejected}",
+            f"visionrice_queue_tiles {self.batcher.queue.qsize()}",
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+# Minimal HTTP/1.1 front end (one request per connection)
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large',
+            500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+async def _respond(writer: asyncio.StreamWriter, status: int, body: bytes, content_type: str = 'application/json'):
+    head = (f"HTTP/1.1 {status} {_REASONS[status]}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n")
+    writer.write(head.encode() + body)
+    await writer.drain()
+    writer.close()
+    await writer.wait_closed()
+
+
+def _json(data: dict) -> bytes:
+    return json.dumps(data).encode()
+
+
+def make_handler(service: CountingService, max_body: int = 256 * 2 ** 20):
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+            request_line, *header_lines = head.decode('latin-1').split('\r\n')
+            method, target, _ = request_line.split(' ', 2)
+            headers = {key.strip().lower(): value.strip()
+                       for key, _, value in (line.partition(':') for line in header_lines if line)}
+            url = urlsplit(target)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+            if method == 'GET' and url.path == '/health':
+                return await _respond(writer, 200, _json({'status': 'ok', 'active': service.active}))
+            if method == 'GET' and url.path == '/metrics':
+                return await _respond(writer, 200, service.metrics().encode(), 'text/plain; version=0.0.4')
+            if method != 'POST' or url.path != '/count':
+                return await _respond(writer, 404, _json({'error': 'not found'}))
+
+            length = int(headers.get('content-length', 0))
+            if length > max_body:
+                return await _respond(writer, 413, _json({'error': 'image too large'}))
+            data = await reader.readexactly(length)
+            result = await service.count(
+                data, rows=int(query.get('rows', 4)), columns=int(query.get('columns', 4)),
+                overlap=int(query.get('overlap', 0)), iou_threshold=float(query.get('iou', 0.5)),
+                conf_threshold=float(query.get('conf', 0.25)), detections=query.get('detections') == '1')
+            await _respond(writer, 200, _json(result))
+        except Busy:
+            await _respond(writer, 503, _json({'error': 'busy, retry later'}))
+        except (ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as error:
+            await _respond(writer, 400, _json({'error': str(error)}))
+        except Exception as error:
+            await _respond(writer, 500, _json({'error': str(error)}))
+    return handle
+
+
+async def serve(service: CountingService, host: str = '127.0.0.1', port: int = 8080, unix: str | None = None):
+    """
+    Runs the HTTP front end until cancelled (TCP host:port, or a Unix socket if given).
+    """
+    service.batcher.start()
+    handler = make_handler(service)
+    server = (await asyncio.start_unix_server(handler, path=unix) if unix
+              else await asyncio.start_server(handler, host, port))
+    print(f"✅ Servicio de conteo escuchando en {unix or f'http://{host}:{port}'}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Rice counting service with micro-batched tile inference.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix', default=None, help="Unix socket path (instead of TCP)")
+    parser.add_argument('--model', default='utils.service:stub_model', help="'module:attribute' of the model")
+    parser.add_argument('--weights', default=None, help="Weights passed to a model factory (eg: yolo_model)")
+    parser.add_argument('--max-batch', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=float, default=10.0)
+    parser.add_argument('--max-queue', type=int, default=256, help="Tiles waiting for the model")
+    parser.add_argument('--max-requests', type=int, default=32)
+    args = parser.parse_args(argv)
+
+    performance.enable()
+    model = load_model(args.model, **({'weights': args.weights} if args.weights else {}))
+    service = CountingService(model, max_requests=args.max_requests, max_batch=args.max_batch,
+                              max_wait=args.max_wait_ms / 1000, max_queue=args.max_queue)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+# SHARDS MODULE
+# Packs a processed split (tile JPEGs + YOLO label files) into a few large shard files,
+# so training nodes do one mmap per shard instead of two open/read per tile.
+#
+# Usage (from src/scripts):
+#     python -m utils.shards data/raw/3.5m.v3i.yolov8/ --splits train valid --dest data/shards/
+#
+# Shard layout (little endian):
+#     SHARD_MAGIC | encoded images, back to back | padding | float32 labels (M, 5) | padding
+#     | int64 image offsets (n + 1) | int64 label offsets (n + 1) | JSON footer | footer size (8 bytes) | SHARD_MAGIC
+# The loose files stay the default layout; shards are an extra export.
+
+# Standard library imports
+import argparse
+import bisect
+import glob
+import json
+import mmap
+import os
+import numpy as np
+
+# Local modules
+from utils import file_management, format, pipeline, tiling
+
+
+SHARD_MAGIC = b'VRSHARD1'
+SHARD_ALIGN = 64
+SHARD_SUFFIX = '.shard'
+
+
+class ShardWriter:
+    """
+    Writes (image bytes, labels) records into numbered shards of about max_bytes each.
+
+    Images are streamed to disk as they arrive; only the labels and offsets of the
+    current shard are kept in memory until it is closed.
+
+    Args:
+        folder: Output folder.
+        prefix: Shard filename prefix ('{prefix}-00000.shard', ...).
+        max_bytes: A new shard is started once the current one reaches this size.
+    """
+
+    def __init__(self, folder: str, prefix: str = 'shard', max_bytes: int = 512 * 2 ** 20):
+        self.folder = folder
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.paths = []
+        self._file = None
+        os.makedirs(folder, exist_ok=True)
+
+    def __enter__(self) -> 'ShardWriter':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _open(self):
+        path = os.path.join(self.folder, f"{self.prefix}-{len(self.paths):05d}{SHARD_SUFFIX}")
+        self._tmp_path = f"{path}.tmp"
+        self._file = open(self._tmp_path, 'wb')
+        self._file.write(SHARD_MAGIC)
+        self._image_offsets = [len(SHARD_MAGIC)]
+        self._label_offsets = [0]
+        self._labels = []
+        self._names = []
+        self.paths.append(path)
+
+    def add(self, image_bytes: bytes, labels: np.ndarray, name: str = ''):
+        """
+        Appends a record: the encoded image as is and its labels (any layout accepted by label_array).
+        """
+        if self._file is None:
+            self._open()
+        labels = format.label_array(labels).astype(np.float32)
+        self._file.write(image_bytes)
+        self._image_offsets.append(self._image_offsets[-1] + len(image_bytes))
+        self._labels.append(labels)
+        self._label_offsets.append(self._label_offsets[-1] + len(labels))
+        self._names.append(name)
+        if self._image_offsets[-1] >= self.max_bytes:
+            self._finish()
+
+    def _pad(self):
+        self._file.write(b'\0' * (-self._file.tell() % SHARD_ALIGN))
+
+    def _finish(self):
+        file = self._file
+        self._pad()
+        labels_offset = file.tell()
+        file.write(np.concatenate(self._labels or [np.empty((0, 5), np.float32)]).astype('<f4').tobytes())
+        self._pad()
+        index_offset = file.tell()
+        file.write(np.asarray(self._image_offsets, dtype='<i8').tobytes())
+        file.write(np.asarray(self._label_offsets, dtype='<i8').tobytes())
+        footer = json.dumps({'records': len(self._names), 'labels_offset': labels_offset,
+                             'index_offset': index_offset, 'names': self._names}).encode()
+        file.write(footer)
+        file.write(len(footer).to_bytes(8, 'little'))
+        file.write(SHARD_MAGIC)
+        file.close()
+        # Renamed when complete, so a crash never leaves a half written shard
+        os.replace(self._tmp_path, self.paths[-1])
+        self._file = None
+
+    def close(self):
+        if self._file is not None:
+            self._finish()
+
+
+class ShardReader:
+    """
+    Random access to the records of one shard through mmap (no copies).
+
+    Args:
+        path: Shard file.
+        sequential: Hints the kernel to read ahead (MADV_SEQUENTIAL) instead of random access.
+    """
+
+    def __init__(self, path: str, sequential: bool = False):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mmap
+        if mm[:len(SHARD_MAGIC)] != SHARD_MAGIC or mm[-len(SHARD_MAGIC):] != SHARD_MAGIC:
+            raise ValueError(f"❕'{path}' is not a shard file.")
+        footer_size = int.from_bytes(mm[-len(SHARD_MAGIC) - 8:-len(SHARD_MAGIC)], 'little')
+        footer_end = len(mm) - len(SHARD_MAGIC) - 8
+        footer = json.loads(mm[footer_end - footer_size:footer_end])
+
+        self.names = footer['names']
+        n = footer['records']
+        index_offset = footer['index_offset']
+        self.image_offsets = np.frombuffer(mm, dtype='<i8', count=n + 1, offset=index_offset)
+        self.label_offsets = np.frombuffer(mm, dtype='<i8', count=n + 1, offset=index_offset + (n + 1) * 8)
+        n_boxes = int(self.label_offsets[-1])
+        self.labels = np.frombuffer(mm, dtype='<f4', count=n_boxes * 5, offset=footer['labels_offset']).reshape(-1, 5)
+        self._buffer = np.frombuffer(mm, dtype=np.uint8)
+        if hasattr(mm, 'madvise'):
+            mm.madvise(mmap.MADV_SEQUENTIAL if sequential else mmap.MADV_RANDOM)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, i: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (image_bytes, labels): uint8 view of the encoded image and float32 (K, 5) view of its labels.
+        """
+        if not -len(self) <= i < len(self):
+            raise IndexError(f"❕Record {i} out of range ({len(self)} records).")
+        i %= len(self)
+        image = self._buffer[self.image_offsets[i]:self.image_offsets[i + 1]]
+        return image, self.labels[self.label_offsets[i]:self.label_offsets[i + 1]]
+
+    def prefetch(self, start: int, stop: int):
+        """
+        Asks the kernel to load the images of records [start, stop) in the background.
+        """
+        start, stop = max(start, 0), min(stop, len(self))
+        if not hasattr(self._mmap, 'madvise') or start >= stop:
+            return
+        begin = int(self.image_offsets[start]) // mmap.PAGESIZE * mmap.PAGESIZE
+        end = int(self.image_offsets[stop])
+        if end > begin:
+            self._mmap.madvise(mmap.MADV_WILLNEED, begin, end - begin)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        # Views handed out keep the map alive; it is released with them
+        self._buffer = self.labels = self.image_offsets = self.label_offsets = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+
+
+class ShardDataset:
+    """
+    Records of every shard of a folder (or of a list of shard paths) behind a single index.
+
+    Args:
+        source: Folder with '*.shard' files, or a list of shard paths.
+        prefetch: Records read ahead during sequential iteration.
+    """
+
+    def __init__(self, source: str | list[str], prefetch: int = 64):
+        paths = sorted(glob.glob(os.path.join(source, f"*{SHARD_SUFFIX}"))) if isinstance(source, str) else list(source)
+        self.shards = [ShardReader(path) for path in paths]
+        self.starts = np.cumsum([0] + [len(shard) for shard in self.shards]).tolist()
+        self.prefetch = prefetch
+
+    def __len__(self) -> int:
+        return self.starts[-1]
+
+    def locate(self, i: int) -> tuple[int, int]:
+        """
+        (shard, record in the shard) of a global index.
+        """
+        if not 0 <= i < len(self):
+            raise IndexError(f"❕Record {i} out of range ({len(self)} records).")
+        shard = bisect.bisect_right(self.starts, i) - 1
+        return shard, i - self.starts[shard]
+
+    def __getitem__(self, i: int) -> tuple[np.ndarray, np.ndarray]:
+        shard, record = self.locate(i)
+        return self.shards[shard][record]
+
+    def name(self, i: int) -> str:
+        shard, record = self.locate(i)
+        return self.shards[shard].names[record]
+
+    def __iter__(self):
+        for shard in self.shards:
+            shard.prefetch(0, self.prefetch)
+            for start in range(0, len(shard), self.prefetch):
+                shard.prefetch(start + self.prefetch, start + 2 * self.prefetch)  # Next window while this one is used
+                for i in range(start, min(start + self.prefetch, len(shard))):
+                    yield shard[i]
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+
+def export_split(path: str, dset: str, dest: str, dir: str = 'out', max_bytes: int = 512 * 2 ** 20,
+                 verbose: bool = True) -> list[str]:
+    """
+    Packs the images and labels of a split into shards ('{dest}/{dset}/{dset}-00000.shard', ...).
+
+    Every split gets its own folder, so ShardDataset('{dest}/train') never reads the records of
+    another split. The shards of a previous export of the split are deleted first. The encoded
+    images are copied as they are (no decoding). Images without a label file get an empty label
+    block, like YOLO does.
+
+    Args:
+        path: Root of the raw dataset (the PATH used by build_filename).
+        dset: Split ('train', 'valid' or 'test').
+        dest: Output folder (the shards go to its '{dset}' subfolder).
+        dir: Dataset to pack ('out' processed tiles by default, 'in' raw photos).
+        max_bytes: Approximate size of each shard.
+
+    Returns:
+        Paths of the shards written.
+    """
+    file_management.PATH = path
+    names = pipeline.list_images(dset, dir)
+    folder = os.path.join(dest, dset)
+    for stale in glob.glob(os.path.join(folder, f"*{SHARD_SUFFIX}")):
+        os.remove(stale)
+    with ShardWriter(folder, prefix=dset, max_bytes=max_bytes) as writer:
+        for name in names:
+            paths = file_management.TilePaths(dset, name, dir)
+            with open(paths.path('image'), 'rb') as file:
+                image_bytes = file.read()
+            label_path = paths.path('label')
+            labels = tiling.read_labels(label_path) if os.path.exists(label_path) else np.empty((0, 5), np.float32)
+            writer.add(image_bytes, labels, name)
+    if verbose:
+        print(f"✅ {dset}: {len(names)} imágenes empaquetadas en {len(writer.paths)} shards")
+    return writer.paths
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Packs dataset splits into mmap-friendly shard files.")
+    parser.add_argument('path', help="Root of the raw dataset (eg: data/raw/3.5m.v3i.yolov8/)")
+    parser.add_argument('--splits', nargs='+', default=list(pipeline.SPLITS), choices=pipeline.SPLITS)
+    parser.add_argument('--dest', required=True, help="Output folder (one subfolder per split)")
+    parser.add_argument('--dir', default='out', choices=['in', 'out'], help="'out' packs the processed tiles")
+    parser.add_argument('--shard-mb', type=int, default=512)
+    args = parser.parse_args(argv)
+
+    path = args.path if args.path.endswith('/') else args.path + '/'
+    for dset in args.splits:
+        export_split(path, dset, args.dest, args.dir, args.shard_mb * 2 ** 20)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+# STATISTICS MODULE
+# Dataset report computed in one streaming pass over the label files of each split.
+#
+# Usage (from src/scripts):
+#     python -m utils.stats data/raw/3.5m.v3i.yolov8/ --rows 4 --columns 4 --overlap 64 --output stats.json --plots stats/
+
+# Standard library imports
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# Local modules
+from utils import file_management, format, images, label_store, pipeline, tiling
+
+
+SPLITS = ('train', 'valid', 'test')
+
+
+class RunningStats:
+    """
+    Count, mean, variance, min and max of a stream of values (Welford, mergeable with Chan's formula).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def update(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if not len(values):
+            return
+        other = RunningStats()
+        other.count = len(values)
+        other.mean = float(values.mean())
+        other.m2 = float(((values - other.mean) ** 2).sum())
+        other.min = float(values.min())
+        other.max = float(values.max())
+        self.merge(other)
+
+    def merge(self, other: 'RunningStats'):
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def to_dict(self) -> dict:
+        if not self.count:
+            return {'count': 0}
+        return {'count': self.count, 'mean': self.mean, 'std': (self.m2 / self.count) ** 0.5,
+                'min': self.min, 'max': self.max}
+
+
+class FixedHistogram:
+    """
+    Histogram with fixed, equal-width bins; values outside [low, high) go to underflow/overflow.
+    """
+
+    def __init__(self, low: float, high: float, bins: int):
+        self.low = low
+        self.high = high
+        self.counts = np.zeros(bins + 2, dtype=np.int64)  # [underflow, bins..., overflow]
+
+    def update(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        bins = len(self.counts) - 2
+        index = np.floor((values - self.low) / (self.high - self.low) * bins).astype(np.int64) + 1
+        self.counts += np.bincount(np.clip(index, 0, bins + 1), minlength=bins + 2)
+
+    def merge(self, other: 'FixedHistogram'):
+        self.counts += other.counts
+
+    def to_dict(self) -> dict:
+        return {'low': self.low, 'high': self.high, 'counts': self.counts[1:-1].tolist(),
+                'underflow': int(self.counts[0]), 'overflow': int(self.counts[-1])}
+
+
+class SplitStats:
+    """
+    Partial statistics of a group of label files; partials of different workers are merged.
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.empty_files = 0
+        self.classes = np.zeros(0, dtype=np.int64)
+        self.per_image = RunningStats()
+        self.per_image_hist = FixedHistogram(0, 5000, 100)
+        self.width = RunningStats()
+        self.height = RunningStats()
+        self.width_hist = FixedHistogram(0, 0.1, 50)
+        self.height_hist = FixedHistogram(0, 0.1, 50)
+        self.per_tile = RunningStats()
+        self.per_tile_hist = FixedHistogram(0, 1000, 100)
+        self.tiled_boxes = 0
+        self.clipped_boxes = 0
+
+    def add(self, labels: np.ndarray, tiles: tuple | None = None):
+        """
+        Adds the labels (LABEL_DTYPE) of one file.
+
+        Args:
+            tiles: (im_height, im_width, rows, columns, overlap) to compute the per-tile counts.
+        """
+        self.files += 1
+        self.empty_files += not len(labels)
+        self.per_image.update([len(labels)])
+        self.per_image_hist.update([len(labels)])
+        if not len(labels):
+            return
+        class_counts = np.bincount(labels['class_id'].astype(np.int64))
+        if len(class_counts) > len(self.classes):
+            class_counts[:len(self.classes)] += self.classes
+            self.classes = class_counts
+        else:
+            self.classes[:len(class_counts)] += class_counts
+        for running, histogram, field in ((self.width, self.width_hist, 'width'), (self.height, self.height_hist, 'height')):
+            running.update(labels[field])
+            histogram.update(labels[field])
+
+        if tiles is not None:
+            im_height, im_width, rows, columns, overlap = tiles
+            values = format.label_array(labels)
+            boxes = format.yolo_to_xyxy(values[:, 1:5], im_height, im_width)
+            x_bounds = tiling.axis_bounds(im_width, columns, overlap)
+            y_bounds = tiling.axis_bounds(im_height, rows, overlap)
+            tile_index, box_index, clipped = tiling.assign_boxes(boxes, x_bounds, y_bounds, min_visibility=0.0)
+            counts = np.bincount(tile_index, minlength=rows * columns)
+            self.per_tile.update(counts)
+            self.per_tile_hist.update(counts)
+            # A box is clipped when some tile does not hold it whole
+            cut = np.any(clipped != boxes[box_index], axis=1)
+            self.tiled_boxes += len(boxes)
+            self.clipped_boxes += len(np.unique(box_index[cut]))
+
+    def merge(self, other: 'SplitStats'):
+        self.files += other.files
+        self.empty_files += other.empty_files
+        size = max(len(self.classes), len(other.classes))
+        self.classes = np.pad(self.classes, (0, size - len(self.classes))) + np.pad(other.classes, (0, size - len(other.classes)))
+        for name in ('per_image', 'per_image_hist', 'width', 'height', 'width_hist', 'height_hist', 'per_tile', 'per_tile_hist'):
+            getattr(self, name).merge(getattr(other, name))
+        self.tiled_boxes += other.tiled_boxes
+        self.clipped_boxes += other.clipped_boxes
+
+    def to_dict(self) -> dict:
+        report = {
+            'label_files': self.files,
+            'empty_files': self.empty_files,
+            'boxes': int(self.classes.sum()),
+            'boxes_per_class': {str(class_id): int(count) for class_id, count in enumerate(self.classes.tolist()) if count},
+            'grains_per_image': {**self.per_image.to_dict(), 'histogram': self.per_image_hist.to_dict()},
+            'box_width': {**self.width.to_dict(), 'histogram': self.width_hist.to_dict()},
+            'box_height': {**self.height.to_dict(), 'histogram': self.height_hist.to_dict()},
+        }
+        if self.per_tile.count:
+            report['grains_per_tile'] = {**self.per_tile.to_dict(), 'histogram': self.per_tile_hist.to_dict()}
+            report['clipped_share'] = self.clipped_boxes / self.tiled_boxes if self.tiled_boxes else 0.0
+        return report
+
+
+def _init_worker(path: str):
+    file_management.PATH = path
+
+
+def _stats_chunk(dset: str, dir: str, names: list[str], grid: tuple | None) -> SplitStats:
+    """
+    Statistics of a chunk of label files (one file in memory at a time).
+    """
+    partial = SplitStats()
+    folder = file_management.build_filename(dset=dset, type='label', dir=dir)
+    for name in names:
+        with open(os.path.join(folder, f"{name}.txt"), 'rb') as file:
+            labels, _ = label_store.parse_labels([file.read()])
+        tiles = None
+        if grid is not None:
+            image_path = file_management.build_filename(dset=dset, type='image', dir=dir, name=name)
+            if os.path.exists(image_path):
+                tiles = (*images.image_size(image_path), *grid)
+        partial.add(labels, tiles)
+    return partial
+
+
+def split_stats(path: str, dset: str, dir: str = 'in', rows: int | None = None, columns: int | None = None,
+                overlap: int = 0, workers: int | None = None, chunk_size: int = 64) -> dict:
+    """
+    Statistics of one split, streaming its label files in a pool of processes.
+
+    Args:
+        path: Root of the raw dataset (the PATH used by build_filename).
+        dset: Split ('train', 'valid' or 'test').
+        dir: Dataset ('in' raw, 'out' processed).
+        rows, columns, overlap: Tile grid for the per-tile counts and the clipped share (optional).
+        workers: Number of processes (default os.cpu_count(); 1 runs in the current process).
+        chunk_size: Label files per task.
+
+    Returns:
+        Report of the split (see SplitStats.to_dict) plus the number of images.
+    """
+    _init_worker(path)
+    folder = file_management.build_filename(dset=dset, type='label', dir=dir)
+    names = []
+    if os.path.isdir(folder):
+        with os.scandir(folder) as entries:
+            names = sorted(entry.name[:-len('.txt')] for entry in entries if entry.name.endswith('.txt'))
+    grid = (rows, columns, overlap) if rows and columns else None
+    chunks = [names[start:start + chunk_size] for start in range(0, len(names), chunk_size)]
+
+    total = SplitStats()
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for chunk in chunks:
+            total.merge(_stats_chunk(dset, dir, chunk, grid))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(path,)) as pool:
+            for partial in pool.map(_stats_chunk, [dset] * len(chunks), [dir] * len(chunks), chunks, [grid] * len(chunks)):
+                total.merge(partial)
+
+    return {'images': len(pipeline.list_images(dset, dir)), **total.to_dict()}
+
+
+def save_plots(report: dict, folder: str):
+    """
+    PNG of every histogram of the report ('{split}_{metric}.png').
+    """
+    import matplotlib
+    matplotlib.use('Agg')  # Headless
+    import matplotlib.pyplot as plt
+
+    os.makedirs(folder, exist_ok=True)
+    for dset, split in report.items():
+        for metric, values in split.items():
+            if not isinstance(values, dict) or 'histogram' not in values:
+                continue
+            histogram = values['histogram']
+            counts = histogram['counts']
+            edges = np.linspace(histogram['low'], histogram['high'], len(counts) + 1)
+            fig, ax = plt.subplots(figsize=(8, 4))
+            ax.stairs(counts, edges, fill=True)
+            ax.set_title(f"{dset}: {metric} (overflow: {histogram['overflow']})")
+            fig.savefig(os.path.join(folder, f"{dset}_{metric}.png"), dpi=100, bbox_inches='tight')
+            plt.close(fig)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Streaming statistics of a YOLO dataset.")
+    parser.add_argument('path', help="Root of the raw dataset (eg: data/raw/3.5m.v3i.yolov8/)")
+    parser.add_argument('--splits', nargs='+', default=list(SPLITS), choices=SPLITS)
+    parser.add_argument('--dir', default='in', choices=['in', 'out'], help="'out' reads the processed tiles")
+    parser.add_argument('--rows', type=int, default=None, help="Tile grid for the per-tile counts")
+    parser.add_argument('--columns', type=int, default=None)
+    parser.add_argument('--overlap', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default='stats.json', help="JSON report")
+    parser.add_argument('--plots', default=None, metavar='FOLDER', help="Saves PNG histograms in this folder")
+    args = parser.parse_args(argv)
+
+    path = args.path if args.path.endswith('/') else args.path + '/'
+    report = {dset: split_stats(path, dset, args.dir, args.rows, args.columns, args.overlap, args.workers)
+              for dset in args.splits}
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    if args.plots:
+        save_plots(report, args.plots)
+
+    for dset, split in report.items():
+        print(f"> {dset}: {split['images']} imágenes, {split['boxes']} granos "
+              f"({split['grains_per_image'].get('mean', 0):.1f} por imagen)")
+    print(f"✅ Informe guardado en {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+# TILING MODULE
+
+# Standard library imports
+import os
+from collections.abc import Iterator
+import numpy as np
+import pandas as pd
+import cv2 as cv
+
+# Local modules
+from utils import file_management, format, images, label_store, performance
+
+
+def tile_prefix(row: int, column: int) -> str:
+    """
+    Prefijo del mosaico que build_filename inserta en el nombre (eg: 'tile00x03').
+    """
+    return f"tile{row:02d}x{column:02d}"
+
+
+def axis_bounds(size: int, n_tiles: int, overlap: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Splits one image axis in n_tiles segments of equal length that overlap 'overlap' pixels.
+
+    Args:
+        size: Length of the axis in pixels.
+        n_tiles: Number of segments.
+        overlap: Pixels shared by two consecutive segments.
+
+    Returns:
+        (starts, ends): Sorted int64 arrays with the segment limits [start, end).
+
+    Raises:
+        ValueError: If the axis is too short for n_tiles non-empty segments.
+    """
+    if n_tiles < 1:
+        raise ValueError("❕The number of tiles must be positive.")
+    if overlap < 0:
+        raise ValueError("❕Overlap can not be negative.")
+
+    length = -(-(size + (n_tiles - 1) * overlap) // n_tiles)  # ceil
+    if n_tiles > 1 and overlap >= length:
+        raise ValueError(f"❕Overlap ({overlap}px) must be smaller than the tile size ({length}px).")
+
+    if (n_tiles - 1) * (length - overlap) >= size:
+        # The rounded up length leaves the last segments without pixels (eg: 10 px in 6 tiles)
+        raise ValueError(f"❕{size}px can not be split in {n_tiles} tiles with {overlap}px of overlap.")
+
+    starts = np.arange(n_tiles, dtype=np.int64) * (length - overlap)
+    ends = np.minimum(starts + length, size)
+    return starts, ends
+
+
+def tile_grid(im_height: int, im_width: int, rows: int, columns: int, overlap: int = 0) -> np.ndarray:
+    """
+    Coordinates of every tile of a rows x columns grid.
+
+    Returns:
+        int64 array (rows * columns, 4) with (x0, y0, x1, y1), ordered like format.get_index
+        (index = column + row * columns).
+    """
+    x_starts, x_ends = axis_bounds(im_width, columns, overlap)
+    y_starts, y_ends = axis_bounds(im_height, rows, overlap)
+
+    grid = np.empty((rows, columns, 4), dtype=np.int64)
+    grid[..., 0] = x_starts[None, :]
+    grid[..., 1] = y_starts[:, None]
+    grid[..., 2] = x_ends[None, :]
+    grid[..., 3] = y_ends[:, None]
+    return grid.reshape(-1, 4)
+
+
+def assign_boxes(boxes: np.ndarray, x_bounds: tuple, y_bounds: tuple, min_visibility: float = 0.5) -> tuple:
+    """
+    Assigns absolute boxes to the tiles they overlap and clips them to the tile.
+
+    Each box only visits the tiles found with searchsorted over the (sorted) tile limits,
+    so the cost grows with the number of box/tile intersections instead of boxes x tiles.
+
+    Args:
+        boxes: float array (N, 4) with absolute (x0, y0, x1, y1).
+        x_bounds: (starts, ends) of the grid columns (see axis_bounds).
+        y_bounds: (starts, ends) of the grid rows.
+        min_visibility: Minimum fraction of the box area inside a tile to keep it there.
+
+    Returns:
+        (tile_index, box_index, clipped): Pairs sorted by tile index (get_index order) and the
+        clipped absolute coordinates (float64 (K, 4)) of each pair.
+    """
+    x_starts, x_ends = x_bounds
+    y_starts, y_ends = y_bounds
+    columns = len(x_starts)
+    x0, y0, x1, y1 = boxes.T
+
+    # First and last column/row touched by each box
+    col_lo = np.searchsorted(x_ends, x0, side='right')
+    col_hi = np.searchsorted(x_starts, x1, side='left') - 1
+    row_lo = np.searchsorted(y_ends, y0, side='right')
+    row_hi = np.searchsorted(y_starts, y1, side='left') - 1
+    n_cols = np.maximum(col_hi - col_lo + 1, 0)
+    n_rows = np.maximum(row_hi - row_lo + 1, 0)
+    n_pairs = n_cols * n_rows
+
+    # Expands every box into its (row, column) candidates without a Python loop
+    box_index = np.repeat(np.arange(len(boxes)), n_pairs)
+    first_pair = np.cumsum(n_pairs) - n_pairs
+    local = np.arange(len(box_index)) - np.repeat(first_pair, n_pairs)
+    width = n_cols[box_index]
+    row = row_lo[box_index] + local // np.maximum(width, 1)
+    column = col_lo[box_index] + local % np.maximum(width, 1)
+    tile_index = column + row * columns
+
+    clipped = np.empty((len(box_index), 4), dtype=np.float64)
+    np.maximum(x0[box_index], x_starts[column], out=clipped[:, 0])
+    np.maximum(y0[box_index], y_starts[row], out=clipped[:, 1])
+    np.minimum(x1[box_index], x_ends[column], out=clipped[:, 2])
+    np.minimum(y1[box_index], y_ends[row], out=clipped[:, 3])
+
+    # Drops the pairs where too little of the box is left inside the tile
+    area = ((x1 - x0) * (y1 - y0))[box_index]
+    visible = (clipped[:, 2] - clipped[:, 0]) * (clipped[:, 3] - clipped[:, 1])
+    keep = (area > 0) & (visible >= min_visibility * area)
+
+    order = np.argsort(tile_index[keep], kind='stable')
+    return tile_index[keep][order], box_index[keep][order], clipped[keep][order]
+
+
+def slice_labels(labels: pd.DataFrame | np.ndarray, im_height: int, im_width: int, rows: int, columns: int,
+                 overlap: int = 0, min_visibility: float = 0.5) -> tuple[np.ndarray, list[np.ndarray]]:
+    """
+    Splits the YOLO labels of an image among the tiles of a grid.
+
+    Args:
+        labels: Labels of the whole image (relative YOLO format).
+        im_height: Image height in pixels.
+        im_width: Image width in pixels.
+        rows: Rows of the tile grid.
+        columns: Columns of the tile grid.
+        overlap: Pixels shared by neighbour tiles.
+        min_visibility: Minimum fraction of a box that must be inside a tile to keep it (clipped).
+
+    Returns:
+        (tiles, tile_labels): Tile coordinates (see tile_grid) and, for each tile, a float64
+        (K, 5) array with its labels in relative YOLO format (relative to the tile).
+    """
+    values = format.label_array(labels)
+    x_bounds = axis_bounds(im_width, columns, overlap)
+    y_bounds = axis_bounds(im_height, rows, overlap)
+    tiles = tile_grid(im_height, im_width, rows, columns, overlap)
+
+    # Relative center/size -> absolute corners
+    boxes = format.yolo_to_xyxy(values[:, 1:5], im_height, im_width)
+
+    tile_index, box_index, clipped = assign_boxes(boxes, x_bounds, y_bounds, min_visibility)
+
+    # Absolute corners -> center/size relative to the owning tile
+    origin = tiles[tile_index]
+    tile_w = (origin[:, 2] - origin[:, 0]).astype(np.float64)
+    tile_h = (origin[:, 3] - origin[:, 1]).astype(np.float64)
+    output = np.empty((len(box_index), 5), dtype=np.float64)
+    output[:, 0] = values[box_index, 0]
+    output[:, 1] = ((clipped[:, 0] + clipped[:, 2]) / 2 - origin[:, 0]) / tile_w
+    output[:, 2] = ((clipped[:, 1] + clipped[:, 3]) / 2 - origin[:, 1]) / tile_h
+    output[:, 3] = (clipped[:, 2] - clipped[:, 0]) / tile_w
+    output[:, 4] = (clipped[:, 3] - clipped[:, 1]) / tile_h
+
+    bounds = np.searchsorted(tile_index, np.arange(len(tiles) + 1))
+    return tiles, [output[bounds[i]:bounds[i + 1]] for i in range(len(tiles))]
+
+
+def tile_image(image: np.ndarray, labels: pd.DataFrame | np.ndarray, rows: int, columns: int,
+               overlap: int = 0, min_visibility: float = 0.5) -> Iterator[tuple[int, str, np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Slices an image and its labels in a rows x columns grid.
+
+    Yields:
+        (index, prefix, coord, tile, tile_labels): get_index position, filename prefix,
+        tile coordinates (x0, y0, x1, y1), the tile as a view of the image and its labels.
+    """
+    im_height, im_width = image.shape[:2]
+    with performance.stage('tile'):
+        tiles, tile_labels = slice_labels(labels, im_height, im_width, rows, columns, overlap, min_visibility)
+
+    for index, (x0, y0, x1, y1) in enumerate(tiles.tolist()):
+        row, column = divmod(index, columns)
+        yield index, tile_prefix(row, column), (x0, y0, x1, y1), images.crop(image, (x0, y0, x1, y1)), tile_labels[index]
+
+
+def save_tiles(image: np.ndarray, labels: pd.DataFrame | np.ndarray, dset: str, name: str, rows: int, columns: int,
+               overlap: int = 0, min_visibility: float = 0.5, dir: str = 'out', skip_empty: bool = False,
+               precision: int | None = None) -> list[str]:
+    """
+    Slices an image with its labels and writes every tile (paths from TilePaths).
+
+    Args:
+        image: Source image (as read by cv.imread).
+        labels: Labels of the source image (relative YOLO format).
+        dset: Dataset split ('train', 'valid' or 'test').
+        name: Source filename without extension.
+        rows, columns: Tile grid.
+        overlap: Pixels shared by neighbour tiles.
+        min_visibility: Minimum visible fraction to keep a clipped box.
+        dir: Destination dataset ('out' by default).
+        skip_empty: Does not write tiles without any box.
+        precision: Fixed number of decimals for the labels (see save_labels).
+
+    Returns:
+        Paths of the files written (image and label of each tile).
+    """
+    paths = file_management.TilePaths(dset, name, dir)
+
+    written = []
+    for _, prefix, _, tile, tile_labels in tile_image(image, labels, rows, columns, overlap, min_visibility):
+        if skip_empty and not len(tile_labels):
+            continue
+        image_path, label_path = paths.path('image', prefix), paths.path('label', prefix)
+        if not written:
+            os.makedirs(os.path.dirname(image_path), exist_ok=True)
+            os.makedirs(os.path.dirname(label_path), exist_ok=True)
+
+        with performance.stage('write'):
+            if not cv.imwrite(image_path, tile):
+                raise OSError(f"🚫 No se pudo guardar el mosaico:\n {image_path}")
+            file_management.save_labels(label_path, tile_labels, verbose=False, precision=precision)
+        written += [image_path, label_path]
+
+    return written
+
+
+def read_labels(label_path: str) -> np.ndarray:
+    """
+    Reads one YOLO label file as a structured array (LABEL_DTYPE).
+    """
+    with open(label_path, 'rb') as file:
+        boxes, _ = label_store.parse_labels([file.read()])
+    return boxes
+
+
+def tile_file(dset: str, name: str, rows: int, columns: int, overlap: int = 0, min_visibility: float = 0.5,
+              skip_empty: bool = False, precision: int | None = None) -> list[str]:
+    """
+    Tiles one image of the raw dataset ('in') into the processed dataset ('out').
+
+    Args:
+        dset: Dataset split ('train', 'valid' or 'test').
+        name: Filename without extension (eg: '209_205_50_JPG.rf.a6fd...').
+
+    Returns:
+        Paths of the files written.
+    """
+    image_path = file_management.build_filename(dset=dset, type='image', dir='in', name=name)
+    label_path = file_management.build_filename(dset=dset, type='label', dir='in', name=name)
+
+    with performance.stage('decode'):
+        image = images.read_image(image_path, cache=False)  # Decoded once per run: nothing to reuse
+    with performance.stage('label'):
+        labels = read_labels(label_path) if os.path.exists(label_path) else np.empty(0, dtype=format.LABEL_DTYPE)
+
+    return save_tiles(image, labels, dset, name, rows, columns, overlap, min_visibility,
+                      skip_empty=skip_empty, precision=precision)
@@ -0,0 +1,309 @@
+# VALIDATE MODULE
+# Integrity checks of a YOLO dataset before it is tiled or trained on: malformed label files,
+# non-finite values, invalid class ids, zero-area and out-of-range boxes, duplicated and
+# near-duplicated boxes, label files without images and images without labels.
+#
+# The checks run on every box of a chunk of files at once (NumPy masks), image sizes come from
+# the JPEG headers (images.image_size, no decode) and chunks are spread over a pool of processes.
+#
+# Usage (from src/scripts):
+#     python -m utils.validate data/raw/3.5m.v3i.yolov8/ --splits train valid test --output validate.json [--fix]
+
+# Standard library imports
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# Local modules
+from utils import file_management, images, merge, pipeline
+
+
+CHECKS = ('malformed', 'non_finite', 'class_id', 'zero_area', 'out_of_range', 'duplicate', 'near_duplicate',
+          'missing_image', 'missing_label', 'unreadable_image')
+BOX_CHECKS = ('non_finite', 'class_id', 'zero_area', 'out_of_range', 'duplicate', 'near_duplicate')
+FIXABLE = BOX_CHECKS  # File level problems are only reported
+
+TOLERANCE = 1e-6  # Slack on the [0, 1] range for values rounded when the labels were exported
+_SCALE = 1000.0  # Relative coordinates -> units of merge.candidate_pairs (its cells are at least 1.0)
+
+
+def parse_chunk(contents: list[bytes]) -> tuple[np.ndarray, np.ndarray, dict[int, str]]:
+    """
+    Parses many label files at once, setting aside the ones that can not be read.
+
+    Like label_store.parse_labels, but a malformed file does not stop the others.
+
+    Returns:
+        (values, offsets, malformed): float64 (N, 5) boxes, int64 offsets of each file and
+        {file position: reason} of the malformed files (parsed as empty).
+    """
+    tokens = []
+    counts = np.zeros(len(contents), dtype=np.int64)
+    malformed = {}
+    for i, content in enumerate(contents):
+        values = content.split()
+        if len(values) % 5:
+            malformed[i] = f"{len(values)} values, not 5 per box"
+            continue
+        counts[i] = len(values) // 5
+        tokens.extend(values)
+
+    try:
+        values = np.array(tokens, dtype=np.float64).reshape(-1, 5)
+    except ValueError:
+        # Some file has a non-numeric token: convert file by file to find it
+        parts = []
+        for i, content in enumerate(contents):
+            if i in malformed:
+                continue
+            try:
+                parts.append(np.array(content.split(), dtype=np.float64).reshape(-1, 5))
+            except ValueError:
+                malformed[i] = "non-numeric value"
+                counts[i] = 0
+        values = np.concatenate(parts) if parts else np.empty((0, 5))
+
+    offsets = np.zeros(len(contents) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return values, offsets, malformed
+
+
+def yolo_corners(values: np.ndarray) -> np.ndarray:
+    """
+    Relative (x0, y0, x1, y1) of YOLO rows (class_id, x_center, y_center, width, height).
+    """
+    half = values[:, 3:5] / 2
+    return np.concatenate([values[:, 1:3] - half, values[:, 1:3] + half], axis=1)
+
+
+def check_boxes(values: np.ndarray, offsets: np.ndarray, sizes: np.ndarray | None = None, n_classes: int | None = None,
+                iou_threshold: float = 0.9, min_pixels: float = 1.0, class_agnostic: bool = False) -> dict[str, np.ndarray]:
+    """
+    Box level checks of many files at once.
+
+    Args:
+        values: float64 (N, 5) boxes of every file, file after file.
+        offsets: int64 offsets of each file (boxes of file i are values[offsets[i]:offsets[i + 1]]).
+        sizes: float (n_files, 2) (height, width) of each image (NaN when unknown), to flag boxes
+            narrower than min_pixels (they become zero-area once converted to pixels).
+        n_classes: Number of classes (class ids must be below it), None only checks they are
+            non-negative integers.
+        iou_threshold: IoU from which two boxes of the same file (and class) are near duplicates.
+        class_agnostic: Compares boxes of different classes too.
+
+    Returns:
+        {check: bool mask of the boxes that fail it} for every check in BOX_CHECKS. Of two
+        duplicated boxes only the later one is flagged.
+    """
+    n_boxes = len(values)
+    file_ids = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    class_ids = values[:, 0]
+
+    with np.errstate(invalid='ignore'):
+        non_finite = ~np.isfinite(values).all(axis=1)
+        bad_class = (class_ids < 0) | (class_ids != np.round(class_ids))
+        if n_classes is not None:
+            bad_class |= class_ids >= n_classes
+        bad_class &= ~non_finite
+
+        zero_area = ~non_finite & ((values[:, 3] <= 0) | (values[:, 4] <= 0))
+        if sizes is not None and n_boxes:
+            box_sizes = sizes[file_ids]  # NaN for unknown images: the comparison is False
+            zero_area |= ~non_finite & ((values[:, 3] * box_sizes[:, 1] < min_pixels) |
+                                        (values[:, 4] * box_sizes[:, 0] < min_pixels))
+
+        corners = yolo_corners(values)
+        out_of_range = ~non_finite & ((corners < -TOLERANCE) | (corners > 1 + TOLERANCE)).any(axis=1)
+
+    # Exact duplicates: identical rows end up next to each other once sorted by (file, row)
+    duplicate = np.zeros(n_boxes, dtype=bool)
+    if n_boxes > 1:
+        keys = np.column_stack([file_ids, values])
+        order = np.lexsort(keys.T[::-1])  # Stable: the first occurrence stays first
+        same = (keys[order[1:]] == keys[order[:-1]]).all(axis=1)
+        duplicate[order[1:][same]] = True
+
+    # Near duplicates among the remaining boxes, clipped to the image. IoU does not change when an axis
+    # is scaled, so it is computed on relative coordinates; each file is shifted right of the previous
+    # one so the grid of candidate_pairs never pairs boxes of different files.
+    near_duplicate = np.zeros(n_boxes, dtype=bool)
+    with np.errstate(invalid='ignore'):
+        clipped = np.clip(corners, 0.0, 1.0) * _SCALE
+        sides = clipped[:, 2:4] - clipped[:, 0:2]
+        candidates = np.flatnonzero(~(non_finite | bad_class | zero_area | duplicate) & (sides.min(axis=1) > 0))
+    if len(candidates) > 1:
+        boxes = clipped[candidates]
+        boxes[:, 0::2] += (file_ids[candidates] * 3 * _SCALE)[:, None]
+        # Bucketed by box size class, so a few huge boxes do not put every box in one cell
+        first, second = merge.candidate_pairs(boxes, iou_threshold)
+        keep = file_ids[candidates[first]] == file_ids[candidates[second]]
+        if not class_agnostic:
+            keep &= class_ids[candidates[first]] == class_ids[candidates[second]]
+        first, second = first[keep], second[keep]
+        overlapping = merge.box_iou(boxes[first], boxes[second]) >= iou_threshold
+        near_duplicate[candidates[np.maximum(first, second)[overlapping]]] = True
+
+    return {'non_finite': non_finite, 'class_id': bad_class, 'zero_area': zero_area, 'out_of_range': out_of_range,
+            'duplicate': duplicate, 'near_duplicate': near_duplicate}
+
+
+def fix_boxes(values: np.ndarray, flags: dict[str, np.ndarray], min_size: float = 0.0) -> np.ndarray:
+    """
+    Drops the invalid and duplicated boxes and clips the out-of-range ones to the image.
+
+    Returns:
+        float64 (K, 5) boxes (boxes left without area after clipping are dropped too).
+    """
+    drop = flags['non_finite'] | flags['class_id'] | flags['zero_area'] | flags['duplicate'] | flags['near_duplicate']
+    fixed = values[~drop]
+    clip = flags['out_of_range'][~drop]
+    # Only the clipped rows are recomputed: the others are written back with the same values
+    corners = np.clip(yolo_corners(fixed[clip]), 0.0, 1.0)
+    fixed[clip, 1:3] = (corners[:, 0:2] + corners[:, 2:4]) / 2
+    fixed[clip, 3:5] = corners[:, 2:4] - corners[:, 0:2]
+    return fixed[(fixed[:, 3] > min_size) & (fixed[:, 4] > min_size)]
+
+
+def _init_worker(path: str):
+    file_management.PATH = path
+
+
+def _validate_chunk(dset: str, dir: str, entries: list[tuple[str, bool, bool]], params: dict) -> dict:
+    """
+    Checks a chunk of (name, has_image, has_label) entries; fixes the label files when asked.
+    """
+    issues, counts = [], dict.fromkeys(CHECKS, 0)
+    contents, sizes = [], np.full((len(entries), 2), np.nan)
+
+    for i, (name, has_image, has_label) in enumerate(entries):
+        if has_image:
+            try:
+                sizes[i] = images.image_size(file_management.build_filename(dset=dset, type='image', dir=dir, name=name))
+            except OSError as e:
+                issues.append({'name': name, 'check': 'unreadable_image', 'message': str(e)})
+        else:
+            issues.append({'name': name, 'check': 'missing_image'})
+        if has_label:
+            with open(file_management.build_filename(dset=dset, type='label', dir=dir, name=name), 'rb') as file:
+                contents.append(file.read())
+        else:
+            contents.append(b'')
+            issues.append({'name': name, 'check': 'missing_label'})
+
+    values, offsets, malformed = parse_chunk(contents)
+    for i, reason in malformed.items():
+        issues.append({'name': entries[i][0], 'check': 'malformed', 'message': reason})
+    flags = check_boxes(values, offsets, sizes, params['n_classes'], params['iou_threshold'], params['min_pixels'],
+                        params['class_agnostic'])
+
+    failed = np.zeros(len(values), dtype=bool)
+    for mask in flags.values():
+        failed |= mask
+    fixed = []
+    for i in np.unique(np.searchsorted(offsets, np.flatnonzero(failed), side='right') - 1).tolist():
+        start, end = offsets[i], offsets[i + 1]
+        name = entries[i][0]
+        for check in BOX_CHECKS:
+            rows = np.flatnonzero(flags[check][start:end])
+            if len(rows):
+                issues.append({'name': name, 'check': check, 'boxes': rows.tolist()})
+        if params['fix']:
+            file_flags = {check: mask[start:end] for check, mask in flags.items()}
+            label_path = file_management.build_filename(dset=dset, type='label', dir=dir, name=name)
+            file_management.save_labels(label_path, fix_boxes(values[start:end], file_flags), verbose=False)
+            fixed.append(name)
+
+    for issue in issues:
+        counts[issue['check']] += len(issue.get('boxes', (None,)))
+    return {'labels': sum(has_label for _, _, has_label in entries), 'images': sum(has_image for _, has_image, _ in entries),
+            'boxes': len(values), 'counts': counts, 'issues': issues, 'fixed': fixed}
+
+
+def validate_split(path: str, dset: str, dir: str = 'in', n_classes: int | None = None, iou_threshold: float = 0.9,
+                   min_pixels: float = 1.0, class_agnostic: bool = False, fix: bool = False,
+                   workers: int | None = None, chunk_size: int = 256) -> dict:
+    """
+    Validates every label file and image of one split.
+
+    Args:
+        path: Root of the raw dataset (the PATH used by build_filename).
+        dset: Split ('train', 'valid' or 'test').
+        dir: Dataset ('in' raw, 'out' processed).
+        n_classes, iou_threshold, min_pixels, class_agnostic: See check_boxes.
+        fix: Rewrites the label files with box problems (see fix_boxes).
+        workers: Number of processes (default os.cpu_count(); 1 runs in the current process).
+        chunk_size: Files per task.
+
+    Returns:
+        Report: number of label files, images and boxes, count per check (boxes for box checks,
+        files otherwise), files with issues, fixed files and every issue as
+        {'name', 'check', 'boxes' (positions in the file) | 'message'}.
+    """
+    _init_worker(path)
+    folder = file_management.build_filename(dset=dset, type='label', dir=dir)
+    label_names = set()
+    if os.path.isdir(folder):
+        with os.scandir(folder) as entries:
+            label_names = {entry.name[:-len('.txt')] for entry in entries if entry.name.endswith('.txt')}
+    image_names = set(pipeline.list_images(dset, dir))
+    entries = [(name, name in image_names, name in label_names) for name in sorted(image_names | label_names)]
+    chunks = [entries[start:start + chunk_size] for start in range(0, len(entries), chunk_size)]
+    params = {'n_classes': n_classes, 'iou_threshold': iou_threshold, 'min_pixels': min_pixels,
+              'class_agnostic': class_agnostic, 'fix': fix}
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        results = [_validate_chunk(dset, dir, chunk, params) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(path,)) as pool:
+            results = list(pool.map(_validate_chunk, [dset] * len(chunks), [dir] * len(chunks), chunks,
+                                    [params] * len(chunks)))
+
+    issues = [issue for result in results for issue in result['issues']]
+    return {
+        'labels': sum(result['labels'] for result in results),
+        'images': sum(result['images'] for result in results),
+        'boxes': sum(result['boxes'] for result in results),
+        'counts': {check: sum(result['counts'][check] for result in results) for check in CHECKS},
+        'files_with_issues': len({issue['name'] for issue in issues}),
+        'fixed': sum(len(result['fixed']) for result in results),
+        'issues': issues,
+    }
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Integrity checks of the labels and images of a YOLO dataset.")
+    parser.add_argument('path', help="Root of the raw dataset (eg: data/raw/3.5m.v3i.yolov8/)")
+    parser.add_argument('--splits', nargs='+', default=list(pipeline.SPLITS), choices=pipeline.SPLITS)
+    parser.add_argument('--dir', default='in', choices=['in', 'out'], help="'out' checks the processed tiles")
+    parser.add_argument('--classes', type=int, default=None, help="Number of classes (ids must be below it)")
+    parser.add_argument('--iou', type=float, default=0.9, help="IoU of near-duplicated boxes")
+    parser.add_argument('--min-pixels', type=float, default=1.0, help="Smallest box side in pixels")
+    parser.add_argument('--class-agnostic', action='store_true', help="Near duplicates across classes too")
+    parser.add_argument('--fix', action='store_true', help="Rewrites the label files with box problems")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default='validate.json', help="JSON report")
+    args = parser.parse_args(argv)
+
+    path = args.path if args.path.endswith('/') else args.path + '/'
+    report = {dset: validate_split(path, dset, args.dir, args.classes, args.iou, args.min_pixels, args.class_agnostic,
+                                   args.fix, args.workers) for dset in args.splits}
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    remaining = 0
+    for dset, split in report.items():
+        found = ', '.join(f"{check}: {count}" for check, count in split['counts'].items() if count) or 'sin problemas'
+        print(f"> {dset}: {split['labels']} etiquetas, {split['images']} imágenes, {split['boxes']} granos | {found}")
+        if args.fix:
+            print(f"  {split['fixed']} archivos de etiquetas corregidos")
+        remaining += sum(count for check, count in split['counts'].items() if not (args.fix and check in FIXABLE))
+    print(f"{'❕' if remaining else '✅'} Informe guardado en {args.output}")
+    sys.exit(1 if remaining else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,264 @@
 # VISUALIZATION TOOLS MODULE
+# Renders label overlays straight into the image array (no matplotlib needed, works headless).
+#
+# Usage (from src/scripts), QA overlays of a whole split:
+#     python -m utils.visualization data/raw/3.5m.v3i.yolov8/ --splits valid --dest data/qa/ --workers 8
+#
+# OpenCV (and the image/tiling/pipeline modules that need it) is imported by the functions that draw,
+# encode or read images, so importing this module only costs numpy and pandas.
 
 # Standard library imports
-import matplotlib.pyplot as plt
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
-import cv2 as cv
+
+# Local modules
+from utils import file_management, format
+
+
+# Fixed class -> color table (BGR, like cv.imread images): the same class always gets the same color
+PALETTE = np.array([
+    (56, 56, 255), (151, 157, 255), (31, 112, 255), (29, 178, 255), (49, 210, 207),
+    (10, 249, 72), (23, 204, 146), (134, 219, 61), (52, 147, 26), (187, 212, 0),
+    (168, 153, 44), (255, 194, 0), (147, 69, 52), (255, 115, 100), (236, 24, 0),
+    (255, 56, 132), (133, 0, 82), (255, 56, 203), (200, 149, 255), (199, 55, 255),
+], dtype=np.uint8)
+
+STYLES = ('boxes', 'points')
+
+
+def class_colors(class_ids: np.ndarray) -> np.ndarray:
+    """
+    Palette color (uint8 BGR, shape (N, 3)) of each class id.
+    """
+    return PALETTE[np.asarray(class_ids, dtype=np.int64) % len(PALETTE)]
+
+
+def _canvas(image: np.ndarray, copy: bool) -> np.ndarray:
+    """
+    3-channel uint8 image to draw on (grayscale images are converted, others copied if asked).
+    """
+    if image.ndim == 2:
+        import cv2 as cv
+        return cv.cvtColor(image, cv.COLOR_GRAY2BGR)
+    return image.copy() if copy else image
+
+
+def render_boxes(image: np.ndarray, boxes: np.ndarray, class_ids: np.ndarray | None = None,
+                 thickness: int = 1, copy: bool = True) -> np.ndarray:
+    """
+    Draws every box of an image with one cv.polylines call per class.
+
+    Args:
+        image: Image to draw on.
+        boxes: Absolute corners (N, 4) as (x0, y0, x1, y1).
+        class_ids: Class of each box (default all 0), selects the palette color.
+        thickness: Line width in pixels.
+        copy: Draws on a copy (False draws in place).
+
+    Returns:
+        Image with the boxes.
+    """
+    import cv2 as cv
+
+    output = _canvas(image, copy)
+    boxes = np.rint(np.asarray(boxes, dtype=np.float64).reshape(-1, 4)).astype(np.int32)
+    class_ids = np.zeros(len(boxes), dtype=np.int64) if class_ids is None else np.asarray(class_ids, dtype=np.int64)
+
+    # Each box as a closed 4 point polygon: (x0, y0) (x1, y0) (x1, y1) (x0, y1)
+    polygons = boxes[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+    for class_id in np.unique(class_ids).tolist():
+        color = class_colors(class_id).tolist()
+        cv.polylines(output, list(polygons[class_ids == class_id]), True, color, thickness)
+    return output
+
+
+def render_points(image: np.ndarray, points: np.ndarray, class_ids: np.ndarray | None = None,
+                  radius: int = 7, copy: bool = True) -> np.ndarray:
+    """
+    Draws a filled disc on every point, rasterized with a single fancy-index assignment.
+
+    Args:
+        image: Image to draw on.
+        points: Absolute centers (N, 2) as (x, y).
+        class_ids: Class of each point (default all 0), selects the palette color.
+        radius: Disc radius in pixels.
+        copy: Draws on a copy (False draws in place).
+
+    Returns:
+        Image with the points.
+    """
+    output = _canvas(image, copy)
+    points = np.rint(np.asarray(points, dtype=np.float64).reshape(-1, 2)).astype(np.int64)
+    class_ids = np.zeros(len(points), dtype=np.int64) if class_ids is None else np.asarray(class_ids, dtype=np.int64)
+
+    # Pixel offsets of a disc, added to every center at once
+    dy, dx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    inside = dx ** 2 + dy ** 2 <= radius ** 2
+    xs = (points[:, 0, None] + dx[inside]).ravel()
+    ys = (points[:, 1, None] + dy[inside]).ravel()
+    colors = np.repeat(class_colors(class_ids), inside.sum(), axis=0)
+
+    height, width = output.shape[:2]
+    keep = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+    output[ys[keep], xs[keep]] = colors[keep]
+    return output
+
+
+def render_labels(image: np.ndarray, labels: pd.DataFrame | np.ndarray, style: str = 'boxes',
+                  thickness: int = 1, radius: int = 7, copy: bool = True) -> np.ndarray:
+    """
+    Draws YOLO labels (relative format, as read from the label files) on their image.
+
+    Args:
+        image: Image the labels belong to.
+        labels: DataFrame, structured array (LABEL_DTYPE) or (N, 5) array.
+        style: 'boxes' draws the bounding boxes, 'points' their centroids.
+        thickness: Line width of the boxes.
+        radius: Radius of the points.
+        copy: Draws on a copy (False draws in place).
+
+    Returns:
+        Image with the overlay.
+    """
+    if style not in STYLES:
+        raise ValueError(f"❕Invalid 'style': must be one of {STYLES}.")
+
+    values = format.label_array(labels)
+    im_height, im_width = image.shape[:2]
+
+    if style == 'points':
+        return render_points(image, values[:, 1:3] * (im_width, im_height), values[:, 0], radius, copy)
+
+    boxes = format.yolo_to_xyxy(values[:, 1:5], im_height, im_width)
+    return render_boxes(image, boxes, values[:, 0], thickness, copy)
+
+
+def _encode_params(ext: str, quality: int) -> list[int]:
+    import cv2 as cv
+
+    ext = ext.lower()
+    if ext in ('.jpg', '.jpeg'):
+        return [cv.IMWRITE_JPEG_QUALITY, quality]
+    if ext == '.png':
+        return [cv.IMWRITE_PNG_COMPRESSION, 3]
+    raise ValueError("❕Invalid extension: must be '.jpg', '.jpeg' or '.png'.")
+
+
+def encode_image(image: np.ndarray, ext: str = '.jpg', quality: int = 90) -> bytes:
+    """
+    Encodes an image as JPEG or PNG bytes (eg: to send a render without touching the disk).
+    """
+    import cv2 as cv
+
+    ok, buffer = cv.imencode(ext, image, _encode_params(ext, quality))
+    if not ok:
+        raise ValueError(f"🚫 No se pudo codificar la imagen como '{ext}'.")
+    return buffer.tobytes()
+
+
+def save_render(file_path: str, image: np.ndarray, quality: int = 90):
+    """
+    Writes a render to disk (format taken from the extension: '.jpg' or '.png').
+    """
+    import cv2 as cv
+
+    params = _encode_params(os.path.splitext(file_path)[1], quality)
+    if not cv.imwrite(file_path, image, params):
+        raise OSError(f"🚫 No se pudo guardar la imagen:\n {file_path}")
+
+
+def render_file(dset: str, name: str, dest: str, dir: str = 'in', style: str = 'boxes',
+                ext: str = '.jpg', quality: int = 90, reduce: int = 1) -> str:
+    """
+    Renders the labels of one dataset image into 'dest/{dset}/{name}{ext}'.
+
+    Args:
+        reduce: Decodes the image at 1/reduce resolution (1, 2, 4 or 8) for lighter previews.
+
+    Returns:
+        Path of the render.
+    """
+    from utils import images, tiling
+
+    image_path = file_management.build_filename(dset=dset, type='image', dir=dir, name=name)
+    label_path = file_management.build_filename(dset=dset, type='label', dir=dir, name=name)
+
+    image = images.read_image(image_path, reduce=reduce)
+    labels = tiling.read_labels(label_path) if os.path.exists(label_path) else np.empty(0, dtype=format.LABEL_DTYPE)
+
+    # The decoded image is shared through the cache: the overlay is drawn on a copy
+    output_path = os.path.join(dest, dset, f"{name}{ext}")
+    save_render(output_path, render_labels(image, labels, style=style), quality)
+    return output_path
+
+
+def _init_worker(path: str):
+    """
+    Sets the dataset root used by build_filename inside each worker process.
+    """
+    file_management.PATH = path
+
+
+def _render_chunk(dset: str, names: list[str], dest: str, dir: str, style: str, ext: str, quality: int,
+                  reduce: int) -> list[str]:
+    return [render_file(dset, name, dest, dir, style, ext, quality, reduce) for name in names]
+
+
+def render_split(path: str, dset: str, dest: str, dir: str = 'in', style: str = 'boxes', ext: str = '.jpg',
+                 quality: int = 90, reduce: int = 1, workers: int | None = None, chunk_size: int = 8) -> list[str]:
+    """
+    Renders QA overlays for every image of a split with a pool of processes.
+
+    Args:
+        path: Root of the raw dataset (the PATH used by build_filename).
+        dset: Split ('train', 'valid' or 'test').
+        dest: Output folder (renders go to 'dest/{dset}/').
+        dir: Dataset to render ('in' raw, 'out' processed tiles).
+        style: 'boxes' or 'points'.
+        ext: '.jpg' or '.png'.
+        quality: JPEG quality.
+        reduce: Decodes the images at 1/reduce resolution (1, 2, 4 or 8).
+        workers: Number of processes (default os.cpu_count(); 1 runs in the current process).
+        chunk_size: Images sent to a worker per task.
+
+    Returns:
+        Paths of the renders, sorted like the images.
+    """
+    if style not in STYLES:
+        raise ValueError(f"❕Invalid 'style': must be one of {STYLES}.")
+    _encode_params(ext, quality)
+    if chunk_size < 1:
+        raise ValueError("❕chunk_size must be a positive integer.")
+
+    from utils import pipeline
+
+    _init_worker(path)
+    names = pipeline.list_images(dset, dir)
+
+    os.makedirs(os.path.join(dest, dset), exist_ok=True)
+    chunks = [names[start:start + chunk_size] for start in range(0, len(names), chunk_size)]
+    args = (dest, dir, style, ext, quality, reduce)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        results = [_render_chunk(dset, chunk, *args) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(path,)) as pool:
+            results = list(pool.map(_render_chunk, [dset] * len(chunks), chunks,
+                                    *([arg] * len(chunks) for arg in args)))
+    return [output for chunk in results for output in chunk]
+
+
+def _show(image: np.ndarray):
+    # matplotlib is only needed to display renders in a notebook
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(12, 8))
+    plt.imshow(image)
+    plt.show()
 
 
 def draw_points(image: np.ndarray, df_labels: pd.DataFrame):
@@ -15,22 +269,8 @@ def draw_points(image: np.ndarray, df_labels: pd.DataFrame):
     - image: np.ndarray -> Imagen sobre la que se dibujarán los bounding boxes.
     - df_labels: pd.DataFrame -> DataFrame con columnas ['class_id','x_center', 'y_center', 'width', 'height'].
     """
-    
-    im_points = image.copy()
-    
-    # Dibujar puntos
-    for _, row in df_labels.iterrows():
-        x = row['x_center']
-        y = row['y_center']
-        point = [x, y]
-        
-        # Dibujar los círculos
-        cv.circle(im_points, center=point, radius=7, color=(255, 0, 0), thickness=-1)
-    
-    # Mostrar imagen con puntos
-    fig = plt.figure(figsize=(12, 8))
-    plt.imshow(im_points)
-    plt.show()
+    points = df_labels[['x_center', 'y_center']].to_numpy()
+    _show(render_points(image, points, df_labels['class_id'].to_numpy()))
 
 
 def draw_bb(image: np.ndarray, labels: pd.DataFrame, coord: tuple | list | str=(0, 0, 240, 240)):
@@ -40,11 +280,9 @@ def draw_bb(image: np.ndarray, labels: pd.DataFrame, coord: tuple | list | str=(
     Parámetros:
     - image: np.ndarray -> Imagen sobre la que se dibujarán los bounding boxes.
     - labels: pd.DataFrame -> DataFrame con columnas ['x0', 'y0', 'x1', 'y1', 'class_id'].
-    - coord: tuple | list | str -> Coordenadas del tile en formato (x0, y0, x1, y1).    
+    - coord: tuple | list | str -> Coordenadas del tile en formato (x0, y0, x1, y1).
     """
-    im_points = image.copy()
-
-    # Convertir `coord` a una lista de enteros si es necesario
+    # Convertir `coord` a una lista de enteros si es necesario
     if isinstance(coord, str):
         coord = [int(x) for x in coord.split()]
     elif isinstance(coord, tuple):
@@ -52,37 +290,19 @@ def draw_bb(image: np.ndarray, labels: pd.DataFrame, coord: tuple | list | str=(
     elif not isinstance(coord, list):
         raise ValueError("❗️La variable de coordenadas  debe ser una lista, tupla o string con coordenadas.")
 
-    # Verificar que `coord` tenga 4 valores
+    # Verificar que `coord` tenga 4 valores
     if len(coord) != 4:
         raise ValueError("❗️La variable de coordenadas debe contener exactamente 4 valores (x0, y0, x1, y1).")
 
     # Lleva las coordenadas al origen para que la gráfica sea comparativa
-    #labels['x0', 'y0', 'x1', 'y1'] = to_origin(labels[['x0', 'y0', 'x1', 'y1']], coord[:2])
-    labels[['x0', 'y0', 'x1', 'y1']] = labels[['x0', 'y0', 'x1', 'y1']].astype(int)
-    labels[['x0', 'y0', 'x1', 'y1']] -= coord[:2] * 2
-    
-    # Generar colores únicos para cada class_id
-    unique_classes = labels['class_id'].unique()  # Obtener clases únicas
-    color_map = {cls: tuple(np.random.randint(0, 255, 3).tolist()) for cls in unique_classes}
-    
-    # Dibujar puntos
-    for _, label in labels.iterrows():
-        label.class_id
-        
-        color = color_map[label.class_id]
-        Pi = (label.x0, label.y0)
-        Po = (label.x1, label.y1)
-        
-        # Dibujar los círculos
-        cv.rectangle(im_points, Pi, Po, color=color, thickness=1)
-    
-    # Mostrar imagen con puntos
-    fig = plt.figure(figsize=(12, 8))
-    plt.imshow(im_points)
-    plt.show()
+    labels = format.to_origin(labels, coord[:2])
+    boxes = labels[['x0', 'y0', 'x1', 'y1']].to_numpy()
+    _show(render_boxes(image, boxes, labels['class_id'].to_numpy()))
 
 
 def test_label(tile , box):
+    import matplotlib.pyplot as plt
+
     # Input format: x0 y0 x1 y1
     tile_coords = tile.split()
     box_coords = box.split()
@@ -132,4 +352,28 @@ def test_label(tile , box):
 
     plt.axis('off')
     plt.grid(True, linestyle="--", linewidth=0.5, alpha=0.7)
-    plt.show()
\ No newline at end of file
+    plt.show()
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Renders label overlays of a YOLO dataset for visual QA.")
+    parser.add_argument('path', help="Root of the raw dataset (eg: data/raw/3.5m.v3i.yolov8/)")
+    parser.add_argument('--dest', required=True, help="Output folder for the renders")
+    parser.add_argument('--splits', nargs='+', default=['train', 'valid', 'test'], choices=['train', 'valid', 'test'])
+    parser.add_argument('--dir', default='in', choices=['in', 'out'], help="'out' renders the processed tiles")
+    parser.add_argument('--style', default='boxes', choices=STYLES)
+    parser.add_argument('--ext', default='.jpg', choices=['.jpg', '.png'])
+    parser.add_argument('--quality', type=int, default=90)
+    parser.add_argument('--reduce', type=int, default=1, choices=[1, 2, 4, 8], help="Render at 1/reduce resolution")
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    path = args.path if args.path.endswith('/') else args.path + '/'
+    for dset in args.splits:
+        outputs = render_split(path, dset, args.dest, dir=args.dir, style=args.style, ext=args.ext,
+                               quality=args.quality, reduce=args.reduce, workers=args.workers)
+        print(f"✅ {dset}: {len(outputs)} imágenes renderizadas en {os.path.join(args.dest, dset)}")
+
+
+if __name__ == '__main__':
+    main()